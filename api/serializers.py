@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from seaflow import admission
 from seaflow.models import Dag, Task, Node, Step, Action
 
 class ActionSerializer(serializers.ModelSerializer):
@@ -87,11 +88,16 @@ class TaskSerializer(serializers.ModelSerializer):
     dag = DAGSerializer(read_only=True)
     steps = StepSerializer(many=True, read_only=True)
     components = serializers.SerializerMethodField()
+    queue_position = serializers.SerializerMethodField()
     
     class Meta:
         model = Task
         fields = '__all__'
 
+    def get_queue_position(self, obj):
+        # 排队等待准入的root task的排队位置, 见seaflow.admission
+        return admission.position(obj)
+
     def get_components(self, obj):
         steps = obj.steps.all()
         components = []
@@ -1,3 +1,102 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from seaflow.consts import TaskStates
+from seaflow.models import Dag, Task
+from seaflow.seagull import Seagull
+
+
+@override_settings(SEAFLOW={'ADMISSION_MAX_RUNNING': 1, 'ADMISSION_MAX_QUEUED': 1})
+class TriggerTest(TestCase):
+
+    def setUp(self):
+        # 没有配置celery app, 不投递日志回调
+        patcher = mock.patch.object(Seagull, '_do_callback', autospec=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.dag = Dag.objects.create(name='dag', title='dag', version=1, latest=True)
+        Task.objects.create(name='dag', title='dag', dag=self.dag, state=TaskStates.PROCESSING.name, input={})
+
+    def test_queued(self):
+        r = self.client.post('/api/dags/%s/trigger/' % self.dag.id)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(TaskStates.QUEUED.name, r.data['state'])
+        self.assertEqual(1, r.data['queue_position'])
+
+    def test_too_many_queued(self):
+        self.client.post('/api/dags/%s/trigger/' % self.dag.id)
+        r = self.client.post('/api/dags/%s/trigger/' % self.dag.id)
+        self.assertEqual(429, r.status_code)
+        self.assertIn('Retry-After', r)
+        self.assertEqual(2, Task.objects.count())
+
+
+@override_settings(SEAFLOW={'ADMISSION_MAX_RUNNING': 0, 'BULK_CREATE_BATCH': 2})
+class BulkTriggerTest(TestCase):
+    """
+    开启准入控制且没有容量, 创建的task都在排队, 不投递
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.dag = Dag.objects.create(name='dag', title='dag', version=1, latest=True)
+        self.url = '/api/dags/%s/bulk_trigger/' % self.dag.id
+
+    def post(self, lines):
+        return self.client.generic('POST', self.url, '\n'.join(lines), content_type='application/x-ndjson')
+
+    def test_ndjson(self):
+        r = self.post(['{"name": "a"}', '', '{"name": "b"}', '{"name": "c", "config": {"priority": "high"}}'])
+        self.assertEqual(200, r.status_code)
+        tasks = list(Task.objects.order_by('id'))
+        self.assertEqual([t.id for t in tasks], r.data['task_ids'])
+        self.assertEqual(['a', 'b', 'c'], [t.name for t in tasks])
+        self.assertEqual({TaskStates.QUEUED.name}, {t.state for t in tasks})
+        self.assertEqual({'priority': 'high'}, tasks[2].config)
+
+    def test_list(self):
+        r = self.client.post(self.url, [{'name': 'a'}, {}], format='json')
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(['a', 'dag'], list(Task.objects.filter(pk__in=r.data['task_ids'])
+                                            .order_by('id').values_list('name', flat=True)))
+
+    def test_partial_failure(self):
+        # 第二批中有无效的行, 第一批已创建
+        r = self.post(['{"name": "a"}', '{"name": "b"}', '{"name": "c"}', '{"name": '])
+        self.assertEqual(400, r.status_code)
+        self.assertEqual(list(Task.objects.order_by('id').values_list('id', flat=True)), r.data['task_ids'])
+        self.assertEqual(2, len(r.data['task_ids']))
+
+        r = self.post(['{"name": "d"}', '{"name": "e"}', '{"config": {"priority": "urgent"}}'])
+        self.assertEqual(400, r.status_code)
+        self.assertIn('run 0: unknown priority', r.data['error'])
+        self.assertEqual(2, len(r.data['task_ids']))
+        self.assertEqual(4, Task.objects.count())
+
+    @override_settings(SEAFLOW={'ADMISSION_MAX_RUNNING': 0, 'ADMISSION_MAX_QUEUED': 2, 'BULK_CREATE_BATCH': 2})
+    def test_too_many_queued(self):
+        r = self.post(['{"name": "a"}', '{"name": "b"}', '{"name": "c"}'])
+        self.assertEqual(429, r.status_code)
+        self.assertEqual(list(Task.objects.order_by('id').values_list('id', flat=True)), r.data['task_ids'])
+        self.assertEqual(2, len(r.data['task_ids']))
+
+    def test_id_readback(self):
+        # 不返回自增主键的数据库(MySQL): 按批次号和id__gt查回
+        bulk_create = Task.objects.bulk_create
+
+        def without_pk(objs, **kwargs):
+            bulk_create(objs, **kwargs)
+            # 查回前其他请求创建的task
+            Task.objects.create(name='other', title='other', dag=self.dag, state=TaskStates.QUEUED.name, input={})
+            for o in objs:
+                o.pk = None
+            return objs
+
+        with mock.patch.object(Task.objects, 'bulk_create', side_effect=without_pk):
+            r = self.post(['{"name": "a"}', '{"name": "b"}', '{"name": "c"}'])
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(['a', 'b', 'c'], [Task.objects.get(pk=_id).name for _id in r.data['task_ids']])
+        self.assertEqual(5, Task.objects.count())
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DAGViewSet, TaskViewSet, ActionViewSet
+from .views import DAGViewSet, TaskViewSet, ActionViewSet, ExternalViewSet
 
 router = DefaultRouter()
 router.register(r'dags', DAGViewSet)
 router.register(r'tasks', TaskViewSet)
 router.register(r'actions', ActionViewSet)
+router.register(r'external', ExternalViewSet, basename='external')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -3,9 +3,13 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from seaflow.models import Dag, Task, Action
 from .serializers import DAGSerializer, TaskSerializer, ActionSerializer
+from seaflow import conf
 from seaflow.base import Seaflow
+from seaflow.errors import ResourceNotExist
+from seaflow.utils import AdmissionException, SeaflowException
 from .pagination import StandardResultsSetPagination
 import json
+import time
 
 class ActionViewSet(viewsets.ModelViewSet):
     queryset = Action.objects.all().order_by('-id')
@@ -50,13 +54,42 @@ class DAGViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def trigger(self, request, pk=None):
         dag = self.get_object()
-        # 这里需要集成 Seaflow 的执行逻辑
-        # 假设有一个 run_dag 的方法
-        # from seaflow.engine import run_dag
-        # run_dag(dag)
-        # Seaflow.create_task(dag_id=dag.id)
-        task = Seaflow.create_task(dag_id=dag.id)
-        return Response({'status': 'triggered', 'dag_id': dag.id, 'task_id': task.id})
+        try:
+            task = Seaflow.create_task(dag_id=dag.id)
+        except AdmissionException as e:
+            # 排队的task数达到上限, 由调用方稍后重试
+            return Response({'error': str(e)}, status=429,
+                            headers={'Retry-After': str(conf.get('ADMISSION_SWEEP_INTERVAL'))})
+        task.apply()
+        return Response({'status': 'triggered', 'dag_id': dag.id, 'task_id': task.id,
+                         'state': task.model.state, 'queue_position': Seaflow.queue_position(task.id)})
+
+    @action(detail=True, methods=['post'])
+    def bulk_trigger(self, request, pk=None):
+        """
+        批量触发执行
+        body: NDJSON(Content-Type: application/x-ndjson, 每行一次执行), 或JSON列表
+            {"name": ..., "inputs": {...}, "context": {...}, "config": {...}, "tasks_config": {...}, "steps_config": {...}}
+        按BULK_CREATE_BATCH分批创建, 出错时已创建的批次保留, 在响应的task_ids中返回
+        """
+        dag = self.get_object()
+        if request.content_type.startswith('application/x-ndjson'):
+            # 逐行读取, 不整体加载请求体
+            runs = (json.loads(line) for line in (request.stream or []) if line.strip())
+        elif isinstance(request.data, list):
+            runs = iter(request.data)
+        else:
+            return Response({'error': 'expect NDJSON or a list'}, status=400)
+        task_ids = []
+        try:
+            for ids in Seaflow.create_task_batches(runs, dag_id=dag.id):
+                task_ids += ids
+        except AdmissionException as e:
+            return Response({'error': str(e), 'dag_id': dag.id, 'task_ids': task_ids}, status=429,
+                            headers={'Retry-After': str(conf.get('ADMISSION_SWEEP_INTERVAL'))})
+        except (ValueError, AttributeError, SeaflowException) as e:
+            return Response({'error': str(e), 'dag_id': dag.id, 'task_ids': task_ids}, status=400)
+        return Response({'status': 'triggered', 'dag_id': dag.id, 'task_ids': task_ids})
 
 class TaskViewSet(viewsets.ModelViewSet):
     queryset = Task.objects.all().order_by('-id')
@@ -68,3 +101,65 @@ class TaskViewSet(viewsets.ModelViewSet):
         if self.action == 'list':
             return Task.objects.filter(parent=None).order_by('-id')
         return super().get_queryset()
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """
+        从失败/中断的task最后成功的前沿恢复执行
+        query: in_place(1: 在原task上恢复, 默认克隆出新的task)
+        """
+        task = self.get_object()
+        in_place = request.query_params.get('in_place') in ('1', 'true')
+        try:
+            task = Seaflow.resume_task(task.id, in_place=in_place)
+        except ResourceNotExist as e:
+            return Response({'error': str(e)}, status=404)
+        except AdmissionException as e:
+            # 排队的task数达到上限, 由调用方稍后重试
+            return Response({'error': str(e)}, status=429,
+                            headers={'Retry-After': str(conf.get('ADMISSION_SWEEP_INTERVAL'))})
+        except SeaflowException as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'status': 'resumed', 'task_id': task.id, 'state': task.model.state,
+                         'queue_position': Seaflow.queue_position(task.id)})
+
+class ExternalViewSet(viewsets.ViewSet):
+    """
+    外部step工作队列
+    """
+
+    @action(detail=False, methods=['post'])
+    def claim(self, request):
+        """
+        长轮询领取外部step
+        query: action, limit(1~EXTERNAL_CLAIM_MAX), wait(秒, 没有可领取的step时最多等待的时间)
+        body: {"identity": {"name": ..., "key": ...}}
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 1)), 1), conf.get('EXTERNAL_CLAIM_MAX'))
+            wait = min(float(request.query_params.get('wait', 0)), conf.get('EXTERNAL_CLAIM_MAX_WAIT'))
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=400)
+        identity = request.data.get('identity', {}) if isinstance(request.data, dict) else {}
+        if not isinstance(identity, dict):
+            return Response({'error': 'expect identity to be a dict'}, status=400)
+        deadline = time.time() + wait
+        while True:
+            steps = Seaflow.claim_external_steps(action=request.query_params.get('action'),
+                                                 limit=limit, identity=identity)
+            if steps or time.time() >= deadline:
+                return Response({'steps': steps})
+            time.sleep(min(conf.get('EXTERNAL_CLAIM_POLL_INTERVAL'), max(deadline - time.time(), 0)))
+
+    @action(detail=False, methods=['post'])
+    def complete(self, request):
+        """
+        批量完成外部step
+        body: [{"step_id": 1, "outputs": {...}}, {"step_id": 2, "error": "...", "outputs": {...}}]
+        """
+        if not isinstance(request.data, list):
+            return Response({'error': 'expect a list'}, status=400)
+        if not all(isinstance(item, dict) and 'step_id' in item for item in request.data):
+            return Response({'error': 'expect step_id in each item'}, status=400)
+        results = Seaflow.complete_external_steps(request.data)
+        return Response({'results': results})
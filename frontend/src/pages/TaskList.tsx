@@ -28,6 +28,7 @@ const TaskList: React.FC = () => {
             case 'ERROR': return 'bg-rose-100 text-rose-700 border-rose-200 shadow-rose-100';
             case 'PROCESSING': return 'bg-sky-100 text-sky-700 border-sky-200 shadow-sky-100 animate-pulse';
             case 'PENDING': return 'bg-slate-100 text-slate-600 border-slate-200';
+            case 'QUEUED': return 'bg-amber-100 text-amber-700 border-amber-200';
             default: return 'bg-slate-100 text-slate-600 border-slate-200';
         }
     };
@@ -7,6 +7,43 @@ def set_celery_app(app):
     celery_app = app
     celery_app.autodiscover_tasks(packages=['seaflow'], related_name='tasks')
 
+    from . import conf, routing
+    # 用户配置的task_routes优先
+    routes = celery_app.conf.task_routes or []
+    if not isinstance(routes, (list, tuple)):
+        routes = [routes]
+    celery_app.conf.task_routes = list(routes) + [routing.route_task]
+    celery_app.conf.beat_schedule = dict({
+        'seaflow-sweep-timeouts': {
+            'task': 'seaflow.tasks.sweep_timeouts',
+            'schedule': conf.get('TIMEOUT_SWEEP_INTERVAL'),
+        },
+        'seaflow-sweep-retries': {
+            'task': 'seaflow.tasks.sweep_retries',
+            'schedule': conf.get('RETRY_SWEEP_INTERVAL'),
+        },
+        'seaflow-sweep-orphans': {
+            'task': 'seaflow.tasks.sweep_orphans',
+            'schedule': conf.get('RECOVERY_SWEEP_INTERVAL'),
+        },
+        'seaflow-sweep-limits': {
+            'task': 'seaflow.tasks.sweep_limits',
+            'schedule': conf.get('LIMIT_SWEEP_INTERVAL'),
+        },
+        'seaflow-dispatch-steps': {
+            'task': 'seaflow.tasks.dispatch_steps',
+            'schedule': conf.get('SCHEDULER_SWEEP_INTERVAL'),
+        },
+        'seaflow-admit-tasks': {
+            'task': 'seaflow.tasks.admit_tasks',
+            'schedule': conf.get('ADMISSION_SWEEP_INTERVAL'),
+        },
+        'seaflow-sweep-result-cache': {
+            'task': 'seaflow.tasks.sweep_result_cache',
+            'schedule': conf.get('RESULT_CACHE_SWEEP_INTERVAL'),
+        },
+    }, **(celery_app.conf.beat_schedule or {}))
+
 
 def autodiscover_actions(*args, **kwargs):
     celery_app.autodiscover_tasks(*args, **kwargs)
@@ -0,0 +1,126 @@
+"""
+root task准入控制
+ADMISSION_MAX_RUNNING或ADMISSION_DAG_LIMITS不为空时开启:
+    - 执行中的root task达到上限时, 新apply的root task进入QUEUED状态排队, 不投递到broker
+    - 执行中: PROCESSING/SLEEP/RETRY, 以及已准入尚未开始执行的PENDING
+    - 按dag名称的上限见ADMISSION_DAG_LIMITS, 受dag上限限制的task不阻塞其他dag的task
+    - 排队的task数达到ADMISSION_MAX_QUEUED时拒绝创建新的root task(AdmissionException)
+    - root task结束时按先进先出准入排队的task, celery beat周期性地执行admit_tasks兜底
+    - 恢复执行的root task(见resume)同样需要准入, 排队时标记extra.resuming, 准入后由SeaflowTask.apply恢复执行;
+      in_place恢复的task保留原来的id, 在排队中按原id排序
+"""
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import conf
+from .consts import TaskStates
+from .models import Limiter, Task
+from .resume import resumable_states
+from .utils import AdmissionException, StateException
+
+# 准入控制的互斥锁, 使用Limiter表中的一行
+LOCK_KEY = '$admission'
+
+
+def enabled():
+    return conf.get('ADMISSION_MAX_RUNNING') is not None or bool(conf.get('ADMISSION_DAG_LIMITS'))
+
+
+def _running():
+    return Task.objects.filter(parent=None).filter(
+        Q(state__in=[TaskStates.PROCESSING, TaskStates.SLEEP, TaskStates.RETRY])
+        | Q(state=TaskStates.PENDING, admit_time__isnull=False))
+
+
+def admitted(task):
+    """
+    :param task: models.Task, root task
+    :return:
+    """
+    return not enabled() or task.admit_time is not None
+
+
+def check():
+    """
+    创建root task前检查排队的task数
+    :return:
+    """
+    max_queued = conf.get('ADMISSION_MAX_QUEUED')
+    if not enabled() or max_queued is None:
+        return
+    if Task.objects.filter(parent=None, state=TaskStates.QUEUED).count() >= max_queued:
+        raise AdmissionException('too many queued tasks: %s' % max_queued)
+
+
+def enqueue(task, resuming=False):
+    """
+    root task进入排队, 并按容量准入
+    :param task: models.Task, root task
+    :param resuming: 恢复执行的task, 重新准入
+    :return: bool, task是否已准入
+    """
+    if resuming:
+        if not task.transit(resumable_states(), state=TaskStates.QUEUED, admit_time=None,
+                            extra=dict(task.extra, resuming=True)):
+            raise StateException('task 【%s】 is not resumable' % task.name)
+    else:
+        task.transit([TaskStates.PENDING], state=TaskStates.QUEUED)
+    admitted_ids = drain(exclude=task.id)
+    if task.id in admitted_ids:
+        task.state = TaskStates.PENDING.name
+        task.admit_time = Task.objects.filter(pk=task.id).values_list('admit_time', flat=True).first()
+        return True
+    return False
+
+
+def drain(exclude=None):
+    """
+    按先进先出准入排队的task, 并apply
+    :param exclude: 由调用方apply的task
+    :return: 准入的task id
+    """
+    from .base import SeaflowTask
+
+    if not enabled():
+        return []
+    max_running = conf.get('ADMISSION_MAX_RUNNING')
+    dag_limits = conf.get('ADMISSION_DAG_LIMITS') or {}
+    ids = []
+    with transaction.atomic():
+        Limiter.objects.get_or_create(key=LOCK_KEY)
+        Limiter.objects.select_for_update().filter(key=LOCK_KEY).first()
+        running = _running().count()
+        if max_running is not None and running >= max_running:
+            return []
+        dag_running = dict(_running().filter(dag__name__in=list(dag_limits))
+                           .values_list('dag__name').annotate(n=Count('id'))) if dag_limits else {}
+        queued = Task.objects.filter(parent=None, state=TaskStates.QUEUED).order_by('id') \
+            .values_list('id', 'dag__name')[:conf.get('ADMISSION_BATCH')]
+        for _id, dag_name in queued:
+            if max_running is not None and running >= max_running:
+                break
+            if dag_name in dag_limits and dag_running.get(dag_name, 0) >= dag_limits[dag_name]:
+                continue
+            ids.append(_id)
+            running += 1
+            dag_running[dag_name] = dag_running.get(dag_name, 0) + 1
+        if ids:
+            Task.objects.filter(pk__in=ids, state=TaskStates.QUEUED).update(
+                state=TaskStates.PENDING, admit_time=timezone.now())
+    for _id in ids:
+        if _id != exclude:
+            SeaflowTask.get(_id, profile='control').apply()
+    return ids
+
+
+def position(task):
+    """
+    排队位置, 从1开始
+    :param task: models.Task
+    :return: 不在排队时返回None
+    """
+    if task.state != TaskStates.QUEUED:
+        return None
+    return Task.objects.filter(parent=None, state=TaskStates.QUEUED, id__lt=task.id).count() + 1
@@ -1,20 +1,44 @@
+import datetime
 import functools
+import itertools
 import logging
 import sys
+import time
+import uuid
 from copy import deepcopy
 
 from celery.result import AsyncResult
+from celery.utils import uuid as celery_uuid
 from django.db import transaction, models
 from django.utils import timezone
-from json_logic import jsonLogic
 
-from . import errors
+from . import admission, cache, conf, control, errors, limits, resume, retry, routing, scheduling
 from .consts import ActionTypes, TaskStates, StepStates
-from .models import Action, Dag, Node, Task, Step
-from .params import ParamAdapter, ParamDefinition
-from .seagull import Seagull
+from .context import ContextStore, SeaflowContext
+from .heartbeat import HeartbeatRecorder
+from .iteration import IterCursor
+from .logic import ConditionData, conditions
+from .models import Action, Advance, Dag, Node, Task, Step
+from .params import ParamAdapter, ParamDefinition, output_parsers
+from .seagull import Seagull, preview
 from .utils import *
 
+# 加载model时延迟的列, 被延迟的列在首次访问时按需加载
+TASK_HEAVY_FIELDS = ('logs', 'input', 'output', 'context', 'extra', 'error')
+STEP_HEAVY_FIELDS = ('logs', 'input', 'output', 'extra', 'error')
+LOAD_PROFILES = {
+    # step/task自身只延迟日志
+    'default': {'step': ('logs',), 'task': ('logs',), 'related': TASK_HEAVY_FIELDS},
+    # 执行step: 需要input, 不需要output
+    'dispatch': {'step': ('logs', 'output', 'error'), 'task': ('logs', 'output', 'error'),
+                 'related': TASK_HEAVY_FIELDS},
+    # 完成step/task并推进后继: 需要output/extra, 不需要input
+    'finish': {'step': ('logs', 'input', 'error'), 'task': ('logs', 'input', 'error'),
+               'related': TASK_HEAVY_FIELDS},
+    # 控制(超时/终止/唤醒/重试/恢复): 只需要状态和配置
+    'control': {'step': STEP_HEAVY_FIELDS, 'task': TASK_HEAVY_FIELDS, 'related': TASK_HEAVY_FIELDS},
+}
+
 
 class Seaflow(object):
 
@@ -22,6 +46,35 @@ class Seaflow(object):
     def create_task(cls, *args, **kwargs):
         return SeaflowTask.create(*args, **kwargs)
 
+    @classmethod
+    def create_tasks(cls, runs, dag_id=None, dag_name=None, dag_version=None, apply=True):
+        """
+        批量创建root task, 见create_task_batches
+        :return: task id列表, 与runs的顺序一致
+        """
+        return list(itertools.chain.from_iterable(cls.create_task_batches(
+            runs, dag_id=dag_id, dag_name=dag_name, dag_version=dag_version, apply=apply)))
+
+    @classmethod
+    def create_task_batches(cls, runs, dag_id=None, dag_name=None, dag_version=None, apply=True):
+        """
+        批量创建root task, 按BULK_CREATE_BATCH分批写入和投递, 每写入一批返回一次,
+        出错时调用方已得到之前创建的批次
+        :param runs: 可迭代对象(例如逐行解析的NDJSON), 每项为
+            {'name': ..., 'inputs': ..., 'context': ..., 'config': ..., 'tasks_config': ..., 'steps_config': ...}
+        :param dag_id:
+        :param dag_name:
+        :param dag_version:
+        :param apply: 创建后投递执行
+        :return: 生成器, 每批的task id列表
+        """
+
+        dag = cls.get_dag(dag_id=dag_id, dag_name=dag_name, dag_version=dag_version)
+        input_adapter = ParamAdapter.from_json(dag.input_adapter)
+        runs = iter(runs)
+        while chunk := list(itertools.islice(runs, conf.get('BULK_CREATE_BATCH'))):
+            yield SeaflowTask.create_many(dag, chunk, input_adapter=input_adapter, apply=apply)
+
     @classmethod
     def get_task(cls, task_id):
         return SeaflowTask.get(task_id)
@@ -58,6 +111,8 @@ class Seaflow(object):
                 type=item.get('type', ActionTypes.Default),
                 input_def=item.get('input_def', {}),
                 output_def=item.get('output_def', {}),
+                cache={} if item.get('cache') is True else (item.get('cache') or None),
+                limit=item.get('limit') or None,
             ))
         with transaction.atomic():
             for a in actions:
@@ -288,7 +343,7 @@ class Seaflow(object):
             @functools.wraps(func)
             def __dec(celery_action, step_id):
                 celery_action.func = func
-                SeaflowStep.get(step_id)._execute(celery_action)
+                SeaflowStep.get(step_id, profile='dispatch')._execute(celery_action)
 
             from . import celery_app
             return celery_app.task(bind=True)(__dec)
@@ -303,7 +358,7 @@ class Seaflow(object):
         :return:
         """
 
-        SeaflowTask.get(task_id).sleep()
+        SeaflowTask.get(task_id, profile='control').sleep()
 
     @classmethod
     def awake_task(cls, task_id):
@@ -313,7 +368,7 @@ class Seaflow(object):
         :return:
         """
 
-        SeaflowTask.get(task_id).awake()
+        SeaflowTask.get(task_id, profile='control').awake()
 
     @classmethod
     def revoke_task(cls, task_id):
@@ -323,7 +378,7 @@ class Seaflow(object):
         :return:
         """
 
-        SeaflowTask.get(task_id).revoke()
+        SeaflowTask.get(task_id, profile='control').revoke()
 
     @classmethod
     def terminate_task(cls, task_id):
@@ -333,7 +388,28 @@ class Seaflow(object):
         :return:
         """
 
-        SeaflowTask.get(task_id).terminate()
+        SeaflowTask.get(task_id, profile='control').terminate()
+
+    @classmethod
+    def resume_task(cls, task_id, in_place=False):
+        """
+        从失败/中断的root task最后成功的前沿恢复执行, 见resume
+        :param task_id:
+        :param in_place: 在原task上恢复, 否则克隆出新的task
+        :return: SeaflowTask, 恢复执行的task
+        """
+
+        return SeaflowTask.resume(task_id, in_place=in_place)
+
+    @classmethod
+    def queue_position(cls, task_id):
+        """
+        排队等待准入的root task的排队位置, 见admission
+        :param task_id:
+        :return: 从1开始, 不在排队时返回None
+        """
+
+        return admission.position(Task.objects.only('id', 'state').get(pk=task_id))
 
     @classmethod
     def dispatch_external_step(cls, step_id, identity={}):
@@ -347,6 +423,48 @@ class Seaflow(object):
         """
         return SeaflowStep.get(step_id)._dispatch(identity)
 
+    @classmethod
+    def claim_external_steps(cls, action=None, limit=1, identity={}):
+        """
+        批量领取已发布的外部step, 并发领取时通过SELECT ... FOR UPDATE SKIP LOCKED互不阻塞
+        :param action: action name, 为None时领取所有外部action
+        :param limit: 最多领取的数量
+        :param identity: dict，领取者的身份信息
+                    name:
+                    key:
+        :return: [{'step_id', 'identifier', 'action', 'input'}]
+        """
+        tnow = timezone.now()
+        with transaction.atomic():
+            qs = Step.objects.select_for_update(skip_locked=True, of=('self',)).select_related('node__action') \
+                .defer('logs').filter(state=StepStates.PUBLISH, node__action_type=ActionTypes.External)
+            if action:
+                qs = qs.filter(node__action__name=action)
+            steps = list(qs.order_by('id')[:limit])
+            for s in steps:
+                s.identifier = generate_identifier('%s-%s' % (s.id, identity.get('key')), rand=False)
+                s.start_time = tnow
+                s.update_time = tnow
+                s.state = StepStates.PROCESSING.name
+            Step.objects.bulk_update(steps, ['identifier', 'start_time', 'update_time', 'state'])
+        if not steps:
+            return []
+
+        entries = []
+        for s in steps:
+            entries.append((s.id, 'step subscribed by %s' % identity.get('name')))
+            entries.append((s.id, 'step execution...'))
+        Seagull.persist_many(Step, entries)
+        for s in steps:
+            if s.config.get('callback'):
+                SeaflowStep.get(step=s)._do_callback('STEP_STATE_%s' % StepStates.PROCESSING)
+        return [{
+            'step_id': s.id,
+            'identifier': s.identifier,
+            'action': s.node.action.name,
+            'input': s.input,
+        } for s in steps]
+
     @classmethod
     def finish_external_step(cls, step_id, outputs={}, message=None):
         """
@@ -355,14 +473,14 @@ class Seaflow(object):
         :param outputs:
         :return:
         """
-        step = SeaflowStep.get(step_id)
+        step = SeaflowStep.get(step_id, profile='finish')
         if step.model.node.action_type != ActionTypes.External:
             raise SeaflowException('step is not external')
         try:
             if message:
                 step.seagull.info('%s' % message)
             step.seagull.info('action【%s】 output: %s' % (step.model.node.action.name,
-                                                         json.dumps(outputs, cls=ComplexJSONEncoder)))
+                                                         preview(outputs, 'step#%s.output' % step.model.id, step.model.config)))
             step._finish(step._adapt_outputs(outputs))
         finally:
             step.seagull.flush(True)
@@ -378,13 +496,13 @@ class Seaflow(object):
         """
         if outputs is None:
             outputs = {}
-        step = SeaflowStep.get(step_id)
+        step = SeaflowStep.get(step_id, profile='finish')
         if step.model.node.action_type != ActionTypes.External:
             raise SeaflowException('step is not external')
         try:
             step.seagull.error('receive error: %s' % error)
             step.seagull.info('action【%s】 output: %s' % (step.model.node.action.name,
-                                                         json.dumps(outputs, cls=ComplexJSONEncoder)))
+                                                         preview(outputs, 'step#%s.output' % step.model.id, step.model.config)))
             try:
                 outputs = step._adapt_outputs(outputs)
             except ParamDefinitionException:
@@ -393,6 +511,109 @@ class Seaflow(object):
         finally:
             step.seagull.flush(True)
 
+    @classmethod
+    def complete_external_steps(cls, items):
+        """
+        批量完成/失败外部step
+            - 同一批step通过一次查询加锁加载, 按缓存的输出定义校验输出
+            - 状态修改通过bulk_update一次写入, 日志批量写入并合并
+            - 后续的推进按task分组, 每个task投递一个forward_external_steps异步执行
+        :param items: [{'step_id', 'outputs', 'error', 'message'}], error不为None时视为失败
+        :return: [{'step_id', 'ok', 'error'}]
+        """
+        from .tasks import forward_external_steps
+
+        results = []
+        entries = []
+        finished = {}
+        failed = {}
+        tnow = timezone.now()
+        with transaction.atomic():
+            steps = Step.objects.select_for_update(of=('self',)).select_related('node__action').defer('logs') \
+                .in_bulk([item.get('step_id') for item in items])
+            updated = []
+            for item in items:
+                step_id = item.get('step_id')
+                s = steps.get(step_id)
+                if s is None:
+                    results.append((step_id, 'step not found'))
+                    continue
+                if s.node.action_type != ActionTypes.External:
+                    results.append((step_id, 'step is not external'))
+                    continue
+                if s.state != StepStates.PROCESSING or s in updated:
+                    results.append((step_id, 'step is not processing'))
+                    continue
+
+                error = item.get('error')
+                outputs = item.get('outputs') or {}
+                try:
+                    _outputs, parse_errors = SeaflowStep._parse_outputs(s.node, outputs)
+                except ParamAdaptException as e:
+                    _outputs, parse_errors = {}, {'adapter': str(e)}
+                if parse_errors and error is None:
+                    results.append((step_id, str(ParamDefinitionException(errors=parse_errors))))
+                    continue
+
+                if item.get('message'):
+                    entries.append((s.id, '%s' % item['message'], 'INFO'))
+                if error is not None:
+                    entries.append((s.id, 'receive error: %s' % error, 'ERROR'))
+                entries.append((s.id, 'action【%s】 output: %s' % (s.node.action.name,
+                                                               preview(outputs, 'step#%s.output' % s.id, s.config)), 'INFO'))
+                duration = tnow - s.start_time if s.start_time else None
+                duration = float('%s.%s' % (duration.seconds, duration.microseconds)) if duration else None
+                if error is None:
+                    s.state = StepStates.SUCCESS.name
+                    s.output = _outputs
+                    s.end_time = tnow
+                    s.duration = duration
+                    if s.node.iterable and s.node.iter_config.get('key'):
+                        s.iter_end = IterCursor.from_extra(s.extra).is_end(s.iter_index)
+                    entries.append((s.id, 'output: %s' % preview(_outputs, 'step#%s.output' % s.id, s.config), 'INFO'))
+                    finished.setdefault(s.task_id, []).append(s.id)
+                else:
+                    s.output = {} if parse_errors else _outputs
+                    s.error = 'Type: %s\nValue: %s' % (ExternalActionFailed, error)
+                    if s.retries < s.config.get('max_retries', 0):
+                        s.state = StepStates.RETRY.name
+                        s.end_time = None
+                        s.duration = None
+                    else:
+                        s.state = StepStates.ERROR.name
+                        s.end_time = tnow
+                        s.duration = duration
+                        failed.setdefault(s.task_id, {})[s.id] = error
+                    entries.append((s.id, 'step 【%s】 broken: %s' % (s.node.name, StepStates[s.state].value), 'ERROR'))
+                    if s.state == StepStates.RETRY:
+                        countdown = retry.backoff(s.config, s.retries)
+                        s.retry_at = tnow + datetime.timedelta(seconds=countdown)
+                        s.retries += 1
+                        entries.append((s.id, 'retry in %ss.' % countdown, 'INFO'))
+                s.deadline = None
+                s.update_time = tnow
+                updated.append(s)
+                results.append((step_id, None))
+            Step.objects.bulk_update(updated, ['state', 'output', 'error', 'end_time', 'duration', 'iter_end',
+                                               'retries', 'retry_at', 'deadline', 'update_time'])
+
+        Seagull.persist_many(Step, entries)
+        Seagull.merge_many(Step, [s.id for s in updated if s.state != StepStates.RETRY])
+        for s in updated:
+            if s.config.get('callback'):
+                SeaflowStep.get(step=s)._do_callback('STEP_STATE_%s' % s.state)
+        # 释放并发槽位
+        limited = [s.id for s in updated if s.state != StepStates.RETRY and limits.policy(s.node.action, s.config)]
+        if limited:
+            limits.release(limited)
+        if scheduling.enabled():
+            scheduling.release([s.id for s in updated if s.state != StepStates.RETRY])
+
+        for task_id in set(finished) | set(failed):
+            forward_external_steps.apply_async((task_id, finished.get(task_id, []), failed.get(task_id, {})))
+
+        return [{'step_id': step_id, 'ok': error is None, 'error': error} for step_id, error in results]
+
 
 class SeaflowTask(object):
 
@@ -404,10 +625,11 @@ class SeaflowTask(object):
         self.context = None
         self.seagull = None
         self.config = None
+        self.profile = 'default'
 
         #
-        self.parent = None  # SeaflowTask
-        self.root = None  # SeaflowTask
+        self._parent = None  # SeaflowTask
+        self._root = None  # SeaflowTask
 
     @classmethod
     def create(cls, dag_id=None, dag_name=None, dag_version=None, name=None,
@@ -433,6 +655,8 @@ class SeaflowTask(object):
             else:
                 dag = Dag.objects.get(name=dag_name, latest=True)
         assert not dag.root_id, 'assert to be root dag'
+        admission.check()
+        scheduling.check(config)
         inputs = ParamAdapter.from_json(dag.input_adapter).adapt(inputs or {})
         extra = {'tasks_config': tasks_config or {}, 'steps_config': steps_config or {}}
         t = Task.objects.create(
@@ -454,42 +678,176 @@ class SeaflowTask(object):
         return r
 
     @classmethod
-    def get(cls, task_id=None, task=None):
+    def create_many(cls, dag, runs, input_adapter=None, apply=True):
+        """
+        批量创建同一个dag的root task: 一次bulk_create写入task和创建日志, 共用一个producer投递apply_root_task
+        开启准入控制时直接以QUEUED状态写入, 由admission.drain按容量准入
+        :param dag: models.Dag, root dag
+        :param runs: [{'name': ..., 'inputs': ..., 'context': ..., 'config': ..., 'tasks_config': ..., 'steps_config': ...}]
+        :param input_adapter: dag的输入适配器, 批量调用时预先编译
+        :param apply: 创建后投递执行
+        :return: task id列表
+        """
+        assert not dag.root_id, 'assert to be root dag'
+        admission.check()
+        input_adapter = input_adapter or ParamAdapter.from_json(dag.input_adapter)
+        queued = apply and admission.enabled()
+        bulk_id = uuid.uuid4().hex
+        models_ = []
+        for i, run in enumerate(runs):
+            try:
+                scheduling.check(run.get('config'))
+                inputs = input_adapter.adapt(run.get('inputs') or {})
+            except ParamException as e:
+                raise ParamException('run %s: %s' % (i, e)).with_traceback(e.__traceback__)
+            models_.append(Task(
+                name=run.get('name') or dag.name,
+                title=dag.title,
+                dag=dag,
+                state=TaskStates.QUEUED if queued else TaskStates.PENDING,
+                root=None,
+                parent=None,
+                input=inputs or {},
+                context=run.get('context') or {},
+                config=run.get('config') or {},
+                extra={'tasks_config': run.get('tasks_config') or {},
+                       'steps_config': run.get('steps_config') or {},
+                       'bulk_id': bulk_id},
+            ))
+        if not models_:
+            return []
+        last_id = Task.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        with transaction.atomic():
+            Task.objects.bulk_create(models_, batch_size=conf.get('BULK_CREATE_BATCH'))
+        if models_[0].pk is not None:
+            ids = [t.pk for t in models_]
+        else:
+            # 不支持返回自增主键的数据库(MySQL), 按批次号查回, 同一条INSERT内的自增主键递增
+            ids = list(Task.objects.filter(id__gt=last_id, parent=None, dag=dag, extra__bulk_id=bulk_id)
+                       .order_by('id').values_list('id', flat=True))
+        Seagull.persist_many(Task, [(_id, 'task 【%s】 created: %s' % (t.name, _id)) for _id, t in zip(ids, models_)])
+
+        if queued:
+            admission.drain()
+        elif apply:
+            from . import celery_app, tasks
+            with celery_app.producer_or_acquire() as producer:
+                for _id in ids:
+                    tasks.apply_root_task.apply_async((_id,), producer=producer)
+        return ids
+
+    @classmethod
+    def get(cls, task_id=None, task=None, profile='default'):
         """
         :param task_id:
         :param task:
+        :param profile: 加载的列, 见LOAD_PROFILES
         :return: SeaflowTask
         """
-        m = task or Task.objects.select_related('dag', 'parent', 'root').defer('logs').filter(pk=task_id).first()
+        m = task or Task.objects.select_related('dag').defer(*LOAD_PROFILES[profile]['task']) \
+            .filter(pk=task_id).first()
         if not m:
             raise errors.ResourceNotExist(f'ID为{task_id}的Task不存在')
         r = cls()
         r.model = m
+        r.profile = profile
         r.load()
         return r
 
+    @classmethod
+    def get_many(cls, task_ids, profile='default'):
+        """
+        一次查询加载多个task
+        :param task_ids:
+        :param profile: 加载的列, 见LOAD_PROFILES
+        :return: [SeaflowTask], 按id排序, 不存在的task被忽略
+        """
+        return [cls.get(task=m, profile=profile) for m in Task.objects.select_related('dag')
+                .defer(*LOAD_PROFILES[profile]['task']).filter(pk__in=list(task_ids)).order_by('id')]
+
+    @classmethod
+    def _related(cls, model, field, profile):
+        """
+        关联的task: 已通过select_related加载时直接使用, 否则按profile延迟大字段后加载
+        :param model: models.Task/models.Step
+        :param field: parent/task/root
+        :param profile:
+        :return: SeaflowTask
+        """
+        if not getattr(model, field + '_id'):
+            return None
+        if not model._meta.get_field(field).is_cached(model):
+            setattr(model, field, Task.objects.select_related('dag').defer(*LOAD_PROFILES[profile]['related'])
+                    .get(pk=getattr(model, field + '_id')))
+        return cls.get(task=getattr(model, field), profile=profile)
+
+    @property
+    def parent(self):
+        if self._parent is None:
+            self._parent = self._related(self.model, 'parent', self.profile)
+        return self._parent
+
+    @property
+    def root(self):
+        if self._root is None:
+            self._root = self._related(self.model, 'root', self.profile)
+        return self._root
+
     def load(self):
         self.id = self.model.id
         self.name = self.model.name
-        self.context = (self.model.root or self.model).context
+        self.context = SeaflowContext(task_id=self.model.root_id or self.model.id)
         self.seagull = Seagull.instance(self.model, level=logging.INFO)
         self.config = self.model.config
-
-        if self.model.parent:
-            self.parent = self.__class__.get(task=self.model.parent)
-        if self.model.root:
-            self.root = self.__class__.get(task=self.model.root)
+        # parent/root在首次访问时加载
+        self._parent = None
+        self._root = None
 
     def reload(self):
         self.model.refresh_from_db()
         self.load()
 
     def apply(self, sync=False, countdown=None):
+        if not self.model.parent_id and not admission.admitted(self.model):
+            # 准入控制: 超出容量时排队, 由admission.drain在容量释放后apply
+            if not admission.enqueue(self.model):
+                self.seagull.info('task 【%s】 queued: %s' % (self.name, admission.position(self.model)))
+                self.seagull.flush(True)
+                return
+        resuming = self.model.extra.get('resuming')
         if sync:
-            self._apply()
+            self._resume() if resuming else self._apply()
         else:
             from . import tasks
-            tasks.apply_root_task.apply_async((self.id,), countdown=countdown)
+            (tasks.resume_root_task if resuming else tasks.apply_root_task).apply_async((self.id,),
+                                                                                       countdown=countdown)
+
+    @classmethod
+    def resume(cls, task_id, in_place=False, sync=False):
+        """
+        :param task_id: 失败/中断的root task
+        :param in_place: 在原task上恢复, 否则克隆出新的task
+        :param sync:
+        :return: SeaflowTask, 恢复执行的task
+        """
+        t = cls.get(task_id, profile='control')
+        resume.check(t.model)
+        admission.check()
+        if not in_place:
+            t = cls.get(task=resume.clone(t.model), profile='control')
+            t.seagull.info('task 【%s】 cloned from %s: %s' % (t.name, task_id, t.id))
+            t.seagull.flush(True)
+        if admission.enabled() and not admission.enqueue(t.model, resuming=True):
+            # 准入控制: 与apply相同, 超出容量时排队, 由admission.drain在容量释放后apply
+            t.seagull.info('task 【%s】 queued: %s' % (t.name, admission.position(t.model)))
+            t.seagull.flush(True)
+            return t
+        if sync:
+            t._resume()
+        else:
+            from . import tasks
+            tasks.resume_root_task.apply_async((t.id,))
+        return t
 
     def revoke(self, sync=False):
         """
@@ -524,7 +882,12 @@ class SeaflowTask(object):
 
     def _apply(self):
         try:
-            self.model.update(start_time=timezone.now(), state=StepStates.PROCESSING)
+            tnow = timezone.now()
+            deadline = None
+            if tm := self.config.get('timeout'):
+                # 由sweeper在deadline到期后触发, 见timeouts.sweep_tasks
+                deadline = tnow + datetime.timedelta(seconds=tm)
+            self.model.update(start_time=tnow, state=StepStates.PROCESSING, deadline=deadline)
             self._do_callback('TASK_STATE_%s' % TaskStates.PROCESSING)
             self.seagull.info('task 【%s】 started: %s' % (self.name, self.id))
 
@@ -544,76 +907,39 @@ class SeaflowTask(object):
             self.seagull.flush(True)
             self._break_off(e)
 
+    # control中的批量UPDATE带有状态条件, 且只沿状态满足条件的task展开, 无需预先reload检查状态
     def _revoke(self):
         """
         :return:
         """
-        self.reload()
-        if self.model.state not in TaskStates.revocable_states():
-            return
-        tnow = timezone.now()
-        duration = 0
-        if self.model.start_time:
-            duration = tnow - self.model.start_time
-            duration = float('%s.%s' % (duration.seconds, duration.microseconds))
-        self.model.update(
-            state=TaskStates.REVOKE,
-            end_time=tnow,
-            duration=duration
-        )
-        self._do_callback('TASK_STATE_%s' % TaskStates.REVOKE)
-        for t in self.model.children.filter(state__in=TaskStates.revocable_states()):
-            self.__class__.get(task=t)._revoke()
+        control.revoke(self.model)
+        admission.drain()
 
     def _terminate(self):
         """
         :return:
         """
-        self.reload()
-        if self.model.state not in TaskStates.terminable_states():
-            return
-        tnow = timezone.now()
-        duration = 0
-        if self.model.start_time:
-            duration = tnow - self.model.start_time
-            duration = float('%s.%s' % (duration.seconds, duration.microseconds))
-        self.seagull.flush(True, merge=True)
-        self.model.update(
-            state=TaskStates.TERMINATE,
-            end_time=timezone.now(),
-            duration=duration
-        )
-        self._do_callback('TASK_STATE_%s' % TaskStates.TERMINATE)
-        for t in self.model.children.filter(state__in=TaskStates.terminable_states()):
-            self.__class__.get(task=t)._terminate()
-        for s in self.model.steps.filter(state__in=StepStates.terminable_states()):
-            SeaflowStep.get(step=s)._terminate()
+        self.seagull.flush(True)
+        control.terminate(self.model)
+        admission.drain()
 
     def _sleep(self):
-        self.reload()
-        if self.model.state not in TaskStates.sleepable_states():
-            return
-
-        self.model.update(state=TaskStates.SLEEP)
-        self._do_callback('TASK_STATE_%s' % TaskStates.SLEEP)
-        for t in self.model.children.filter(state__in=TaskStates.sleepable_states()):
-            self.__class__.get(task=t)._sleep()
+        control.sleep(self.model)
 
     def _awake(self):
         """
         :return:
         """
+        control.awake(self.model)
 
-        self.reload()
-        if self.model.state != TaskStates.SLEEP:
+    def _trigger_timeout(self):
+        if self.ended():
             return
-
-        self.model.update(state=TaskStates.PROCESSING)
-        self._do_callback('TASK_STATE_%s' % TaskStates.PROCESSING)
-        for t in self.model.children.filter(state=TaskStates.SLEEP):
-            self.__class__.get(task=t)._awake()
-        for s in self.model.steps.prefetch_related('node').filter(state=TaskStates.SLEEP):
-            SeaflowStep.get(step=s)._awake()
+        self.seagull.error('Task execution exceeds %s seconds' % self.config.get('timeout'))
+        self.seagull.flush(True)
+        # 先终止未结束的子task和step, 再将task修改为超时
+        control.terminate(self.model, descendants_only=True)
+        self._break_off(TimeoutException('Task execution exceeds %s seconds' % self.config.get('timeout')))
 
     def _apply_dag(self, dag):
         """
@@ -638,16 +964,17 @@ class SeaflowTask(object):
             # inputs
             inputs = merge_outputs(merge_outputs_of_tasks(previous_tasks), merge_outputs_of_steps(previous_steps))
 
+        task_config = self._generate_task_config(dag)
         self.seagull.info('dag 【%s】 raw input: %s'
-                          % (dag.name, json.dumps(inputs, ensure_ascii=False)))
+                          % (dag.name, preview(inputs, config=task_config)))
         input_adapter = ParamAdapter.from_json(dag.input_adapter)
 
         def _apply(_inputs,
                    _fissionable=False, _fission_index=0, _fission_count=1,
-                   _iterable=False, _iter_index=0, _iter_context=None):
+                   _iterable=False, _iter_index=0, _iter_cursor=None):
 
             extra = {}
-            if _iter_context: extra['iter_context'] = _iter_context
+            if _iter_cursor: extra.update(_iter_cursor.to_extra())
             t, created = Task.objects.get_or_create(
                 defaults=dict(
                     name=dag.name,
@@ -656,9 +983,9 @@ class SeaflowTask(object):
                     fission_count=_fission_count,
                     iter_end=False if _iterable else None,
                     input=_inputs,
-                    config=self._generate_task_config(dag),
+                    config=task_config,
                     start_time=timezone.now(),
-                    root=self.model.root or self.model,
+                    root=self.root.model if self.root else self.model,
                     extra=extra
                 ),
                 dag=dag,
@@ -698,41 +1025,41 @@ class SeaflowTask(object):
                 if dag.iterable:
                     ii, iter_key, iter_sequence = iter_inputs(ii, dag.iter_config['key'])
                     iter_index = 0
-                    iter_context = {
-                        'key': iter_key,
-                        'sequence': iter_sequence
-                    }
+                    iter_cursor = IterCursor.create(self.model, dag, i, iter_key, iter_sequence, inputs=ii)
                     self.seagull.info('dag 【%s】 fission-%s start iter-%s'
                                       % (dag.name, i, iter_index))
                 else:
                     iter_index = 0
-                    iter_context = None
+                    iter_cursor = None
                 ii = input_adapter.adapt(ii)
                 self.seagull.info(
                     'dag 【%s】 fission-%s%s input: %s'
                     % (dag.name, i,
                        ' iter-%s' % iter_index if dag.iterable else '',
-                       json.dumps(ii, ensure_ascii=False)))
-                _apply(ii, True, i, fission_count, dag.iterable, iter_index, iter_context)
+                       preview(ii, 'the input of task', task_config)))
+                _apply(ii, True, i, fission_count, dag.iterable, iter_index, iter_cursor)
+                if iter_cursor and iter_cursor.windowed:
+                    # 并行迭代, 补足窗口
+                    self._advance_iter_dag(dag, i, iter_cursor)
         else:
             if dag.iterable:
                 inputs, iter_key, iter_sequence = iter_inputs(inputs, dag.iter_config['key'])
                 iter_index = 0
-                iter_context = {
-                    'key': iter_key,
-                    'sequence': iter_sequence
-                }
+                iter_cursor = IterCursor.create(self.model, dag, 0, iter_key, iter_sequence, inputs=inputs)
                 self.seagull.info('dag 【%s】 start iter-%s'
                                   % (dag.name, iter_index))
             else:
                 iter_index = 0
-                iter_context = None
+                iter_cursor = None
             inputs = input_adapter.adapt(inputs)
             self.seagull.info('dag 【%s】%s input: %s'
                               % (dag.name,
                                  ' iter-%s' % iter_index if dag.iterable else '',
-                                 json.dumps(inputs, ensure_ascii=False)))
-            _apply(inputs, False, 0, 1, dag.iterable, iter_index, iter_context)
+                                 preview(inputs, 'the input of task', task_config)))
+            _apply(inputs, False, 0, 1, dag.iterable, iter_index, iter_cursor)
+            if iter_cursor and iter_cursor.windowed:
+                # 并行迭代, 补足窗口
+                self._advance_iter_dag(dag, 0, iter_cursor)
 
         self.seagull.flush(True)
 
@@ -763,17 +1090,18 @@ class SeaflowTask(object):
             # inputs
             inputs = merge_outputs(merge_outputs_of_tasks(previous_tasks), merge_outputs_of_steps(previous_steps))
 
-        self.seagull.info('node 【%s】 raw input: %s' % (node.name, json.dumps(inputs, ensure_ascii=False)))
+        step_config = self._generate_step_config(node)
+        self.seagull.info('node 【%s】 raw input: %s' % (node.name, preview(inputs, config=step_config)))
         input_adapter = ParamAdapter.from_json(node.input_adapter)
         input_def = ParamDefinition.from_json(node.action.input_def)
 
         def _apply(_inputs,
                    _fissionable=False, _fission_index=0, _fission_count=1,
-                   _iterable=False, _iter_index=0, _iter_context=None,
+                   _iterable=False, _iter_index=0, _iter_cursor=None,
                    _loop_index=0, _loop_context=None):
 
             extra = {}
-            if _iter_context is not None: extra['iter_context'] = _iter_context
+            if _iter_cursor is not None: extra.update(_iter_cursor.to_extra())
             if _loop_context is not None: extra['loop_context'] = _loop_context
 
             s, created = Step.objects.get_or_create(
@@ -782,10 +1110,10 @@ class SeaflowTask(object):
                     fission_count=_fission_count,
                     iter_end=False if _iterable else None,
                     input=_inputs,
-                    config=self._generate_step_config(node),
+                    config=step_config,
                     name=node.name,
                     title=node.title,
-                    root=self.model.root or self.model,
+                    root=self.root.model if self.root else self.model,
                     extra=extra
                 ),
                 node=node,
@@ -826,15 +1154,12 @@ class SeaflowTask(object):
                 if node.iterable:
                     ii, iter_key, iter_sequence = iter_inputs(ii, node.iter_config['key'])
                     iter_index = 0
-                    iter_context = {
-                        'key': iter_key,
-                        'sequence': iter_sequence
-                    }
+                    iter_cursor = IterCursor.create(self.model, node, i, iter_key, iter_sequence, inputs=ii)
                     self.seagull.info('node 【%s】 fission-%s start iter-%s'
                                       % (node.name, i, iter_index))
                 else:
                     iter_index = 0
-                    iter_context = None
+                    iter_cursor = None
                 # adapt
                 if not (node.action_type == ActionTypes.Carrier and not input_adapter):
                     # carrier特殊处理
@@ -857,19 +1182,19 @@ class SeaflowTask(object):
                     'node 【%s】 fission-%s%s input: %s'
                     % (node.name, i,
                        ' iter-%s' % iter_index if node.iterable else '',
-                       json.dumps(ii, ensure_ascii=False)))
-                _apply(ii, node.fissionable, i, fission_count, node.iterable, iter_index, iter_context)
+                       preview(ii, 'the input of step', step_config)))
+                _apply(ii, node.fissionable, i, fission_count, node.iterable, iter_index, iter_cursor)
+                if iter_cursor and iter_cursor.windowed:
+                    # 并行迭代, 补足窗口
+                    self._advance_iter_node(node, i, iter_cursor)
         else:
             iter_index = 0
-            iter_context = None
+            iter_cursor = None
             loop_index = 0
             loop_context = None
             if node.iterable:
                 inputs, iter_key, iter_sequence = iter_inputs(inputs, node.iter_config['key'])
-                iter_context = {
-                    'key': iter_key,
-                    'sequence': iter_sequence
-                }
+                iter_cursor = IterCursor.create(self.model, node, 0, iter_key, iter_sequence, inputs=inputs)
                 self.seagull.info('node 【%s】 start iter-%s' % (node.name, iter_index))
             if node.loopable:
                 loop_context = dict()
@@ -897,17 +1222,15 @@ class SeaflowTask(object):
             self.seagull.info('node 【%s】%s input: %s'
                               % (node.name,
                                  ' iter-%s' % iter_index if node.iterable else '',
-                                 json.dumps(inputs, ensure_ascii=False)))
-            _apply(inputs, node.fissionable, 0, 1, node.iterable, iter_index, iter_context, loop_index, loop_context)
+                                 preview(inputs, 'the input of step', step_config)))
+            _apply(inputs, node.fissionable, 0, 1, node.iterable, iter_index, iter_cursor, loop_index, loop_context)
+            if iter_cursor and iter_cursor.windowed:
+                # 并行迭代, 补足窗口
+                self._advance_iter_node(node, 0, iter_cursor)
         self.seagull.flush(True)
 
     def _break_off(self, e=None, outputs={}):
-        self.reload()
-        if self.model.state not in [TaskStates.PENDING, TaskStates.PROCESSING, TaskStates.RETRY]:
-            return
-
         if e:
-            error = self.seagull.trace_error(e)
             if self.model.retries < self.model.config.get('max_retries', 0) and not isinstance(e, RevokeException):
                 state = TaskStates.RETRY
             elif isinstance(e, TimeoutException):
@@ -917,35 +1240,197 @@ class SeaflowTask(object):
             else:
                 state = TaskStates.ERROR
         else:
-            self.seagull.info('output: %s' % json.dumps(outputs, cls=ComplexJSONEncoder))
-            error = ""
             if self.model.retries < self.model.config.get('max_retries', 0):
                 state = TaskStates.RETRY
             else:
                 state = TaskStates.ERROR
 
-        self.seagull.error('task 【%s】 broken: %s' % (self.model.name, state.value))
+        end_time = timezone.now()
+        retry_at = None
         if state == TaskStates.RETRY:
-            self.seagull.info('retry in %ss.' % self.model.dag.retry_countdown)
+            countdown = retry.backoff(self.config, self.model.retries)
+            retry_at = end_time + datetime.timedelta(seconds=countdown)
+        duration = (end_time - self.model.start_time) if self.model.start_time else None
+        # 已在等待重试的task不再重复计入, 例如并发失败的多个子task
+        if not self.model.transit(
+                [TaskStates.PENDING, TaskStates.PROCESSING],
+                state=state,
+                retries=self.model.retries + 1 if state == TaskStates.RETRY else self.model.retries,
+                end_time=end_time,
+                duration=float('%s.%s' % (duration.seconds, duration.microseconds)) if duration else None,
+                error=self.seagull.format_error(e) if e else '',
+                output=outputs or {},
+                deadline=None,
+                retry_at=retry_at
+        ):
+            return
 
+        if e:
+            self.seagull.trace_error(e)
+        else:
+            self.seagull.info('output: %s' % preview(outputs, 'task#%s.output' % self.model.id, self.config))
+        self.seagull.error('task 【%s】 broken: %s' % (self.model.name, state.value))
+        if state == TaskStates.RETRY:
+            self.seagull.info('retry in %ss.' % countdown)
         self.seagull.flush(True, merge=True)
-        end_time = timezone.now()
-        duration = end_time - self.model.start_time
-        self.model.update(
-            state=state,
-            end_time=end_time,
-            duration=float('%s.%s' % (duration.seconds, duration.microseconds)),
-            error=error,
-            output=outputs or {}
-        )
         self._do_callback('TASK_STATE_%s' % self.model.state)
-        # propagate
-        if self.parent:
-            self.parent._break_off(e, outputs=outputs)
+        # 等待重试时不向上传播, 由sweeper在retry_at到期后重试, 见retry.sweep_tasks
+        if state != TaskStates.RETRY:
+            if self.parent:
+                self.parent._break_off(e, outputs=outputs)
+            else:
+                admission.drain()
+
+    def _retry(self):
+        """
+        重试: 只重新执行失败的分支, 即失败/中断的子task和step
+        :return:
+        """
+        deadline = None
+        if tm := self.config.get('timeout'):
+            # _break_off已清空deadline, 重试时重新计时
+            deadline = timezone.now() + datetime.timedelta(seconds=tm)
+        if not self.model.transit([TaskStates.RETRY], state=TaskStates.PROCESSING, end_time=None, duration=None,
+                                  error='', deadline=deadline):
+            return
+        try:
+            self.seagull.info('task 【%s】 retry-%s started' % (self.name, self.model.retries))
+            self._do_callback('TASK_STATE_%s' % TaskStates.PROCESSING)
+
+            failed_tasks = list(self.model.children.filter(
+                state__in=TaskStates.fail_states() + TaskStates.interrupt_states()))
+            failed_steps = list(self.model.steps.select_related('node', 'node__action').filter(
+                state__in=StepStates.error_states() + StepStates.interrupt_states()))
+            if not failed_tasks and not failed_steps:
+                # 没有失败的分支, 例如在apply阶段或调度后继时失败, 从尚未开始的前沿继续
+                nodes, dags = self._frontier()
+                self.seagull.info('retry: apply %s nodes, %s dags' % (len(nodes), len(dags)))
+                self.seagull.flush(True)
+                for n in nodes:
+                    self._apply_node(n)
+                for d in dags:
+                    self._apply_dag(d)
+                if not (nodes or dags):
+                    # 所有分支都已成功, 例如在完成阶段失败
+                    finished, outputs = self._is_finished()
+                    if not finished:
+                        raise SeaflowException('task 【%s】 has nothing to retry' % self.name)
+                    self._finish(outputs)
+                return
+
+            if failed_tasks:
+                Task.objects.filter(pk__in=[t.id for t in failed_tasks]).update(state=TaskStates.RETRY)
+            if failed_steps:
+                Step.objects.filter(pk__in=[s.id for s in failed_steps]).update(
+                    state=StepStates.RETRY, end_time=None, duration=None, error='')
+            self.seagull.info('retry %s tasks, %s steps' % (len(failed_tasks), len(failed_steps)))
+            self.seagull.flush(True)
+            for t in failed_tasks:
+                self.__class__.get(task=t)._retry()
+            for s in failed_steps:
+                # 失败时已释放槽位, 与新的step一样经过并发/速率限制和调度器派发
+                SeaflowStep.get(step=s)._apply()
+        except Exception as e:
+            self.seagull.flush(True)
+            self._break_off(e)
+
+    def _resume(self):
+        """
+        恢复执行: 复用已成功的子task和step, 只重新执行失败/中断的分支, 以及前驱都已完成但尚未开始的node/dag
+        :return:
+        """
+        deadline = None
+        if tm := self.config.get('timeout'):
+            deadline = timezone.now() + datetime.timedelta(seconds=tm)
+        from_states, extra = resume.resumable_states(), self.model.extra
+        if extra.get('resuming'):
+            # 经过准入控制的task, 见admission.enqueue
+            from_states = from_states + [TaskStates.PENDING]
+            extra = {k: v for k, v in extra.items() if k != 'resuming'}
+        if not self.model.transit(from_states, state=TaskStates.PROCESSING, retries=0, end_time=None,
+                                  duration=None, error='', retry_at=None, deadline=deadline, extra=extra):
+            return
+        try:
+            self.seagull.info('task 【%s】 resumed' % self.name)
+            self._do_callback('TASK_STATE_%s' % TaskStates.PROCESSING)
+
+            failed_tasks = list(self.model.children.select_related('dag').filter(state__in=resume.resumable_states()))
+            failed_steps = list(self.model.steps.select_related('node', 'node__action').filter(
+                state__in=StepStates.error_states() + StepStates.interrupt_states()))
+            nodes, dags = self._frontier()
+            # 重新执行的node/dag需要重新调度后继
+            Advance.objects.filter(task=self.model, ref_type='NODE',
+                                   ref_id__in={s.node_id for s in failed_steps}).delete()
+            Advance.objects.filter(task=self.model, ref_type='DAG',
+                                   ref_id__in={t.dag_id for t in failed_tasks}).delete()
+            if failed_steps:
+                Step.objects.filter(pk__in=[s.id for s in failed_steps]).update(
+                    state=StepStates.RETRY, retries=0, end_time=None, duration=None, error='', retry_at=None,
+                    deadline=None)
+            self.seagull.info('resume %s tasks, %s steps, apply %s nodes, %s dags'
+                              % (len(failed_tasks), len(failed_steps), len(nodes), len(dags)))
+            self.seagull.flush(True)
+            for t in failed_tasks:
+                self.__class__.get(task=t)._resume()
+            for s in failed_steps:
+                # 与_retry相同, 经过并发/速率限制和调度器派发
+                SeaflowStep.get(step=s)._apply()
+            for n in nodes:
+                self._apply_node(n)
+            for d in dags:
+                self._apply_dag(d)
+            if not (failed_tasks or failed_steps or nodes or dags):
+                # 所有分支都已成功, 例如在完成阶段失败
+                finished, outputs = self._is_finished()
+                if not finished:
+                    raise SeaflowException('task 【%s】 has nothing to resume' % self.name)
+                self._finish(outputs)
+        except Exception as e:
+            self.seagull.flush(True)
+            self._break_off(e)
+
+    def _frontier(self):
+        """
+        尚未开始的前沿: 没有任何step/子task, 且前驱都已完成的node/dag
+        :return: (nodes, dags)
+        """
+        started_nodes = set(self.model.steps.values_list('node_id', flat=True))
+        started_dags = set(self.model.children.values_list('dag_id', flat=True))
+        nodes = [n for n in self.model.dag.nodes.all()
+                 if n.id not in started_nodes and self._ready_to_execute_node(n)]
+        dags = [d for d in self.model.dag.children.all()
+                if d.id not in started_dags and self._ready_to_execute_dag(d)]
+        return nodes, dags
+
+    def _forward_steps(self, step_ids, errors={}):
+        """
+        推进批量完成的外部step, 见Seaflow.complete_external_steps
+        :param step_ids: 已完成的step
+        :param errors: {step_id: error}, 已失败且不再重试的step
+        :return:
+        """
+        steps = [SeaflowStep.get(_id, profile='finish') for _id in step_ids]
+        # 同一批完成的fission兄弟只需由最后一个推进
+        last = {s.model.node_id: s.id for s in steps if s.model.node.fissionable and not s.model.node.iterable}
+        for s in steps:
+            if last.get(s.model.node_id, s.id) == s.id:
+                s._forward()
+        for _id, error in errors.items():
+            s = SeaflowStep.get(int(_id), profile='finish')
+            self._break_off(ExternalActionFailed(error), outputs=s.model.output)
 
     def _finish(self, outputs={}):
-        self.reload()
-        if self.model.state != TaskStates.PROCESSING:
+        end_time = timezone.now()
+        duration = end_time - self.model.start_time
+        if not self.model.transit(
+                [TaskStates.PROCESSING],
+                output=outputs,
+                state=TaskStates.SUCCESS,
+                end_time=end_time,
+                duration=float('%s.%s' % (duration.seconds, duration.microseconds)),
+                iter_end=self._is_iter_end(),
+                deadline=None
+        ):
             return
 
         self.seagull.info('task 【%s】%s%s finished: %s'
@@ -953,24 +1438,22 @@ class SeaflowTask(object):
                              ' fission-%s' % self.model.fission_index if self.model.dag.fissionable else '',
                              ' iter-%s' % self.model.iter_index if self.model.dag.iterable else '',
                              TaskStates.SUCCESS.value))
-        self.seagull.info('output: %s' % json.dumps(outputs, cls=ComplexJSONEncoder))
-
-        end_time = timezone.now()
-        duration = end_time - self.model.start_time
-
+        self.seagull.info('output: %s' % preview(outputs, 'task#%s.output' % self.model.id, self.config))
         self.seagull.flush(True, merge=True)
-        self.model.update(
-            output=outputs,
-            state=TaskStates.SUCCESS,
-            end_time=end_time,
-            duration=float('%s.%s' % (duration.seconds, duration.microseconds)),
-            iter_end=self._is_iter_end()
-        )
         self._do_callback('TASK_STATE_%s' % TaskStates.SUCCESS)
 
         if self.parent:
             # 路在何方
-            self._forward()
+            self._advance()
+        else:
+            admission.drain()
+
+    def _advance(self):
+        """
+        后继的调度交给advance队列上的引擎worker异步执行, 见tasks.advance_task
+        """
+        from .tasks import advance_task
+        advance_task.apply_async((self.id,))
 
     def _forward(self):
         try:
@@ -982,6 +1465,11 @@ class SeaflowTask(object):
                                         ))
             if self.model.dag.iterable:
                 if not self.model.iter_end:
+                    iter_cursor = IterCursor.from_extra(self.model.extra)
+                    if iter_cursor.windowed:
+                        # 并行迭代, 窗口前进
+                        self.parent._advance_iter_dag(self.model.dag, self.model.fission_index, iter_cursor)
+                        return
                     # 继续iter
                     self.parent.seagull.info('dag 【%s】%s forward to iter-%s' % (self.model.dag.name,
                                                                                 ' fission-%s' % self.model.fission_index
@@ -993,15 +1481,21 @@ class SeaflowTask(object):
             # 是否是fission
             if self.model.dag.fissionable:
                 # 判断兄弟们是否完成
-                siblings = Task.objects.filter(parent=self.model.parent, dag=self.model.dag).exclude(iter_end=False)
+                siblings = Task.objects.filter(parent_id=self.model.parent_id, dag=self.model.dag).exclude(iter_end=False)
                 if len([s for s in siblings if s.state == TaskStates.SUCCESS]) != self.model.fission_count:
                     self.parent.seagull.flush(True)
                     return
                 self.parent.seagull.info('dag 【%s】 all fissions finished' % self.model.name)
                 outputs = merge_fission_outputs(*[s.output for s in siblings])
 
+            ref = 'the outputs of fission tasks' if self.model.dag.fissionable else 'task#%s.output' % self.model.id
             self.parent.seagull.info(
-                'dag 【%s】 output: %s' % (self.model.dag.name, json.dumps(outputs, ensure_ascii=True)))
+                'dag 【%s】 output: %s' % (self.model.dag.name, preview(outputs, ref, self.config)))
+
+            _, created = Advance.objects.get_or_create(task_id=self.parent.id, ref_type='DAG', ref_id=self.model.dag_id)
+            if not created:
+                self.parent.seagull.info('dag 【%s】 already advanced' % self.model.dag.name)
+                return
 
             # 有没有后继dag和node
             next_dags, next_nodes = self.model.dag.next_dags.all(), self.model.dag.next_nodes.all()
@@ -1029,18 +1523,28 @@ class SeaflowTask(object):
         :param dag:
         :return:
         """
-        # previous_task
-        previous_task = Task.objects.get(parent=self.model, dag=dag, fission_index=fission_index,
-                                         iter_index=iter_index - 1,
-                                         state=TaskStates.SUCCESS)
+        if IterCursor.parallelism_of(dag) > 1:
+            # 并行迭代: 以首个迭代为模板, 输入互不依赖
+            head_task = Task.objects.get(parent=self.model, dag=dag, fission_index=fission_index, iter_index=0)
+            iter_cursor = IterCursor.from_extra(head_task.extra)
+            inputs = iter_cursor.inputs(iter_index)
+            fission_count = head_task.fission_count
+            previous_tasks, previous_steps = head_task.previous_tasks.all(), head_task.previous_steps.all()
+        else:
+            # previous_task
+            previous_task = Task.objects.get(parent=self.model, dag=dag, fission_index=fission_index,
+                                             iter_index=iter_index - 1,
+                                             state=TaskStates.SUCCESS)
 
-        iter_index = previous_task.iter_index + 1
-        inputs = previous_task.output
-        iter_context = previous_task.extra['iter_context']
+            iter_index = previous_task.iter_index + 1
+            inputs = previous_task.output
+            iter_cursor = IterCursor.from_extra(previous_task.extra)
+            fission_count = previous_task.fission_count
+            previous_tasks, previous_steps = [previous_task], []
 
-        if dag.iter_config.get('key'):
-            # iter by key
-            inputs[iter_context['key']] = iter_context['sequence'][iter_index]
+            if dag.iter_config.get('key'):
+                # iter by key
+                inputs[iter_cursor.key] = iter_cursor.item(iter_index)
 
         inputs = ParamAdapter.from_json(dag.input_adapter).adapt(inputs or {})
         t, created = Task.objects.get_or_create(
@@ -1048,12 +1552,13 @@ class SeaflowTask(object):
                 name=dag.name,
                 title=dag.title,
                 state=TaskStates.PENDING.name,
-                fission_count=previous_task.fission_count,
+                fission_count=fission_count,
+                iter_end=False,
                 input=inputs,
                 config=self._generate_task_config(dag),
                 start_time=timezone.now(),
-                root=self.model.root or self.model,
-                extra={'iter_context': iter_context}
+                root=self.root.model if self.root else self.model,
+                extra=iter_cursor.to_extra()
             ),
             dag=dag,
             parent=self.model,
@@ -1070,7 +1575,8 @@ class SeaflowTask(object):
             # 其他进程中已经创建了这个任务, 理论上不可能
             self.seagull.flush(True)
             return
-        t.previous_tasks.set([previous_task])
+        t.previous_tasks.set(previous_tasks)
+        t.previous_steps.set(previous_steps)
 
         s_task = SeaflowTask.get(task=t)
         s_task.seagull.info('task 【%s】%s%s created: %s'
@@ -1090,30 +1596,41 @@ class SeaflowTask(object):
         :return:
         """
 
-        # previous_step
-        previous_step = Step.objects.get(task=self.model, node=node, fission_index=fission_index,
-                                         iter_index=iter_index - 1,
-                                         state=StepStates.SUCCESS)
+        if IterCursor.parallelism_of(node) > 1:
+            # 并行迭代: 以首个迭代为模板, 输入互不依赖
+            head_step = Step.objects.get(task=self.model, node=node, fission_index=fission_index, iter_index=0)
+            iter_cursor = IterCursor.from_extra(head_step.extra)
+            inputs = iter_cursor.inputs(iter_index)
+            fission_count = head_step.fission_count
+            previous_steps, previous_tasks = head_step.previous_steps.all(), head_step.previous_tasks.all()
+        else:
+            # previous_step
+            previous_step = Step.objects.get(task=self.model, node=node, fission_index=fission_index,
+                                             iter_index=iter_index - 1,
+                                             state=StepStates.SUCCESS)
 
-        iter_index = previous_step.iter_index + 1
-        inputs = previous_step.output
-        iter_context = previous_step.extra['iter_context']
+            iter_index = previous_step.iter_index + 1
+            inputs = previous_step.output
+            iter_cursor = IterCursor.from_extra(previous_step.extra)
+            fission_count = previous_step.fission_count
+            previous_steps, previous_tasks = [previous_step], []
 
-        if node.iter_config.get('key'):
-            # iter by key
-            inputs[iter_context['key']] = iter_context['sequence'][iter_index]
+            if node.iter_config.get('key'):
+                # iter by key
+                inputs[iter_cursor.key] = iter_cursor.item(iter_index)
 
         inputs = ParamAdapter.from_json(node.input_adapter).adapt(inputs or {})
         s, created = Step.objects.get_or_create(
             defaults=dict(
                 state=StepStates.PENDING.name,
-                fission_count=previous_step.fission_count,
+                fission_count=fission_count,
+                iter_end=False,
                 input=inputs,
                 config=self._generate_step_config(node),
                 name=node.name,
                 title=node.title,
-                root=self.model.root or self.model,
-                extra={'iter_context': iter_context}
+                root=self.root.model if self.root else self.model,
+                extra=iter_cursor.to_extra()
             ),
             node=node,
             task=self.model,
@@ -1130,18 +1647,71 @@ class SeaflowTask(object):
             # 其他进程中已经创建了这个任务, 理论上不可能
             self.seagull.flush(True)
             return
-        s.previous_steps.set([previous_step])
+        s.previous_steps.set(previous_steps)
+        s.previous_tasks.set(previous_tasks)
 
         s_step = SeaflowStep.get(step=s)
         s_step.seagull.info('step 【%s】%s%s created: %s'
                             % (s.name,
-                               ' fission-%s' % previous_step.fission_index
+                               ' fission-%s' % fission_index
                                if node.fissionable else '',
                                ' iter-%s' % iter_index if node.iterable else '',
                                s.id))
         s_step._do_callback('STEP_STATE_%s' % s.state)
         s_step._apply()
 
+    def _advance_iter_dag(self, dag, fission_index, iter_cursor):
+        """
+        并行迭代的dag: 窗口前进
+        :param dag:
+        :param fission_index:
+        :param iter_cursor:
+        :return:
+        """
+        completed = Task.objects.filter(parent=self.model, dag=dag, fission_index=fission_index,
+                                        state=TaskStates.SUCCESS)
+        launch, handed_off = iter_cursor.advance(completed)
+        for iter_index in launch:
+            self.seagull.info('dag 【%s】%s start iter-%s'
+                              % (dag.name,
+                                 ' fission-%s' % fission_index if dag.fissionable else '',
+                                 iter_index))
+            self._iter_dag(dag, fission_index, iter_index)
+        if handed_off:
+            # 全部迭代按序完成, 由最后一个迭代继续向后, 其输出为按iter_index顺序合并的各迭代输出
+            outputs = merge_fission_outputs(*[r.output for r in completed.order_by('iter_index')])
+            last = completed.get(iter_index=iter_cursor.length - 1)
+            last.update(iter_end=True, output=outputs)
+            self.seagull.info('dag 【%s】%s all iters finished'
+                              % (dag.name, ' fission-%s' % fission_index if dag.fissionable else ''))
+            self.__class__.get(task=last, profile='finish')._forward()
+
+    def _advance_iter_node(self, node, fission_index, iter_cursor):
+        """
+        并行迭代的node: 窗口前进
+        :param node:
+        :param fission_index:
+        :param iter_cursor:
+        :return:
+        """
+        completed = Step.objects.filter(task=self.model, node=node, fission_index=fission_index,
+                                        state=StepStates.SUCCESS)
+        launch, handed_off = iter_cursor.advance(completed)
+        for iter_index in launch:
+            self.seagull.info('node 【%s】%s start iter-%s'
+                              % (node.name,
+                                 ' fission-%s' % fission_index if node.fissionable else '',
+                                 iter_index))
+            self._iter_node(node, fission_index, iter_index)
+        if handed_off:
+            # 全部迭代按序完成, 由最后一个迭代继续向后, 其输出为按iter_index顺序合并的各迭代输出
+            outputs = merge_fission_outputs(*[r.output for r in completed.order_by('iter_index')])
+            last = completed.get(iter_index=iter_cursor.length - 1)
+            last.update(iter_end=True, output=outputs)
+            self.seagull.info('node 【%s】%s all iters finished'
+                              % (node.name, ' fission-%s' % fission_index if node.fissionable else ''))
+            SeaflowStep.get(last.id, profile='finish')._forward()
+
     def _adapt_outputs(self, outputs):
         # outputs = outputs or {}
 
@@ -1153,9 +1723,8 @@ class SeaflowTask(object):
     def _is_iter_end(self):
         if not self.model.dag.iterable:
             return
-        iter_context = self.model.extra['iter_context']
         if self.model.dag.iter_config.get('key'):
-            return self.model.iter_index == (len(iter_context['sequence']) - 1)
+            return IterCursor.from_extra(self.model.extra).is_end(self.model.iter_index)
 
     def _ready_to_execute_node(self, node):
         """
@@ -1288,16 +1857,16 @@ class SeaflowTask(object):
         :param outputs:
         :return:
         """
-        data = {
-            'index': self.model.loop_index + 1,
-            'input': self.model.input,
-            'output': outputs,
-            'context': (self.model.root or self.model).context
-        }
-
-        loop_condition = self.model.dag.loop_config['condition']
+        loop_condition = conditions.get(self.model.dag, 'loop_config', self.model.dag.loop_config['condition'])
+        data = ConditionData(
+            context_loader=ContextStore(self.model.root_id or self.id).values,
+            context_keys=loop_condition.context_keys,
+            index=self.model.loop_index + 1,
+            input=self.model.input,
+            output=outputs,
+        )
 
-        return not jsonLogic(loop_condition, data)
+        return not loop_condition(data)
 
     def ended(self):
         return self.model.state in TaskStates.end_states()
@@ -1331,7 +1900,7 @@ class SeaflowTask(object):
         :param node:
         :return:
         """
-        step_config = TaskConfig.from_json(
+        step_config = StepConfig.from_json(
             (self.root or self).model.extra.get('steps_config', {}).get(node.name, {})).trim()
         config = StepConfig(
             max_retries=node.max_retries,
@@ -1366,34 +1935,59 @@ class SeaflowStep(object):
         self.context = None
         self.seagull = None
         self.config = None
+        self.profile = 'default'
 
         #
         self.task = None  # SeaflowTask
         self.root = None  # SeaflowTask
 
     @classmethod
-    def get(cls, step_id=None, step=None):
+    def get(cls, step_id=None, step=None, profile='default'):
         """
         :param step_id:
         :param step:
+        :param profile: 加载的列, 见LOAD_PROFILES
         :return: SeaflowStep
         """
-        m = step or Step.objects.select_related('node', 'node__action',
-                                                'task', 'root').defer('logs').get(pk=step_id)
+        if not step:
+            step = cls._queryset(profile).get(pk=step_id)
         r = cls()
-        r.model = m
+        r.model = step
+        r.profile = profile
         r.load()
         return r
 
+    @classmethod
+    def get_many(cls, step_ids, profile='default'):
+        """
+        一次查询加载多个step
+        :param step_ids:
+        :param profile: 加载的列, 见LOAD_PROFILES
+        :return: [SeaflowStep], 按id排序, 不存在的step被忽略
+        """
+        return [cls.get(step=s, profile=profile)
+                for s in cls._queryset(profile).filter(pk__in=list(step_ids)).order_by('id')]
+
+    @staticmethod
+    def _queryset(profile):
+        p = LOAD_PROFILES[profile]
+        return Step.objects.select_related('node', 'node__action', 'task', 'root').defer(
+            *p['step'], *['task__%s' % f for f in p['related']], *['root__%s' % f for f in p['related']])
+
     def load(self):
         self.id = self.model.id
         self.name = self.model.name
-        self.context = self.model.root.context
+        self.context = SeaflowContext(task_id=self.model.root_id or self.model.task_id)
         self.seagull = Seagull.instance(self.model, level=logging.INFO)
         self.config = self.model.config
 
-        self.task = SeaflowTask.get(task=self.model.task)
-        self.root = SeaflowTask.get(task=self.model.root)
+        self.task = SeaflowTask._related(self.model, 'task', self.profile)
+        if self.model.root_id == self.model.task_id:
+            # root task直属的step
+            self.model.root = self.model.task
+            self.root = self.task
+        else:
+            self.root = SeaflowTask._related(self.model, 'root', self.profile)
 
     def reload(self):
         self.model.refresh_from_db()
@@ -1439,24 +2033,18 @@ class SeaflowStep(object):
         """
         :return:
         """
-        from . import tasks
         try:
             self.seagull.info('action type: %s' % self.model.node.action_type)
             # if self._skip_or_not():
             #     self._skip()
             #     return
-            if self.model.node.action_type == ActionTypes.Carrier:
-                # 旁路节点
-                func = tasks.start_carrier_step
-            elif self.model.node.action_type == ActionTypes.External:
-                # 外部节点
-                func = tasks.publish_external_step
-            else:
-                # 普通节点
-                func = get_func(self.model.node.action.func)
-
+            if not limits.acquire(self.model):
+                # 达到并发/速率限制, 等待槽位释放后由limits派发
+                self.seagull.info('step parked: limit reached')
+                self.seagull.flush(True)
+                return
             self.seagull.flush(True)
-            func.apply_async((self.id,), countdown=self.model.config.get('countdown', 0))
+            self._submit(countdown=self.model.config.get('countdown', 0))
         except Exception as e:
             self.seagull.flush(True)
             self._break_off(e)
@@ -1471,29 +2059,38 @@ class SeaflowStep(object):
         adapter = ParamAdapter.from_json(self.model.node.skip_config.get('output', {}))
         data = {
             'input': self.model.input,
-            'context': (self.model.root or self.model.task).context
+            'context': self.context.get()
         }
         outputs = adapter.adapt(data)
         self.seagull.info('step skipped')
         self._finish(outputs=outputs, state=StepStates.SKIP)
 
-    def _trigger_timeout(self):
-        if self.finished():
+    def _trigger_timeout(self, revoke=True, heartbeat=False):
+        """
+        :param revoke: 是否撤销celery任务, 由sweeper批量撤销时为False
+        :param heartbeat: 是否为心跳超时
+        :return:
+        """
+        if self.ended():
             return
-        self.seagull.error('Step execution exceeds %s seconds' % self.model.config.get('timeout'))
-        if self.model.node.action_type in [ActionTypes.Default, ActionTypes.Carrier]:
+        if heartbeat:
+            message = 'Step heartbeat lost for %s seconds' % self.model.config.get('heartbeat_timeout')
+        else:
+            message = 'Step execution exceeds %s seconds' % self.model.config.get('timeout')
+        self.seagull.error(message)
+        if revoke and self.model.node.action_type in [ActionTypes.Default, ActionTypes.Carrier]:
             if AsyncResult(self.model.identifier).state in ['PENDING', 'RECEIVED', 'STARTED', 'RETRY']:
                 from . import celery_app
                 celery_app.control.revoke(self.model.identifier, terminate=True)
-        self._break_off(TimeoutException('Step execution exceeds %s seconds' % self.model.config.get('timeout')))
+        self._break_off(TimeoutException(message))
 
     def _set_alarm(self):
         if not (tm := self.model.config.get('timeout')):
             return
 
-        from .tasks import trigger_step_timeout
+        # 由sweeper在deadline到期后触发, 见timeouts.sweep_steps
         self.seagull.info('set alarm, countdown: %s seconds' % tm)
-        trigger_step_timeout.apply_async((self.id,), countdown=tm)
+        self.model.update(_refresh=False, deadline=timezone.now() + datetime.timedelta(seconds=tm))
 
     def _execute(self, celery_action):
         celery_action.step = self.model
@@ -1501,14 +2098,17 @@ class SeaflowStep(object):
         try:
             celery_action.task = self.model.task
             celery_action.root = self.model.root
-            celery_action.context = SeaflowContext(task=self.model.root)
+            celery_action.context = SeaflowContext(task_id=self.model.root_id or self.model.task_id)
+            celery_action.heartbeat = HeartbeatRecorder(self.model)
 
             fresh_new = False
+            # 首次执行/重试时设置超时
+            arm_alarm = self.model.state in [StepStates.PENDING, StepStates.RETRY]
             if self.model.state == StepStates.PENDING:
                 # fresh new
                 fresh_new = True
                 self.seagull.info('step 【%s】 started' % self.name)
-                self.seagull.info('input: %s' % json.dumps(self.model.input, ensure_ascii=False))
+                self.seagull.info('input: %s' % preview(self.model.input, 'step#%s.input' % self.model.id, self.config))
                 if self.model.node.loopable:
                     self.seagull.info('loop started')
                     self.seagull.debug('loop-%s started' % self.model.loop_index)
@@ -1529,20 +2129,29 @@ class SeaflowStep(object):
                 self.seagull.info(
                     'detect root task 【%s】 state: %s' % (self.model.root.name, self.model.root.state))
             if sleep:
-                self.model.update(identifier=celery_action.request.id, state=StepStates.SLEEP)
+                if not self.model.transit([StepStates.PENDING, StepStates.PROCESSING, StepStates.RETRY,
+                                           StepStates.SLEEP],
+                                          identifier=celery_action.request.id, state=StepStates.SLEEP):
+                    return
                 self._do_callback('STEP_STATE_%s' % StepStates.SLEEP)
                 self.seagull.info('Good Night.')
                 self.seagull.flush(True)
                 return
 
             if self.model.state in [StepStates.PENDING, StepStates.RETRY, StepStates.SLEEP]:
-                # fresh new/retry/awake from sleep
-                self.model.update(identifier=celery_action.request.id, start_time=timezone.now(),
-                                  state=StepStates.PROCESSING)
+                # fresh new/retry/awake from sleep, 重复投递的消息只有一个能执行
+                if not self.model.transit([StepStates.PENDING, StepStates.RETRY, StepStates.SLEEP],
+                                          identifier=celery_action.request.id, start_time=timezone.now(),
+                                          state=StepStates.PROCESSING):
+                    self.seagull.flush(True)
+                    return
                 self._do_callback('STEP_STATE_%s' % StepStates.PROCESSING)
             else:
-                # loop/recovery
-                self.model.update(identifier=celery_action.request.id)
+                # loop/recovery: _send在投递前记录了celery id, 只有最近一次投递的消息能继续执行
+                if not self.model.transit([StepStates.PROCESSING], _where={'identifier': celery_action.request.id},
+                                          identifier=celery_action.request.id):
+                    self.seagull.flush(True)
+                    return
 
             # 是否撤销
             if self.model.task.state in (TaskStates.fail_states() + TaskStates.interrupt_states()):
@@ -1554,31 +2163,65 @@ class SeaflowStep(object):
 
             if fresh_new:
                 self.seagull.info('step execution...')
+            if arm_alarm:
                 # TODO: timeout，此处也许不是最好的实现，需要考虑iterable的node等其他情况
                 self._set_alarm()
-            res = celery_action.func(celery_action, **self.model.input) or {}
-            state, outputs = res.get('state', StepStates.SUCCESS), res.get('data', {})
-            # self.seagull.info('action【%s】 output: %s' % (self.model.node.action.name,
-            #                                              json.dumps(outputs, cls=ComplexJSONEncoder)))
-            self.seagull.flush(True)
-            outputs = self._adapt_outputs(outputs)
-            if state == StepStates.SUCCESS:
-                if self.model.node.loopable:
-                    # loop step
-                    self._loop_next(outputs)
+            if self.model.config.get('heartbeat_timeout'):
+                # 开始执行即视为一次心跳
+                celery_action.heartbeat()
+            cache_policy, cache_key = self._cache_policy()
+            if cache_key:
+                cached = cache.results.get(cache_key)
+                if cached is not None:
+                    self.seagull.info('result cache hit: %s' % cache_key)
+                    self._finish(self._adapt_outputs(cached))
+                    return
+            inline_started = time.time()
+            while True:
+                res = celery_action.func(celery_action, **self.model.input) or {}
+                state, outputs = res.get('state', StepStates.SUCCESS), res.get('data', {})
+                if cache_key and state == StepStates.SUCCESS:
+                    cache.results.set(cache_key, self.model.node.action, cache_policy, outputs)
+                # self.seagull.info('action【%s】 output: %s' % (self.model.node.action.name,
+                #                                              json.dumps(outputs, cls=ComplexJSONEncoder)))
+                self.seagull.flush(True)
+                outputs = self._adapt_outputs(outputs)
+                if state == StepStates.SUCCESS:
+                    if self.model.node.loopable:
+                        # loop step
+                        if self._loop_next(outputs, inline_started=inline_started):
+                            # 在当前worker内继续下一次循环, 与重新投递一样每次循环读取最新的context
+                            celery_action.context.reload()
+                            if self.model.config.get('heartbeat_timeout'):
+                                celery_action.heartbeat()
+                            self.seagull.debug('loop-%s started' % self.model.loop_index)
+                            continue
+                    else:
+                        # finish step
+                        self._finish(outputs, state)
                 else:
-                    # finish step
-                    self._finish(outputs, state)
-            else:
-                self._break_off(outputs=outputs)
+                    self._break_off(outputs=outputs)
+                break
         except Exception as e:
             self._break_off(e)
         finally:
-            self.reload()
+            if hasattr(celery_action, 'heartbeat'):
+                celery_action.heartbeat.flush(final=True)
             if self.model.state in (TaskStates.fail_states() + TaskStates.interrupt_states()):
-                log_data = {'setp_name': self.name, 'step_state': self.model.state}
-                log_2_es_msg(event_type="STEP_INFO", event_type_name="step信息", desc=log_data)
-            del_attrs(celery_action, 'seagull', 'task', 'root_task', 'step', 'context', 'func')
+                self.seagull.logger.warning('step 【%s】 state: %s' % (self.name, self.model.state))
+            del_attrs(celery_action, 'seagull', 'task', 'root_task', 'step', 'context', 'heartbeat', 'func')
+
+    def _cache_policy(self):
+        """
+        结果缓存, 循环step不缓存
+        :return: (缓存策略, key), 未开启时返回(None, None)
+        """
+        if self.model.node.loopable:
+            return None, None
+        p = cache.policy(self.model.node.action, self.model.config)
+        if p is None:
+            return None, None
+        return p, cache.make_key(self.model.node.action, p, self.model.input)
 
     def _publish(self):
         try:
@@ -1588,7 +2231,7 @@ class SeaflowStep(object):
                 self.seagull.info('Good Morning.')
             else:
                 self.seagull.info('step 【%s】 started' % self.name)
-                self.seagull.info('input: %s' % json.dumps(self.model.input, ensure_ascii=False))
+                self.seagull.info('input: %s' % preview(self.model.input, 'step#%s.input' % self.model.id, self.config))
                 # 判断是否进入睡眠
                 sleep = False
                 if self.model.task.state == TaskStates.SLEEP:
@@ -1638,8 +2281,17 @@ class SeaflowStep(object):
             self._break_off(e)
 
     def _finish(self, outputs={}, state=StepStates.SUCCESS):
-        self.reload()
-        if self.model.state != StepStates.PROCESSING:
+        end_time = timezone.now()
+        duration = end_time - self.model.start_time
+        if not self.model.transit(
+                [StepStates.PROCESSING],
+                state=state,
+                end_time=end_time,
+                duration=float('%s.%s' % (duration.seconds, duration.microseconds)),
+                output=outputs or {},
+                iter_end=self._is_iter_end(),
+                deadline=None
+        ):
             return
 
         self.seagull.info('step 【%s】%s%s finished: %s'
@@ -1647,31 +2299,23 @@ class SeaflowStep(object):
                              ' fission-%s' % self.model.fission_index if self.model.node.fissionable else '',
                              ' iter-%s' % self.model.iter_index if self.model.node.iterable else '',
                              state.value))
-        self.seagull.info('output: %s' % json.dumps(outputs, cls=ComplexJSONEncoder))
-
-        end_time = timezone.now()
-        duration = end_time - self.model.start_time
-
+        self.seagull.info('output: %s' % preview(outputs, 'step#%s.output' % self.model.id, self.config))
         self.seagull.flush(True, merge=True)
-        self.model.update(
-            state=state,
-            end_time=end_time,
-            duration=float('%s.%s' % (duration.seconds, duration.microseconds)),
-            output=outputs or {},
-            iter_end=self._is_iter_end()
-        )
         self._do_callback('STEP_STATE_%s' % TaskStates.SUCCESS)
+        self._release()
         # 路在脚下
-        self._forward()
+        self._advance()
 
-    def _break_off(self, e=None, outputs={}):
-        self.reload()
-        if self.model.state not in [StepStates.PENDING, StepStates.PUBLISH, StepStates.PROCESSING, StepStates.RETRY,
-                                    StepStates.SLEEP]:
-            return
+    def _advance(self):
+        """
+        后继的调度交给advance队列上的引擎worker异步执行, 见tasks.advance_step
+        执行action的worker持久化输出后即返回
+        """
+        from .tasks import advance_step
+        advance_step.apply_async((self.id,))
 
+    def _break_off(self, e=None, outputs={}):
         if e:
-            error = self.seagull.trace_error(e)
             if self.model.retries < self.model.config.get('max_retries', 0) and not isinstance(e, RevokeException):
                 state = StepStates.RETRY
             elif isinstance(e, TimeoutException):
@@ -1681,54 +2325,119 @@ class SeaflowStep(object):
             else:
                 state = StepStates.ERROR
         else:
-            self.seagull.info('output: %s' % json.dumps(outputs, cls=ComplexJSONEncoder))
-            error = ""
             if self.model.retries < self.model.config.get('max_retries', 0):
                 state = StepStates.RETRY
             else:
                 state = StepStates.ERROR
 
+        end_time = timezone.now()
+        retry_at = None
+        if state == StepStates.RETRY:
+            countdown = retry.backoff(self.model.config, self.model.retries)
+            retry_at = end_time + datetime.timedelta(seconds=countdown)
+        duration = (end_time - self.model.start_time) if self.model.start_time else None
+        if not self.model.transit(
+                [StepStates.PENDING, StepStates.PUBLISH, StepStates.PROCESSING, StepStates.RETRY, StepStates.SLEEP],
+                state=state,
+                retries=self.model.retries + 1 if state == StepStates.RETRY else self.model.retries,
+                end_time=None if state == StepStates.RETRY else end_time,
+                duration=None if (not duration or state == StepStates.RETRY) else float(
+                    '%s.%s' % (duration.seconds, duration.microseconds)),
+                error=self.seagull.format_error(e) if e else '',
+                output=outputs or {},
+                deadline=None,
+                retry_at=retry_at
+        ):
+            return
+
+        if e:
+            self.seagull.trace_error(e)
+        else:
+            self.seagull.info('output: %s' % preview(outputs, 'step#%s.output' % self.model.id, self.config))
         self.seagull.error('step 【%s】 broken: %s' % (self.name, state.value))
         if state == StepStates.RETRY:
-            self.seagull.info('retry in %ss.' % self.model.node.retry_countdown)
+            self.seagull.info('retry in %ss.' % countdown)
         self.seagull.flush(True, merge=True)
-
-        end_time = timezone.now()
-        duration = (end_time - self.model.start_time) if self.model.start_time else None
-        self.model.update(
-            state=state,
-            retries=self.model.retries + 1 if state == StepStates.RETRY else self.model.retries,
-            end_time=None if state == StepStates.RETRY else end_time,
-            duration=None if (not duration or state == StepStates.RETRY) else float(
-                '%s.%s' % (duration.seconds, duration.microseconds)),
-            error=error,
-            output=outputs or {}
-        )
         self._do_callback('STEP_STATE_%s' % self.model.state)
-        if state == StepStates.RETRY:
-            # celery_task.retry(countdown=step.node.retry_countdown, exc=e, throw=False)
-            get_func(self.model.node.action.func).apply_async((self.id,),
-                                                              countdown=self.model.config.get('retry_countdown', 0))
-        else:
+        # 等待重试时由sweeper在retry_at到期后重新投递, 见retry.sweep_steps
+        if state != StepStates.RETRY:
+            self._release()
             # propagate
             self.task._break_off(e, outputs=outputs)
 
-    def _loop_next(self, outputs={}):
-        self.reload()
-        if self.model.state != StepStates.PROCESSING:
-            return
+    def _release(self):
+        """
+        释放并发槽位, 见limits
+        :return:
+        """
+        if limits.policy(self.model.node.action, self.model.config):
+            limits.release([self.id])
+        if scheduling.enabled():
+            scheduling.release([self.id])
 
+    def _loop_next(self, outputs={}, inline_started=None):
+        """
+        :param outputs:
+        :param inline_started: 本次worker调用开始执行的时间, 为None时不在worker内连续循环
+        :return: bool, 是否在当前worker内继续下一次循环
+        """
+        countdown = self.model.node.loop_config.get('countdown', 0)
+        inline = inline_started is not None and countdown < conf.get('LOOP_INLINE_THRESHOLD')
+        # _finish和_persist_loop_index都以step仍在执行中为条件, 无需预先reload检查状态
         self.seagull.debug(
-            'loop-%s end, output: %s' % (self.model.loop_index, json.dumps(outputs, cls=ComplexJSONEncoder)))
+            'loop-%s end, output: %s' % (self.model.loop_index, preview(outputs, config=self.config)))
         loop_end = self._is_loop_end(outputs)
         if loop_end:
             self.seagull.info('loop end')
+            if inline:
+                self._persist_loop_index()
             self._finish(outputs)
-        else:
-            self.model.update(loop_index=self.model.loop_index + 1, _refresh=False)
-            countdown = self.model.node.loop_config.get('countdown', 0)
+            return False
+
+        self.model.loop_index += 1
+        if inline and time.time() - inline_started < conf.get('LOOP_INLINE_BUDGET'):
             self.seagull.debug('sleep %ss...' % countdown)
-            get_func(self.model.node.action.func).apply_async((self.id,), countdown=countdown)
+            time.sleep(countdown)
+            # 在worker内连续循环: 每次循环前检查step/task是否仍在执行中, 批量持久化loop_index
+            if self.model.loop_index % conf.get('LOOP_INDEX_BATCH') == 0:
+                if not self._persist_loop_index():
+                    return False
+                self.seagull.flush(True)
+            elif not self._is_processing():
+                return False
+            return True
+
+        # 重新投递到broker
+        if not self._persist_loop_index():
+            return False
+        self.seagull.debug('sleep %ss...' % countdown)
+        self._send(countdown=countdown)
+        return False
+
+    def _is_processing(self):
+        """
+        只读检查step/task是否仍在执行中
+        :return: bool, step是否仍在执行中
+        """
+        row = Step.objects.filter(pk=self.id).values_list('state', 'task__state', 'root__state').first()
+        if row is None:
+            return False
+        state, task_state, root_state = row
+        if task_state in TaskStates.fail_states() + TaskStates.interrupt_states() \
+                or root_state in TaskStates.fail_states() + TaskStates.interrupt_states():
+            raise RevokeException('detect task 【%s】 interrupted' % self.model.task.name)
+        return state == StepStates.PROCESSING
+
+    def _persist_loop_index(self):
+        """
+        持久化loop_index, 并检查step/task是否仍在执行中
+        :return: bool, step是否仍在执行中
+        """
+        if Task.objects.filter(pk__in=[self.model.task_id, self.model.root_id],
+                               state__in=TaskStates.fail_states() + TaskStates.interrupt_states()).exists():
+            raise RevokeException('detect task 【%s】 interrupted' % self.model.task.name)
+        return Step.objects.filter(pk=self.id, state=StepStates.PROCESSING) \
+            .update(loop_index=self.model.loop_index, update_time=timezone.now()) > 0
 
     def _forward(self):
         try:
@@ -1740,6 +2449,11 @@ class SeaflowStep(object):
                                       ))
             if self.model.node.iterable:
                 if not self.model.iter_end:
+                    iter_cursor = IterCursor.from_extra(self.model.extra)
+                    if iter_cursor.windowed:
+                        # 并行迭代, 窗口前进
+                        self.task._advance_iter_node(self.model.node, self.model.fission_index, iter_cursor)
+                        return
                     # 继续iter
                     self.task.seagull.info('node 【%s】%s forward to iter-%s'
                                            % (self.model.node.name,
@@ -1752,7 +2466,7 @@ class SeaflowStep(object):
             # 是否是fission
             if self.model.node.fissionable:
                 # 判断兄弟们是否完成
-                siblings = Step.objects.filter(task=self.model.task, node=self.model.node).exclude(
+                siblings = Step.objects.filter(task_id=self.model.task_id, node=self.model.node).exclude(
                     iter_end=False)
                 if len([s for s in siblings if
                         s.state == StepStates.SUCCESS]) != self.model.fission_count:
@@ -1761,8 +2475,14 @@ class SeaflowStep(object):
                 self.task.seagull.info('node 【%s】 all fissions finished' % self.model.node.name)
                 outputs = merge_fission_outputs(*[s.output for s in siblings])
 
+            ref = 'the outputs of fission steps' if self.model.node.fissionable else 'step#%s.output' % self.model.id
             self.task.seagull.info(
-                'node【%s】 output: %s' % (self.model.node.name, json.dumps(outputs, ensure_ascii=True)))
+                'node【%s】 output: %s' % (self.model.node.name, preview(outputs, ref, self.config)))
+
+            _, created = Advance.objects.get_or_create(task_id=self.task.id, ref_type='NODE', ref_id=self.model.node_id)
+            if not created:
+                self.task.seagull.info('node 【%s】 already advanced' % self.model.node.name)
+                return
 
             # 有没有后继dag和node
             next_dags, next_nodes = self.model.node.next_dags.all(), self.model.node.next_nodes.all()
@@ -1779,25 +2499,26 @@ class SeaflowStep(object):
                 if task_finished:
                     self.task._finish(task_outputs)
         except Exception as e:
-            self.task._break__off(e)
+            self.task._break_off(e)
         finally:
             self.task.seagull.flush(True)
 
     def _terminate(self):
-        self.reload()
-        if self.model.state not in StepStates.terminable_states():
-            return
         tnow = timezone.now()
         duration = 0
         if self.model.start_time:
             duration = tnow - self.model.start_time
             duration = float('%s.%s' % (duration.seconds, duration.microseconds))
+        if not self.model.transit(
+                StepStates.terminable_states(),
+                state=StepStates.TERMINATE,
+                end_time=tnow,
+                duration=duration,
+                deadline=None,
+                retry_at=None
+        ):
+            return
         self.seagull.flush(True, merge=True)
-        self.model.update(
-            state=StepStates.TERMINATE,
-            end_time=timezone.now(),
-            duration=duration
-        )
         self._do_callback('STEP_STATE_%s' % StepStates.TERMINATE)
         if self.model.node.action_type in [ActionTypes.Default, ActionTypes.Carrier]:
             if AsyncResult(self.model.identifier).state in ['PENDING', 'RECEIVED', 'STARTED', 'RETRY']:
@@ -1805,50 +2526,86 @@ class SeaflowStep(object):
                 celery_app.control.revoke(self.model.identifier, terminate=True)
 
     def _awake(self):
-        from . import tasks
-        self.realod()
-        if self.model.state != StepStates.SLEEP:
+        if not Step.objects.filter(pk=self.id, state=StepStates.SLEEP).exists():
             return
+        self._send()
 
+    def _action_task(self):
+        """
+        :return: 执行step的celery task
+        """
+        from . import tasks
         if self.model.node.action_type == ActionTypes.Carrier:
             # 旁路节点
-            func = tasks.start_carrier_step
+            return tasks.start_carrier_step
         elif self.model.node.action_type == ActionTypes.External:
             # 外部节点
-            func = tasks.publish_external_step
+            return tasks.publish_external_step
         else:
             # 普通节点
-            func = get_func(self.model.node.action.func)
-        func.apply_async((self.id,))
+            return get_func(self.model.node.action.func)
 
-    def _adapt_outputs(self, outputs):
-        # outputs = outputs or {}
-
-        output_def = ParamDefinition.from_json(self.model.node.action.output_def)
-        if not (self.model.node.action_type == ActionTypes.Carrier and not output_def):
+    @staticmethod
+    def _parse_outputs(node, outputs):
+        """
+        按node的输出定义校验输出, 并经过输出适配器转换
+        :param node: models.Node
+        :param outputs:
+        :return: (outputs, errors)
+        """
+        output_def, output_adapter = output_parsers.get(node)
+        if not (node.action_type == ActionTypes.Carrier and not output_def):
             # carrier特殊处理
-            _outputs, errors = output_def.parse(outputs)
+            outputs, errors = output_def.parse(outputs)
             if errors:
-                self.seagull.error('parse output failed: expect %s, got %s'
-                                   % (output_def.dump(),
-                                      json.dumps(outputs,
-                                                 cls=ComplexJSONEncoder,
-                                                 ensure_ascii=False)))
-                self.seagull.flush(True)
-                raise ParamDefinitionException(errors=errors)
-            outputs = _outputs
-        output_adapter = ParamAdapter.from_json(self.model.node.output_adapter)
-        if not (self.model.node.action_type == ActionTypes.Carrier and not output_adapter):
+                return outputs, errors
+        if not (node.action_type == ActionTypes.Carrier and not output_adapter):
             outputs = output_adapter.adapt(outputs)
+        return outputs, {}
 
-        return outputs
+    def _submit(self, countdown=0):
+        """
+        派发新的step: 开启调度器时提交到调度器, 否则直接投递, 见scheduling
+        :param countdown:
+        :return:
+        """
+        if scheduling.enabled():
+            scheduling.submit(self.model, countdown=countdown)
+        else:
+            self._send(countdown=countdown)
+
+    def _send(self, **options):
+        """
+        投递执行step的celery task, 队列见routing.step_queue
+        :param options: apply_async的参数, 例如countdown/producer
+        :return:
+        """
+        if self.model.state == StepStates.PROCESSING:
+            # loop/recovery重新投递: 先记录celery id, 之前投递的消息不能再进入执行, 见_execute
+            options['task_id'] = celery_uuid()
+            if not self.model.transit([StepStates.PROCESSING], identifier=options['task_id']):
+                return
+        return self._action_task().apply_async((self.id,), queue=routing.step_queue(
+            self.model.config, self.model.node.action_type), **options)
+
+    def _adapt_outputs(self, outputs):
+        _outputs, errors = self._parse_outputs(self.model.node, outputs)
+        if errors:
+            output_def, _ = output_parsers.get(self.model.node)
+            self.seagull.error('parse output failed: expect %s, got %s'
+                               % (output_def.dump(),
+                                  json.dumps(outputs,
+                                             cls=ComplexJSONEncoder,
+                                             ensure_ascii=False)))
+            self.seagull.flush(True)
+            raise ParamDefinitionException(errors=errors)
+        return _outputs
 
     def _is_iter_end(self):
         if not self.model.node.iterable:
             return
-        iter_context = self.model.extra['iter_context']
         if self.model.node.iter_config.get('key'):
-            return self.model.iter_index == (len(iter_context['sequence']) - 1)
+            return IterCursor.from_extra(self.model.extra).is_end(self.model.iter_index)
 
     def _is_loop_end(self, outputs):
         """
@@ -1857,16 +2614,16 @@ class SeaflowStep(object):
         :return:
         """
 
-        data = {
-            'index': self.model.loop_index + 1,
-            'input': self.model.input,
-            'output': outputs,
-            'context': (self.model.root or self.model.task).context
-        }
-
-        loop_condition = self.model.node.loop_config['condition']
+        loop_condition = conditions.get(self.model.node, 'loop_config', self.model.node.loop_config['condition'])
+        data = ConditionData(
+            context_loader=ContextStore(self.model.root_id or self.model.task_id).values,
+            context_keys=loop_condition.context_keys,
+            index=self.model.loop_index + 1,
+            input=self.model.input,
+            output=outputs,
+        )
 
-        return not jsonLogic(loop_condition, data)
+        return not loop_condition(data)
 
     def _skip_or_not(self):
         """
@@ -1874,14 +2631,14 @@ class SeaflowStep(object):
         :return:
         """
 
-        data = {
-            'input': self.model.input,
-            'context': (self.model.root or self.model.task).context
-        }
-
-        skip_condition = self.model.node.skip_config['condition']
+        skip_condition = conditions.get(self.model.node, 'skip_config', self.model.node.skip_config['condition'])
+        data = ConditionData(
+            context_loader=ContextStore(self.model.root_id or self.model.task_id).values,
+            context_keys=skip_condition.context_keys,
+            input=self.model.input,
+        )
 
-        return jsonLogic(skip_condition, data)
+        return skip_condition(data)
 
     def _do_callback(self, event):
         """
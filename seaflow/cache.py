@@ -0,0 +1,176 @@
+"""
+action结果缓存
+确定性的action(相同的func、相同的输入、相同的action版本总是得到相同的输出)可以开启结果缓存,
+命中时跳过执行, 直接以缓存的输出完成step
+
+缓存策略在action dsl的cache中配置, 可在StepConfig的cache中按node覆盖, 例如:
+    {
+        'ttl': 86400,  # 有效期(秒), 默认RESULT_CACHE_TTL, None表示不过期
+        'version': '2',  # action的实现变化而定义未变化时, 修改version使旧的缓存失效
+    }
+StepConfig中cache为False时关闭
+
+    - key: action的func、输入输出定义、version和规范化后的输入的sha256
+    - 进程内LRU + 可替换的持久化backend, 默认为数据库表seaflow_result_cache
+    - celery beat周期性地执行sweep_result_cache, 清理过期的记录, 并按最近访问时间淘汰超出RESULT_CACHE_MAX_ENTRIES的记录
+    - 只缓存非循环step的成功输出, 缓存的是action的原始输出, node的输出适配器在命中后照常执行
+"""
+
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from . import conf, payload
+from .models import ResultCache
+from .utils import ComplexJSONEncoder, get_func
+
+
+def policy(action, config):
+    """
+    :param action: models.Action
+    :param config: StepConfig
+    :return: 缓存策略, 未开启时返回None
+    """
+    p = (config or {}).get('cache')
+    if p is False:
+        return None
+    if p is None:
+        return action.cache
+    return dict(action.cache or {}, **(p if isinstance(p, dict) else {}))
+
+
+def make_key(action, p, inputs):
+    """
+    :param action: models.Action
+    :param p: 缓存策略
+    :param inputs: 校验后的输入
+    :return:
+    """
+    data = json.dumps({
+        'func': action.func,
+        'input_def': action.input_def,
+        'output_def': action.output_def,
+        'version': p.get('version'),
+        'input': inputs,
+    }, cls=ComplexJSONEncoder, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class DatabaseResultBackend(object):
+    """
+    数据库表seaflow_result_cache
+    """
+
+    def get(self, key, now):
+        """
+        :return: (output, expire_time), 不存在或已过期时返回None
+        """
+        r = ResultCache.objects.filter(key=key).values_list('id', 'output', 'expire_time').first()
+        if r is None:
+            return None
+        pk, output, expire_time = r
+        if expire_time is not None and expire_time <= now:
+            return None
+        ResultCache.objects.filter(pk=pk).update(hits=models.F('hits') + 1, access_time=now)
+        return payload.resolve(output), expire_time
+
+    def set(self, key, action, output, expire_time, now):
+        try:
+            with transaction.atomic():
+                ResultCache.objects.create(key=key, action_id=action.id, output=output,
+                                           expire_time=expire_time, access_time=now)
+        except IntegrityError:
+            # 其他进程已写入, 或已过期的记录尚未清理
+            ResultCache.objects.filter(key=key).update(output=output, expire_time=expire_time, access_time=now)
+
+    def sweep(self, now, batch, max_entries):
+        """
+        :return: 删除的记录数
+        """
+        ids = list(ResultCache.objects.filter(expire_time__lte=now).values_list('id', flat=True)[:batch])
+        deleted = ResultCache.objects.filter(id__in=ids).delete()[0] if ids else 0
+        if max_entries is not None:
+            overflow = ResultCache.objects.count() - max_entries
+            if overflow > 0:
+                ids = list(ResultCache.objects.order_by('access_time').values_list('id', flat=True)[
+                           :min(overflow, batch)])
+                deleted += ResultCache.objects.filter(id__in=ids).delete()[0]
+        return deleted
+
+
+class ResultStore(object):
+    """
+    进程内LRU + 持久化backend
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._backend = None
+
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_func(conf.get('RESULT_CACHE_BACKEND'))()
+        return self._backend
+
+    def get(self, key):
+        """
+        :param key:
+        :return: action的原始输出, 未命中时返回None
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                output, expire_ts = item
+                if expire_ts is None or expire_ts > time.time():
+                    self._items.move_to_end(key)
+                    return deepcopy(output)
+                self._items.pop(key)
+        r = self.backend().get(key, timezone.now())
+        if r is None:
+            return None
+        output, expire_time = r
+        self._remember(key, output, expire_time.timestamp() if expire_time else None)
+        return deepcopy(output)
+
+    def set(self, key, action, p, output):
+        """
+        :param key:
+        :param action: models.Action
+        :param p: 缓存策略
+        :param output: action的原始输出
+        :return:
+        """
+        now = timezone.now()
+        ttl = p.get('ttl', conf.get('RESULT_CACHE_TTL'))
+        expire_time = now + datetime.timedelta(seconds=ttl) if ttl is not None else None
+        self.backend().set(key, action, output, expire_time, now)
+        self._remember(key, deepcopy(output), expire_time.timestamp() if expire_time else None)
+
+    def _remember(self, key, output, expire_ts):
+        with self._lock:
+            self._items[key] = (output, expire_ts)
+            self._items.move_to_end(key)
+            while len(self._items) > conf.get('RESULT_CACHE_LRU_SIZE'):
+                self._items.popitem(last=False)
+
+
+results = ResultStore()
+
+
+def sweep(now=None):
+    """
+    清理过期的记录, 淘汰超出数量上限的记录
+    :param now:
+    :return: 删除的记录数
+    """
+    return results.backend().sweep(now or timezone.now(),
+                                   conf.get('RESULT_CACHE_SWEEP_BATCH'),
+                                   conf.get('RESULT_CACHE_MAX_ENTRIES'))
@@ -0,0 +1,121 @@
+"""
+seaflow配置, 可在django settings中通过SEAFLOW覆盖, 例如:
+    SEAFLOW = {
+        'LOOP_INLINE_THRESHOLD': 3,
+    }
+"""
+
+from django.conf import settings
+
+DEFAULTS = {
+    # 循环: countdown小于该值(秒)的循环在同一个worker调用内连续执行
+    'LOOP_INLINE_THRESHOLD': 5,
+    # 循环: 在同一个worker调用内连续执行的时间预算(秒), 超出后重新投递到broker
+    'LOOP_INLINE_BUDGET': 60,
+    # 循环: 在worker内连续执行时, 每隔多少次循环持久化一次loop_index
+    'LOOP_INDEX_BATCH': 10,
+    # 编译后的jsonLogic条件缓存数量
+    'CONDITION_CACHE_SIZE': 1024,
+    # node输出定义和输出适配器的缓存数量
+    'OUTPUT_PARSER_CACHE_SIZE': 1024,
+    # context: 不支持json局部更新的数据库, 读-改-写冲突时的重试次数
+    'CONTEXT_WRITE_RETRIES': 5,
+    # 超时: sweeper的执行间隔(秒)
+    'TIMEOUT_SWEEP_INTERVAL': 5,
+    # 超时: sweeper每批处理的记录数
+    'TIMEOUT_SWEEP_BATCH': 500,
+    # 重试: sweeper的执行间隔(秒)
+    'RETRY_SWEEP_INTERVAL': 1,
+    # 重试: sweeper每批处理的记录数
+    'RETRY_SWEEP_BATCH': 500,
+    # 崩溃恢复: sweeper的执行间隔(秒)
+    'RECOVERY_SWEEP_INTERVAL': 60,
+    # 崩溃恢复: sweeper每批处理的记录数
+    'RECOVERY_SWEEP_BATCH': 500,
+    # 崩溃恢复: 超过该时间(秒)未更新且不在任何worker上的step视为丢失
+    'RECOVERY_THRESHOLD': 1800,
+    # 崩溃恢复: 丢失的step的处理策略, redispatch/fail, 可在step config的recovery中覆盖
+    'RECOVERY_POLICY': 'redispatch',
+    # 心跳: 同一个step两次写入心跳的最小间隔(秒)
+    'HEARTBEAT_INTERVAL': 10,
+    # 外部step: 单次领取的最大step数
+    'EXTERNAL_CLAIM_MAX': 100,
+    # 外部step: 长轮询领取的最长等待时间(秒)
+    'EXTERNAL_CLAIM_MAX_WAIT': 30,
+    # 外部step: 长轮询领取的查询间隔(秒)
+    'EXTERNAL_CLAIM_POLL_INTERVAL': 1,
+    # payload卸载: step/task的input/output中超过该大小(字节)的顶层值写入blob存储, 行内只保存引用
+    'PAYLOAD_OFFLOAD_THRESHOLD': 256 * 1024,
+    # payload卸载: blob存储的根目录, 为None时不卸载
+    'PAYLOAD_STORE_ROOT': None,
+    # payload卸载: blob存储的实现
+    'PAYLOAD_STORE_BACKEND': 'seaflow.payload.FileSystemBlobStore',
+    # payload卸载: 进程内缓存的blob数量
+    'PAYLOAD_CACHE_SIZE': 32,
+    # 结果缓存: 默认有效期(秒), None表示不过期
+    'RESULT_CACHE_TTL': 7 * 24 * 3600,
+    # 结果缓存: 持久化的记录数上限, 超出时按最近访问时间淘汰, None表示不限制
+    'RESULT_CACHE_MAX_ENTRIES': 100000,
+    # 结果缓存: 进程内LRU缓存的记录数
+    'RESULT_CACHE_LRU_SIZE': 256,
+    # 结果缓存: 持久化的实现
+    'RESULT_CACHE_BACKEND': 'seaflow.cache.DatabaseResultBackend',
+    # 结果缓存: sweeper的执行间隔(秒)
+    'RESULT_CACHE_SWEEP_INTERVAL': 300,
+    # 结果缓存: sweeper每批删除的记录数
+    'RESULT_CACHE_SWEEP_BATCH': 1000,
+    # 并发与速率限制: sweeper的执行间隔(秒)
+    'LIMIT_SWEEP_INTERVAL': 1,
+    # 并发与速率限制: 每批派发/回收的记录数
+    'LIMIT_SWEEP_BATCH': 500,
+    # 调度器: 已派发未结束的step数上限, 为None时不开启调度器, 新的step直接投递, 见scheduling
+    'SCHEDULER_CAPACITY': None,
+    # 调度器: 同一优先级内公平调度的分组, root(按root task)/dag(按dag名称)
+    'SCHEDULER_FAIR_SHARE': 'root',
+    # 调度器: 每次调度最多派发的step数
+    'SCHEDULER_DISPATCH_BATCH': 500,
+    # 调度器: sweeper的执行间隔(秒)
+    'SCHEDULER_SWEEP_INTERVAL': 1,
+    # 准入控制: 执行中的root task数上限, 超出时新的root task进入排队, None表示不限制, 见admission
+    'ADMISSION_MAX_RUNNING': None,
+    # 准入控制: 按dag名称的执行中root task数上限, 例如{'etl': 5}
+    'ADMISSION_DAG_LIMITS': {},
+    # 准入控制: 排队的root task数上限, 超出时拒绝新的root task, None表示不限制
+    'ADMISSION_MAX_QUEUED': None,
+    # 准入控制: 每次准入最多检查的排队task数
+    'ADMISSION_BATCH': 500,
+    # 准入控制: sweeper的执行间隔(秒)
+    'ADMISSION_SWEEP_INTERVAL': 5,
+    # 批量创建task: 每批写入和投递的task数, 见Seaflow.create_task_batches
+    'BULK_CREATE_BATCH': 1000,
+    # 日志: input/output在日志中的记录方式, preview/full, 可在task/step config的log_payload中覆盖
+    'LOG_PAYLOAD': 'preview',
+    # 日志: payload预览的最大长度(字符), 超出部分截断
+    'LOG_PAYLOAD_PREVIEW_SIZE': 1024,
+    # 队列路由: 各类任务投递的队列, 值为None时使用celery默认队列, 见routing
+    # 默认全部使用celery默认队列, 独立的队列需要显式配置, 例如{'control': 'seaflow.control', 'Default': 'seaflow.action'},
+    # 配置后需要有worker消费这些队列(seaflow_workers或celery worker -Q)
+    'QUEUES': {
+        'control': None,
+        'advance': None,
+        'callback': None,
+        'timeout': None,
+        'Default': None,
+        'Carrier': None,
+        'External': None,
+    },
+    # 队列路由: seaflow_workers命令为各个队列启动的worker池, concurrency为None时使用cpu核数
+    'WORKER_POOLS': {
+        'control': {'concurrency': 2},
+        'advance': {'concurrency': 4},
+        'callback': {'concurrency': 2},
+        'timeout': {'concurrency': 1},
+        'Default': {'concurrency': None},
+        'Carrier': {'concurrency': 2},
+        'External': {'concurrency': 2},
+    },
+}
+
+
+def get(name):
+    return getattr(settings, 'SEAFLOW', {}).get(name, DEFAULTS[name])
@@ -6,6 +6,7 @@ from .utils import NameComparableEnum
 @unique
 class TaskStates(NameComparableEnum):
     PENDING = '等待中'
+    QUEUED = '排队中'  # root task等待准入, 见admission
     PROCESSING = '正在执行'
     SLEEP = '休眠'
     RETRY = '等待重试'
@@ -40,12 +41,12 @@ class TaskStates(NameComparableEnum):
 
     @classmethod
     def revocable_states(cls):
-        return [cls.PENDING, cls.PROCESSING, cls.RETRY]
+        return [cls.PENDING, cls.QUEUED, cls.PROCESSING, cls.RETRY]
 
     @classmethod
     def terminable_states(cls):
         # revoke状态的task下的可能还有正在执行的step
-        return [cls.PENDING, cls.PROCESSING,
+        return [cls.PENDING, cls.QUEUED, cls.PROCESSING,
                 cls.SLEEP, cls.REVOKE, cls.RETRY]
 
 
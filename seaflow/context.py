@@ -0,0 +1,176 @@
+"""
+root task的context存储
+    - 按key读取, 不加载整行task
+    - 按key局部写入, 每次写入context_version加1, 可基于version做乐观并发控制
+    - mysql/sqlite/postgresql使用数据库的json函数原子地局部更新, 其他数据库退化为基于version的读-改-写
+"""
+
+import json
+
+from django.db import connections, router
+from django.db.models import F, Func, JSONField
+from django.db.models.fields.json import KeyTransform
+
+from . import conf
+from .models import Task
+from .utils import ContextConflictException
+
+
+class JSONSetKeys(Func):
+    """
+    json字段的局部更新: 只设置指定的顶层key
+    """
+
+    def __init__(self, field, values):
+        self.values = values
+        super().__init__(F(field), output_field=JSONField())
+
+    def _set_args(self, compiler, connection, value_sql):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        params = list(params)
+        for k, v in self.values.items():
+            sql += ', %%s, %s' % value_sql
+            params += ['$."%s"' % k, json.dumps(v, ensure_ascii=False)]
+        return sql, params
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        sql, params = self._set_args(compiler, connection, "JSON_EXTRACT(%s, '$')")
+        return 'JSON_SET(%s)' % sql, params
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = self._set_args(compiler, connection, 'JSON(%s)')
+        return 'JSON_SET(%s)' % sql, params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        return '(%s || %%s::jsonb)' % sql, list(params) + [json.dumps(self.values, ensure_ascii=False)]
+
+
+class ContextStore(object):
+    """
+    root task的context存储
+    """
+
+    VENDORS = ('mysql', 'sqlite', 'postgresql')
+
+    def __init__(self, task_id):
+        """
+        :param task_id: root task id
+        """
+        self.task_id = task_id
+
+    def _queryset(self):
+        return Task.objects.filter(pk=self.task_id)
+
+    def _partial_update_supported(self, c):
+        vendor = connections[router.db_for_write(Task)].vendor
+        if vendor == 'postgresql':
+            return True
+        # mysql/sqlite的json path无法表示包含双引号或反斜杠的key
+        return vendor in self.VENDORS and not any('"' in str(k) or '\\' in str(k) for k in c)
+
+    def values(self, keys=None):
+        """
+        读取context, 只读取指定的顶层key
+        :param keys: list, 为None时读取整个context
+        :return: dict, 值为null的key视为不存在
+        """
+        if keys is None:
+            return self._queryset().values_list('context', flat=True).get()
+        if not keys:
+            return {}
+        row = self._queryset().values_list(*[KeyTransform(k, 'context') for k in keys]).get()
+        return {k: v for k, v in zip(keys, row) if v is not None}
+
+    def version(self):
+        return self._queryset().values_list('context_version', flat=True).get()
+
+    def update(self, c, version=None):
+        """
+        局部更新
+        :param c: dict
+        :param version: 期望的当前版本, 不为None时版本不一致则抛出ContextConflictException
+        :return: 更新后的版本, 未指定version时不额外查询, 返回None
+        """
+        if not c:
+            return version
+        if self._partial_update_supported(c):
+            qs = self._queryset()
+            if version is not None:
+                qs = qs.filter(context_version=version)
+            if not qs.update(context=JSONSetKeys('context', c), context_version=F('context_version') + 1):
+                raise ContextConflictException('context of task %s changed, expect version %s'
+                                               % (self.task_id, version))
+            return None if version is None else version + 1
+
+        # 读-改-写
+        for _ in range(conf.get('CONTEXT_WRITE_RETRIES')):
+            context, current = self._queryset().values_list('context', 'context_version').get()
+            if version is not None and current != version:
+                break
+            context.update(c)
+            if self._queryset().filter(context_version=current).update(context=context,
+                                                                      context_version=current + 1):
+                return current + 1
+        raise ContextConflictException('context of task %s changed, expect version %s' % (self.task_id, version))
+
+
+class SeaflowContext(object):
+    """
+    action中使用的context, 在一次调用内缓存已读取的key
+    """
+
+    def __init__(self, task_id=None, task=None):
+        """
+        :param task_id: root task id
+        :param task: models.Task, root task
+        """
+        self.store = ContextStore(task.id if task else task_id)
+        self._cache = {}
+        self._complete = False
+
+    def set(self, c, version=None):
+        """
+        局部更新
+        :param c: dict
+        :param version: 期望的当前版本, 用于乐观并发控制
+        :return: 更新后的版本
+        """
+
+        version = self.store.update(c, version=version)
+        self._cache.update(c)
+        return version
+
+    def version(self):
+        return self.store.version()
+
+    def get(self, key=None, default=None):
+        """
+        :param key: 为None时返回整个context
+        :param default:
+        :return:
+        """
+        if key is None:
+            if not self._complete:
+                self._cache = self.store.values()
+                self._complete = True
+            return self._cache
+        if key not in self._cache and not self._complete:
+            self._cache.update(self.store.values([key]))
+        return self._cache.get(key, default)
+
+    def __setitem__(self, key, value):
+        self.set({key: value})
+
+    def __getitem__(self, item):
+        value = self.get(item, default=KeyError)
+        if value is KeyError:
+            raise KeyError(item)
+        return value
+
+    def __contains__(self, item):
+        return self.get(item, default=KeyError) is not KeyError
+
+    def reload(self):
+        self._cache = {}
+        self._complete = False
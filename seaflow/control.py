@@ -0,0 +1,212 @@
+"""
+级联控制操作(revoke/terminate/sleep/awake)
+    - 通过Task.root一次查询得到整棵task树, 在内存中计算受影响的子树
+    - 按批执行SELECT ... FOR UPDATE锁定状态属于允许状态的行后UPDATE, 已被其他进程修改状态的行不会被覆盖,
+      只回调本次确实修改了状态的行
+    - 日志按批合并, celery任务通过一次control.revoke广播撤销
+"""
+
+from django.db import transaction
+from django.db.models import Case, FloatField, Q, Value, When
+from django.utils import timezone
+
+from .consts import ActionTypes, StepStates, TaskStates
+from .models import Step, Task
+from .seagull import Seagull
+from .routing import step_queue
+from .utils import get_func
+
+BATCH_SIZE = 500
+
+
+def _chunks(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _duration(tnow, start_time):
+    if not start_time:
+        return 0
+    duration = tnow - start_time
+    return float('%s.%s' % (duration.seconds, duration.microseconds))
+
+
+def _subtree(task, states):
+    """
+    计算受影响的task子树: 自task开始, 只沿状态属于states的task向下展开
+    :param task: models.Task
+    :param states: list
+    :return: {task_id: start_time}
+    """
+    root_id = task.root_id or task.id
+    children = {}
+    rows = {}
+    for _id, parent_id, state, start_time in Task.objects.filter(
+            Q(pk=root_id) | Q(root_id=root_id)).values_list('id', 'parent_id', 'state', 'start_time'):
+        children.setdefault(parent_id, []).append(_id)
+        rows[_id] = (state, start_time)
+
+    result = {}
+    stack = [task.id]
+    while stack:
+        _id = stack.pop()
+        state, start_time = rows[_id]
+        if state not in states:
+            continue
+        result[_id] = start_time
+        stack.extend(children.get(_id, []))
+    return result
+
+
+def _transit(model, rows, from_states, state, end=False):
+    """
+    批量修改状态
+    :param model: models.Task/models.Step
+    :param rows: {id: start_time}
+    :param from_states: 只修改状态属于from_states的行
+    :param state: 目标状态
+    :param end: 是否为结束状态, 结束状态同时记录end_time/duration
+    :return: 确实修改了状态的id
+    """
+    tnow = timezone.now()
+    changed = []
+    for ids in _chunks(rows):
+        with transaction.atomic():
+            ids = list(model.objects.select_for_update().filter(pk__in=ids, state__in=from_states)
+                       .values_list('id', flat=True))
+            if not ids:
+                continue
+            values = {'state': state, 'update_time': tnow}
+            if end:
+                values['end_time'] = tnow
+                values['deadline'] = None
+                values['retry_at'] = None
+                values['duration'] = Case(*[When(pk=_id, then=Value(_duration(tnow, rows[_id]))) for _id in ids],
+                                          default=Value(0.0), output_field=FloatField())
+            model.objects.filter(pk__in=ids).update(**values)
+        changed += ids
+    return changed
+
+
+def _do_callbacks(model, ids, state, log_merged=False):
+    """
+    对配置了callback的task/step执行状态回调
+    :param ids: 本次确实修改了状态的id, 见_transit
+    """
+    from .tasks import do_callback
+
+    prefix = 'TASK' if model is Task else 'STEP'
+    qs = model.objects.defer('logs').select_related('dag' if model is Task else 'node')
+    for chunk in _chunks(ids):
+        for m in qs.filter(pk__in=chunk):
+            cb = m.config.get('callback')
+            if not cb:
+                continue
+            data = m.to_json()
+            events = ['%s_STATE_%s' % (prefix, state)]
+            if log_merged:
+                events.append('%s_LOG_FLUSH' % prefix)
+            for event in events:
+                if cb['is_async']:
+                    do_callback.apply_async((cb['func'], event, data))
+                else:
+                    do_callback.apply((cb['func'], event, data))
+
+
+def revoke(task):
+    """
+    撤销task及其子task
+    :param task: models.Task
+    :return: 受影响的task id
+    """
+    tasks = _subtree(task, TaskStates.revocable_states())
+    if not tasks:
+        return []
+    changed = _transit(Task, tasks, TaskStates.revocable_states(), TaskStates.REVOKE, end=True)
+    _do_callbacks(Task, changed, TaskStates.REVOKE)
+    return list(tasks)
+
+
+def terminate(task, descendants_only=False):
+    """
+    终止task及其子task, 以及这些task下未结束的step
+    :param task: models.Task
+    :param descendants_only: 为True时不修改task本身的状态, 例如task超时
+    :return: 受影响的task id
+    """
+    from . import celery_app
+
+    tasks = _subtree(task, TaskStates.terminable_states())
+    if not tasks:
+        return []
+
+    steps = {}
+    identifiers = []
+    qs = Step.objects.filter(root_id=task.root_id or task.id, state__in=StepStates.terminable_states())
+    for ids in _chunks(tasks):
+        for _id, start_time, identifier, action_type in qs.filter(task_id__in=ids).values_list(
+                'id', 'start_time', 'identifier', 'node__action_type'):
+            steps[_id] = start_time
+            if identifier and action_type in [ActionTypes.Default, ActionTypes.Carrier]:
+                identifiers.append(identifier)
+
+    if descendants_only:
+        tasks.pop(task.id)
+    changed = _transit(Task, tasks, TaskStates.terminable_states(), TaskStates.TERMINATE, end=True)
+    changed_steps = _transit(Step, steps, StepStates.terminable_states(), StepStates.TERMINATE, end=True)
+
+    Seagull.merge_many(Task, tasks)
+    Seagull.merge_many(Step, steps)
+
+    if identifiers:
+        celery_app.control.revoke(identifiers, terminate=True)
+
+    _do_callbacks(Task, changed, TaskStates.TERMINATE, log_merged=True)
+    _do_callbacks(Step, changed_steps, StepStates.TERMINATE, log_merged=True)
+    return list(tasks)
+
+
+def sleep(task):
+    """
+    使task及其子task进入睡眠, 正在执行的step在下一次执行时检测到睡眠状态
+    :param task: models.Task
+    :return: 受影响的task id
+    """
+    tasks = _subtree(task, TaskStates.sleepable_states())
+    if not tasks:
+        return []
+    changed = _transit(Task, tasks, TaskStates.sleepable_states(), TaskStates.SLEEP)
+    _do_callbacks(Task, changed, TaskStates.SLEEP)
+    return list(tasks)
+
+
+def awake(task):
+    """
+    唤醒task及其子task, 并重新投递睡眠中的step
+    :param task: models.Task
+    :return: 受影响的task id
+    """
+    from . import tasks as celery_tasks
+
+    tasks = _subtree(task, [TaskStates.SLEEP])
+    if not tasks:
+        return []
+    changed = _transit(Task, tasks, [TaskStates.SLEEP], TaskStates.PROCESSING)
+    _do_callbacks(Task, changed, TaskStates.PROCESSING)
+
+    qs = Step.objects.filter(root_id=task.root_id or task.id, state=StepStates.SLEEP)
+    for ids in _chunks(tasks):
+        for _id, action_type, func, config in qs.filter(task_id__in=ids).values_list(
+                'id', 'node__action_type', 'node__action__func', 'config'):
+            if action_type == ActionTypes.Carrier:
+                # 旁路节点
+                f = celery_tasks.start_carrier_step
+            elif action_type == ActionTypes.External:
+                # 外部节点
+                f = celery_tasks.publish_external_step
+            else:
+                # 普通节点
+                f = get_func(func)
+            f.apply_async((_id,), queue=step_queue(config, action_type))
+    return list(tasks)
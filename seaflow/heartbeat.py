@@ -0,0 +1,72 @@
+"""
+step心跳
+长时间运行的action通过celery_action.heartbeat(progress)上报存活状态和进度, 写入seaflow_heartbeat
+    - 合并写入: 每个HEARTBEAT_INTERVAL(秒)最多写入一次, 期间的进度只保留最新的一次
+    - step config中配置了heartbeat_timeout时, 超过heartbeat_timeout没有心跳的step由超时sweeper触发超时
+    - 崩溃恢复sweeper不会恢复近期有心跳的step
+"""
+
+import datetime
+import time
+
+from django.db import IntegrityError
+from django.utils import timezone
+
+from . import conf
+from .models import Heartbeat
+
+
+class HeartbeatRecorder(object):
+    """
+    绑定在celery_action.heartbeat上
+    """
+
+    def __init__(self, step, interval=None):
+        """
+        :param step: models.Step
+        :param interval: 最小写入间隔(秒)
+        """
+        self.step_id = step.id
+        self.timeout = step.config.get('heartbeat_timeout')
+        self.interval = conf.get('HEARTBEAT_INTERVAL') if interval is None else interval
+        self.progress = None
+        self._last = 0
+        self._dirty = False
+
+    def __call__(self, progress=None):
+        """
+        :param progress: 可选的进度, 例如{'done': 10, 'total': 100}
+        :return: bool, 是否写入
+        """
+        if progress is not None:
+            self.progress = progress
+        self._dirty = True
+        if time.time() - self._last < self.interval:
+            return False
+        self.flush()
+        return True
+
+    def flush(self, final=False):
+        """
+        写入未写入的心跳
+        :param final: action执行结束, 不再需要心跳超时
+        """
+        if not self._dirty:
+            if final and (self.timeout or self._last):
+                # 最近一次心跳已写入, 仍需清除超时时间; 没有心跳超时且没有写入过心跳时无需清除
+                Heartbeat.objects.filter(step_id=self.step_id).update(expire_time=None)
+            return
+        now = timezone.now()
+        values = {
+            'beat_time': now,
+            'expire_time': now + datetime.timedelta(seconds=self.timeout) if self.timeout and not final else None,
+        }
+        if self.progress is not None:
+            values['progress'] = self.progress
+        if not Heartbeat.objects.filter(step_id=self.step_id).update(**values):
+            try:
+                Heartbeat.objects.create(step_id=self.step_id, **values)
+            except IntegrityError:
+                Heartbeat.objects.filter(step_id=self.step_id).update(**values)
+        self._last = time.time()
+        self._dirty = False
@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models.fields.json import KeyTransform
+
+from .models import IterContext, Node
+
+
+class IterCursor(object):
+    """
+    迭代游标
+    迭代序列只在IterContext中保存一份, 每个迭代的step/task的extra中只保存游标:
+        {'iter_cursor': {'id': <IterContext.id>, 'key': <iter key>, 'length': <序列长度>}}
+    兼容旧数据: extra中直接保存了完整序列的 {'iter_context': {'key': ..., 'sequence': [...]}}
+
+    iter_config.parallelism > 1 时为并行迭代:
+        各个迭代的输入互不依赖(均为首个迭代的输入, iter key替换为序列中对应的元素),
+        最多parallelism个迭代同时执行, 按序列顺序交接, 全部完成后才标记最后一个迭代为iter_end,
+        并将其output替换为按iter_index顺序合并的各迭代输出({key: [迭代0的值, 迭代1的值, ...]}), 与fission的合并方式相同
+    """
+
+    def __init__(self, context_id=None, key=None, length=0, parallelism=1, sequence=None):
+        self.context_id = context_id
+        self.key = key
+        self.length = length
+        self.parallelism = parallelism
+        self.sequence = sequence  # 仅旧数据有
+
+    @staticmethod
+    def parallelism_of(ref):
+        """
+        :param ref: models.Node/models.Dag
+        :return:
+        """
+        return max(int(ref.iter_config.get('parallelism') or 1), 1)
+
+    @classmethod
+    def create(cls, task, ref, fission_index, key, sequence, inputs=None):
+        """
+        :param task: models.Task, node/dag所在的task
+        :param ref: models.Node/models.Dag
+        :param fission_index:
+        :param key: iter key
+        :param sequence: 迭代序列
+        :param inputs: 首个迭代的输入, 并行迭代时使用
+        :return: IterCursor
+        """
+        parallelism = cls.parallelism_of(ref)
+        ctx, _ = IterContext.objects.get_or_create(
+            defaults=dict(
+                key=key,
+                sequence=sequence,
+                length=len(sequence),
+                parallelism=parallelism,
+                inputs=(inputs or {}) if parallelism > 1 else {},
+            ),
+            task=task,
+            ref_type='NODE' if isinstance(ref, Node) else 'DAG',
+            ref_id=ref.id,
+            fission_index=fission_index,
+        )
+        return cls(context_id=ctx.id, key=ctx.key, length=ctx.length, parallelism=ctx.parallelism)
+
+    @classmethod
+    def from_extra(cls, extra):
+        """
+        :param extra: step/task的extra
+        :return: IterCursor
+        """
+        if 'iter_cursor' in extra:
+            c = extra['iter_cursor']
+            return cls(context_id=c['id'], key=c['key'], length=c['length'], parallelism=c.get('parallelism', 1))
+        # 旧数据
+        c = extra['iter_context']
+        return cls(key=c['key'], length=len(c['sequence']), sequence=c['sequence'])
+
+    def to_extra(self):
+        if self.context_id is None:
+            return {'iter_context': {'key': self.key, 'sequence': self.sequence}}
+        c = {'id': self.context_id, 'key': self.key, 'length': self.length}
+        if self.windowed:
+            c['parallelism'] = self.parallelism
+        return {'iter_cursor': c}
+
+    @property
+    def windowed(self):
+        return self.parallelism > 1
+
+    def item(self, index):
+        """
+        读取序列中的第index个元素, 只读取这一个元素而不是整个序列
+        :param index:
+        :return:
+        """
+        if self.sequence is not None:
+            return self.sequence[index]
+        return IterContext.objects.filter(pk=self.context_id) \
+            .annotate(item=KeyTransform(str(index), 'sequence')) \
+            .values_list('item', flat=True).get()
+
+    def inputs(self, index):
+        """
+        并行迭代中第index个迭代的输入
+        :param index:
+        :return:
+        """
+        inputs = IterContext.objects.filter(pk=self.context_id).values_list('inputs', flat=True).get()
+        inputs[self.key] = self.item(index)
+        return inputs
+
+    def is_end(self, index):
+        if self.windowed:
+            # 并行迭代的iter_end由窗口交接时设置
+            return False
+        return index == self.length - 1
+
+    def advance(self, completed):
+        """
+        滑动窗口: 按序交接已完成的迭代, 并补足窗口内执行中的迭代
+        :param completed: 该游标下已完成迭代的QuerySet(Step/Task)
+        :return:
+            launch: list, 需要派发的迭代序号
+            handed_off: bool, 是否由本次调用完成了全部迭代的交接
+        """
+        with transaction.atomic():
+            ctx = IterContext.objects.select_for_update().get(pk=self.context_id)
+            done = set(completed.filter(iter_index__gte=ctx.handoff_index).values_list('iter_index', flat=True))
+            handoff_index = ctx.handoff_index
+            while handoff_index in done:
+                handoff_index += 1
+            next_index = max(ctx.next_index, min(handoff_index + ctx.parallelism, ctx.length))
+            launch = list(range(ctx.next_index, next_index))
+            handed_off = ctx.handoff_index < ctx.length == handoff_index
+            if launch or handoff_index != ctx.handoff_index:
+                IterContext.objects.filter(pk=ctx.pk).update(handoff_index=handoff_index, next_index=next_index)
+
+        return launch, handed_off
@@ -0,0 +1,172 @@
+"""
+action并发与速率限制
+在action dsl的limit中配置, 可在StepConfig的limit中按node覆盖, 例如:
+    {
+        'concurrency': 10,  # 同时执行的step数上限
+        'rate': 5,  # 令牌桶: 每秒派发的step数
+        'burst': 10,  # 令牌桶容量, 默认为max(rate, 1)
+        'key': 'svc-a',  # 限制的范围, 默认按action, 多个action使用相同的key时共享同一个限制
+    }
+StepConfig中limit为False时关闭
+
+    - SeaflowStep._apply派发前获取槽位(StepSlot)和令牌, 获取不到时记入待派发表(PendingDispatch), 不投递到broker
+    - 待派发的step按先进先出的顺序派发, 新的step在有待派发的step时直接排队
+    - step结束时释放槽位, 并派发同一个key下最早的待派发step; 等待重试的step保留槽位, 重试时不再获取;
+      task重试/恢复时重新执行的失败step已释放槽位, 与新的step一样重新获取
+    - celery beat周期性地执行sweep_limits: 按令牌桶的补充派发待派发的step, 回收已结束(例如被批量终止)的step占用的槽位
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import conf
+from .consts import StepStates
+from .models import Limiter, PendingDispatch, StepSlot
+
+
+def policy(action, config):
+    """
+    :param action: models.Action
+    :param config: StepConfig
+    :return: 限制策略, 未开启时返回None
+    """
+    p = (config or {}).get('limit')
+    if p is False:
+        return None
+    if p is None:
+        return action.limit
+    return dict(action.limit or {}, **(p if isinstance(p, dict) else {}))
+
+
+def scope(action, p):
+    return p.get('key') or 'action:%s' % action.name
+
+
+def _lock(key, p=None):
+    """
+    :param key:
+    :param p: 限制策略, 更新到limiter上供sweeper使用
+    :return: models.Limiter, 已加锁, 不存在时返回None
+    """
+    if p is not None:
+        Limiter.objects.get_or_create(key=key)
+    limiter = Limiter.objects.select_for_update().filter(key=key).first()
+    if limiter and p is not None:
+        limiter.concurrency = p.get('concurrency')
+        limiter.rate = p.get('rate')
+        limiter.burst = p.get('burst')
+    return limiter
+
+
+def _available(limiter, now):
+    """
+    补充令牌, 计算当前可派发的step数
+    :return: int, None表示不限制
+    """
+    n = None
+    if limiter.concurrency:
+        n = max(limiter.concurrency - StepSlot.objects.filter(key=limiter.key).count(), 0)
+    if limiter.rate:
+        burst = limiter.burst or max(limiter.rate, 1)
+        if limiter.refill_time is None:
+            limiter.tokens = burst
+        else:
+            elapsed = max((now - limiter.refill_time).total_seconds(), 0)
+            limiter.tokens = min(burst, limiter.tokens + elapsed * limiter.rate)
+        limiter.refill_time = now
+        n = int(limiter.tokens) if n is None else min(n, int(limiter.tokens))
+    return n
+
+
+def _grant(limiter, step_ids):
+    StepSlot.objects.bulk_create([StepSlot(key=limiter.key, step_id=_id) for _id in step_ids])
+    if limiter.rate:
+        limiter.tokens -= len(step_ids)
+
+
+def acquire(step):
+    """
+    派发前获取槽位和令牌
+    :param step: models.Step, 需要已加载node.action
+    :return: True: 可以派发; False: 已记入待派发表
+    """
+    p = policy(step.node.action, step.config)
+    if not p:
+        return True
+    key = scope(step.node.action, p)
+    with transaction.atomic():
+        limiter = _lock(key, p)
+        if StepSlot.objects.filter(step_id=step.id).exists():
+            # 已持有槽位
+            return True
+        n = _available(limiter, timezone.now())
+        if (n is None or n > 0) and not PendingDispatch.objects.filter(key=key).exists():
+            _grant(limiter, [step.id])
+            limiter.save()
+            return True
+        PendingDispatch.objects.get_or_create(step_id=step.id, defaults={'key': key})
+        limiter.save()
+        return False
+
+
+def drain(key):
+    """
+    派发key下可派发的待派发step
+    :param key:
+    :return: 派发的step数
+    """
+    from .base import SeaflowStep
+
+    with transaction.atomic():
+        limiter = _lock(key)
+        if limiter is None:
+            return 0
+        n = _available(limiter, timezone.now())
+        limit = conf.get('LIMIT_SWEEP_BATCH') if n is None else min(n, conf.get('LIMIT_SWEEP_BATCH'))
+        ids = []
+        while limit > 0:
+            rows = list(PendingDispatch.objects.filter(key=key).order_by('id')
+                        .values_list('step_id', 'step__state')[:limit])
+            if rows:
+                PendingDispatch.objects.filter(step_id__in=[_id for _id, _ in rows]).delete()
+            # 排队期间被撤销/终止的step不再派发, 也不占用本次派发的数量; 重试/恢复的失败step为RETRY状态
+            alive = [_id for _id, state in rows if state in [StepStates.PENDING, StepStates.RETRY]]
+            ids += alive
+            if len(rows) < limit:
+                break
+            limit -= len(alive)
+        _grant(limiter, ids)
+        limiter.save()
+    for _id in ids:
+        SeaflowStep.get(_id, profile='dispatch')._submit()
+    return len(ids)
+
+
+def release(step_ids):
+    """
+    step结束: 释放槽位, 派发同一个key下的待派发step
+    :param step_ids:
+    :return: 派发的step数
+    """
+    keys = set(StepSlot.objects.filter(step_id__in=step_ids).values_list('key', flat=True))
+    if not keys:
+        return 0
+    StepSlot.objects.filter(step_id__in=step_ids).delete()
+    return sum(drain(key) for key in keys)
+
+
+def sweep():
+    """
+    回收已结束的step占用的槽位, 清理已结束的待派发step, 按令牌桶的补充派发待派发的step
+    :return: 派发的step数
+    """
+    batch = conf.get('LIMIT_SWEEP_BATCH')
+    ended = list(StepSlot.objects.filter(step__state__in=StepStates.end_states())
+                 .values_list('step_id', flat=True)[:batch])
+    count = release(ended) if ended else 0
+    PendingDispatch.objects.filter(
+        pk__in=list(PendingDispatch.objects.filter(step__state__in=StepStates.end_states())
+                    .values_list('id', flat=True)[:batch])).delete()
+    for key in set(PendingDispatch.objects.values_list('key', flat=True).distinct()):
+        count += drain(key)
+    return count
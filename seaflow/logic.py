@@ -0,0 +1,220 @@
+"""
+jsonLogic条件编译
+条件只编译一次为python闭包, 并按node/dag缓存; 求值时只解析条件中引用到的var路径
+运算的语义与json_logic一致: 除短路求值的if/and/or外, 运算都直接调用json_logic.operations
+"""
+
+import threading
+from collections import OrderedDict
+
+from json_logic import jsonLogic, operations
+
+from . import conf
+
+# 作用域运算在元素上求值, 交给jsonLogic
+_SCOPED = ('filter', 'map', 'reduce', 'all', 'none', 'some')
+
+
+def _path_parts(path):
+    if path is None or path == '':
+        return []
+    return str(path).split('.')
+
+
+def _is_static(value):
+    """
+    不包含运算的值
+    """
+    if isinstance(value, dict):
+        return False
+    if isinstance(value, list):
+        return all(_is_static(x) for x in value)
+    return True
+
+
+class ConditionData(object):
+    """
+    条件求值的数据
+    内存中已有的数据直接引用, context按需读取, 只读取条件中引用到的顶层key
+    实现了__getitem__, json_logic的var/missing可以直接在上面取值
+    """
+
+    def __init__(self, context_loader=None, context_keys=None, **sources):
+        """
+        :param context_loader: callable(keys) -> dict, keys为None时读取整个context
+        :param context_keys: 需要读取的context顶层key
+        :param sources: index, input, output...
+        """
+        self.sources = sources
+        self.context_loader = context_loader
+        self.context_keys = context_keys
+        self._context = None
+
+    @property
+    def context(self):
+        if self._context is None:
+            self._context = self.context_loader(self.context_keys) if self.context_loader else {}
+        return self._context
+
+    def __getitem__(self, key):
+        if key == 'context':
+            return self.context
+        return self.sources[key]
+
+    def resolve(self, path, default=None):
+        """
+        与jsonLogic的var相同, 只读取路径上的数据
+        """
+        if not _path_parts(path):
+            return self.materialize()
+        return operations['var'](self, path, default)
+
+    def materialize(self):
+        d = dict(self.sources)
+        d['context'] = self.context
+        return d
+
+
+class Condition(object):
+    """
+    编译后的jsonLogic条件
+    """
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.vars = set()
+        self.dynamic = False  # 存在无法静态确定的var路径时需要完整的context
+        self.func = self._compile(rule)
+
+    @property
+    def context_keys(self):
+        """
+        :return: 条件中引用到的context顶层key, None表示需要整个context
+        """
+        if self.dynamic:
+            return None
+        keys = set()
+        for parts in self.vars:
+            if not parts:
+                return None
+            if parts[0] == 'context':
+                if len(parts) == 1:
+                    return None
+                keys.add(parts[1])
+        return sorted(keys)
+
+    def __call__(self, data):
+        """
+        :param data: ConditionData
+        :return:
+        """
+        return self.func(data)
+
+    def _compile(self, rule):
+        if isinstance(rule, list):
+            items = [self._compile(x) for x in rule]
+            return lambda data: [f(data) for f in items]
+        if not (isinstance(rule, dict) and len(rule) == 1):
+            return lambda data: rule
+
+        op, values = next(iter(rule.items()))
+        if not isinstance(values, list):
+            values = [values]
+
+        if op == 'var':
+            return self._compile_var(values)
+        if op in ('missing', 'missing_some'):
+            return self._compile_missing(op, values)
+
+        args = [self._compile(x) for x in values]
+        if op in ('if', '?:'):
+            def _if(data):
+                for i in range(0, len(args) - 1, 2):
+                    if args[i](data):
+                        return args[i + 1](data)
+                if len(args) % 2:
+                    return args[-1](data)
+                return None
+
+            return _if
+        if op == 'and':
+            def _and(data):
+                v = False
+                for f in args:
+                    v = f(data)
+                    if not v:
+                        return v
+                return v
+
+            return _and
+        if op == 'or':
+            def _or(data):
+                v = False
+                for f in args:
+                    v = f(data)
+                    if v:
+                        return v
+                return v
+
+            return _or
+        if op not in _SCOPED and op in operations:
+            fn = operations[op]
+            return lambda data: fn(*[f(data) for f in args])
+
+        # 作用域运算(map/filter/reduce等)和带点的自定义运算交给jsonLogic, 需要完整数据
+        self.dynamic = True
+        return lambda data: jsonLogic(rule, data.materialize())
+
+    def _compile_var(self, values):
+        path = values[0] if values else None
+        default = values[1] if len(values) > 1 else None
+        if isinstance(path, (dict, list)):
+            self.dynamic = True
+        else:
+            self.vars.add(tuple(_path_parts(path)))
+        path_f, default_f = self._compile(path), self._compile(default)
+        return lambda data: data.resolve(path_f(data), default_f(data))
+
+    def _compile_missing(self, op, values):
+        if not _is_static(values):
+            self.dynamic = True
+            return lambda data: jsonLogic({op: values}, data.materialize())
+        keys = values[1] if op == 'missing_some' else (
+            values[0] if values and isinstance(values[0], list) else values)
+        for k in keys:
+            self.vars.add(tuple(_path_parts(k)))
+        fn = operations[op]
+        return lambda data: fn(data, *values)
+
+
+class ConditionCache(object):
+    """
+    编译后条件的缓存, 按(node/dag, 配置项)缓存, node/dag更新后自动失效
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, ref, name, rule):
+        """
+        :param ref: models.Node/models.Dag
+        :param name: 配置项, 例如loop_config
+        :param rule: jsonLogic rule
+        :return: Condition
+        """
+        key = (ref.__class__.__name__, ref.id, ref.update_time, name)
+        with self._lock:
+            c = self._items.get(key)
+            if c is not None:
+                self._items.move_to_end(key)
+                return c
+        c = Condition(rule)
+        with self._lock:
+            self._items[key] = c
+            while len(self._items) > conf.get('CONDITION_CACHE_SIZE'):
+                self._items.popitem(last=False)
+        return c
+
+
+conditions = ConditionCache()
@@ -0,0 +1,89 @@
+import multiprocessing
+import signal
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from seaflow import conf, routing
+
+
+class Command(BaseCommand):
+    help = 'Starts one celery worker pool per seaflow queue, sized by SEAFLOW["WORKER_POOLS"]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-A', '--app', required=True, help='celery app, 例如seahub.celery')
+        parser.add_argument('--only', help='只启动指定的worker池, 逗号分隔, 例如control,advance,Default')
+        parser.add_argument('--pool', action='append', default=[], metavar='QUEUE=CONCURRENCY',
+                            help='额外的队列, 例如step config中通过queue覆盖的队列, 可重复')
+        parser.add_argument('--beat', action='store_true', help='同时启动celery beat, 周期性执行各类sweeper')
+        parser.add_argument('--loglevel', default='INFO')
+        parser.add_argument('--dry-run', action='store_true', help='只打印启动命令')
+
+    def _pools(self, options):
+        """
+        :return: {queue: (name, pool config)}, 多个角色共用一个队列时只启动一个池, 取较大的并发数
+        """
+        pools = conf.get('WORKER_POOLS')
+        names = options['only'].split(',') if options['only'] else list(pools)
+        result = {}
+        for name in names:
+            if name not in pools:
+                raise CommandError('unknown worker pool: %s' % name)
+            queue = routing.queue(name) or 'celery'
+            config = dict(pools[name])
+            config['concurrency'] = config.get('concurrency') or multiprocessing.cpu_count()
+            if queue in result:
+                # 共用的池以队列命名
+                config['concurrency'] = max(config['concurrency'], result[queue][1]['concurrency'])
+                name = queue
+            result[queue] = (name, config)
+        for item in options['pool']:
+            queue, _, concurrency = item.partition('=')
+            try:
+                result[queue] = (queue, {'concurrency': int(concurrency or multiprocessing.cpu_count())})
+            except ValueError:
+                raise CommandError('invalid pool: %s' % item)
+        return result
+
+    def _commands(self, options):
+        commands = []
+        for queue, (name, config) in self._pools(options).items():
+            cmd = [sys.executable, '-m', 'celery', '-A', options['app'], 'worker',
+                   '-Q', queue,
+                   '-c', str(config['concurrency']),
+                   '-n', 'seaflow-%s@%%h' % name.lower(),
+                   '-l', options['loglevel']]
+            if config.get('pool'):
+                cmd += ['-P', config['pool']]
+            if config.get('prefetch_multiplier'):
+                cmd += ['--prefetch-multiplier', str(config['prefetch_multiplier'])]
+            commands.append(cmd)
+        if options['beat']:
+            commands.append([sys.executable, '-m', 'celery', '-A', options['app'], 'beat', '-l', options['loglevel']])
+        return commands
+
+    def handle(self, *args, **options):
+        commands = self._commands(options)
+        for cmd in commands:
+            self.stdout.write(' '.join(cmd))
+        if options['dry_run']:
+            return
+
+        processes = [subprocess.Popen(cmd) for cmd in commands]
+
+        def _stop(signum, frame):
+            for p in processes:
+                if p.poll() is None:
+                    p.send_signal(signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        # 任意一个池退出时停止其他池
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+        _stop(None, None)
+        codes = [p.wait() for p in processes]
+        sys.exit(next((c for c in codes if c), 0))
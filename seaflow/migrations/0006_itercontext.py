@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0005_node_input_def_node_output_def'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IterContext',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('ref_type', models.CharField(choices=[('NODE', 'Node'), ('DAG', 'Dag')], max_length=16)),
+                ('ref_id', models.IntegerField()),
+                ('fission_index', models.IntegerField(default=0, verbose_name='分裂序号')),
+                ('key', models.CharField(max_length=128)),
+                ('sequence', models.JSONField(default=list, verbose_name='迭代序列')),
+                ('length', models.IntegerField(default=0, verbose_name='序列长度')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('task', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='iter_contexts', to='seaflow.task')),
+            ],
+            options={
+                'verbose_name': '迭代上下文',
+                'verbose_name_plural': '迭代上下文',
+                'db_table': 'seaflow_iter_context',
+                'managed': True,
+                'unique_together': {('task', 'ref_type', 'ref_id', 'fission_index')},
+            },
+        ),
+    ]
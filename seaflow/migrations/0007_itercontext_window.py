@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0006_itercontext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itercontext',
+            name='handoff_index',
+            field=models.IntegerField(default=0, verbose_name='已按序完成的迭代数'),
+        ),
+        migrations.AddField(
+            model_name='itercontext',
+            name='inputs',
+            field=models.JSONField(default=dict, verbose_name='迭代输入'),
+        ),
+        migrations.AddField(
+            model_name='itercontext',
+            name='next_index',
+            field=models.IntegerField(default=1, verbose_name='下一个派发的迭代序号'),
+        ),
+        migrations.AddField(
+            model_name='itercontext',
+            name='parallelism',
+            field=models.IntegerField(default=1, verbose_name='并行度'),
+        ),
+    ]
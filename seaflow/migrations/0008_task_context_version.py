@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0007_itercontext_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='context_version',
+            field=models.IntegerField(default=0, verbose_name='上下文版本'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0008_task_context_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='step',
+            name='deadline',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='超时时间'),
+        ),
+    ]
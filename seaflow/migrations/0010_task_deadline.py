@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0009_step_deadline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='deadline',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='超时时间'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0010_task_deadline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='step',
+            name='retry_at',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='重试时间'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='retry_at',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='重试时间'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0011_retry_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='step',
+            index=models.Index(fields=['state', 'update_time'], name='seaflow_ste_state_24c07c_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0012_step_state_update_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Heartbeat',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('beat_time', models.DateTimeField(db_index=True, verbose_name='最近心跳时间')),
+                ('expire_time', models.DateTimeField(db_index=True, null=True, verbose_name='心跳超时时间')),
+                ('progress', models.JSONField(null=True, verbose_name='进度')),
+                ('step', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='heartbeat', to='seaflow.step')),
+            ],
+            options={
+                'verbose_name': 'step心跳',
+                'verbose_name_plural': 'step心跳',
+                'db_table': 'seaflow_heartbeat',
+                'managed': True,
+            },
+        ),
+    ]
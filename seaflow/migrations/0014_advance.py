@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0013_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Advance',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('ref_type', models.CharField(choices=[('NODE', 'Node'), ('DAG', 'Dag')], max_length=16)),
+                ('ref_id', models.IntegerField()),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('task', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='advances', to='seaflow.task')),
+            ],
+            options={
+                'verbose_name': '后继调度记录',
+                'verbose_name_plural': '后继调度记录',
+                'db_table': 'seaflow_advance',
+                'managed': True,
+                'unique_together': {('task', 'ref_type', 'ref_id')},
+            },
+        ),
+    ]
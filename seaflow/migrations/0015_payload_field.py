@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:03
+
+import seaflow.payload
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0014_advance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='step',
+            name='input',
+            field=seaflow.payload.PayloadField(verbose_name='输入'),
+        ),
+        migrations.AlterField(
+            model_name='step',
+            name='output',
+            field=seaflow.payload.PayloadField(default=dict, verbose_name='输出'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='input',
+            field=seaflow.payload.PayloadField(verbose_name='输入'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='output',
+            field=seaflow.payload.PayloadField(default=dict, verbose_name='输出'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:09
+
+import django.db.models.deletion
+import seaflow.payload
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0015_payload_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='action',
+            name='cache',
+            field=models.JSONField(default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='ResultCache',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('output', seaflow.payload.PayloadField(default=dict, verbose_name='输出')),
+                ('hits', models.IntegerField(default=0, verbose_name='命中次数')),
+                ('expire_time', models.DateTimeField(db_index=True, null=True, verbose_name='过期时间')),
+                ('access_time', models.DateTimeField(db_index=True, verbose_name='最近访问时间')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('action', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='results', to='seaflow.action')),
+            ],
+            options={
+                'verbose_name': '结果缓存',
+                'verbose_name_plural': '结果缓存',
+                'db_table': 'seaflow_result_cache',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0016_result_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Limiter',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=128, unique=True)),
+                ('concurrency', models.IntegerField(null=True, verbose_name='并发上限')),
+                ('rate', models.FloatField(null=True, verbose_name='每秒派发数')),
+                ('burst', models.FloatField(null=True, verbose_name='令牌桶容量')),
+                ('tokens', models.FloatField(default=0, verbose_name='剩余令牌')),
+                ('refill_time', models.DateTimeField(null=True, verbose_name='最近补充令牌时间')),
+                ('update_time', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': '并发与速率限制',
+                'verbose_name_plural': '并发与速率限制',
+                'db_table': 'seaflow_limiter',
+                'managed': True,
+            },
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='limit',
+            field=models.JSONField(default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='PendingDispatch',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(db_index=True, max_length=128)),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('step', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pending_dispatch', to='seaflow.step')),
+            ],
+            options={
+                'verbose_name': '待派发step',
+                'verbose_name_plural': '待派发step',
+                'db_table': 'seaflow_pending_dispatch',
+                'managed': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='StepSlot',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(db_index=True, max_length=128)),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('step', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='slot', to='seaflow.step')),
+            ],
+            options={
+                'verbose_name': '并发槽位',
+                'verbose_name_plural': '并发槽位',
+                'db_table': 'seaflow_step_slot',
+                'managed': True,
+            },
+        ),
+    ]
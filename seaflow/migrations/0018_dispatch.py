@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0017_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dispatch',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('root_id', models.IntegerField(db_index=True)),
+                ('group', models.CharField(db_index=True, max_length=128, verbose_name='公平调度分组')),
+                ('priority', models.IntegerField(db_index=True, verbose_name='优先级')),
+                ('weight', models.FloatField(default=1, verbose_name='权重')),
+                ('eligible_at', models.DateTimeField(db_index=True, verbose_name='可派发时间')),
+                ('dispatch_time', models.DateTimeField(db_index=True, null=True, verbose_name='派发时间')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('step', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='dispatch', to='seaflow.step')),
+            ],
+            options={
+                'verbose_name': '调度',
+                'verbose_name_plural': '调度',
+                'db_table': 'seaflow_dispatch',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seaflow', '0018_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='admit_time',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='准入时间'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='state',
+            field=models.CharField(choices=[('PENDING', '等待中'), ('QUEUED', '排队中'), ('PROCESSING', '正在执行'), ('SLEEP', '休眠'), ('RETRY', '等待重试'), ('SKIP', '跳过'), ('TIMEOUT', '超时'), ('SUCCESS', '成功'), ('ERROR', '错误'), ('REVOKE', '撤销'), ('TERMINATE', '终止')], db_index=True, max_length=64),
+        ),
+    ]
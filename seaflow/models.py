@@ -1,16 +1,43 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+from . import payload
 from .consts import TaskStates, StepStates, ActionTypes
 
 
 class BaseModel(models.Model):
 
     def update(self, _refresh=True, **kwargs):
+        # queryset.update不会自动更新auto_now字段
+        for f in self._meta.concrete_fields:
+            if getattr(f, 'auto_now', False):
+                kwargs.setdefault(f.name, timezone.now())
         self.__class__.objects.filter(pk=self.pk).update(**kwargs)
         if _refresh:
             self.refresh_from_db()
 
+    def transit(self, from_states, _where=None, **kwargs):
+        """
+        状态的compare-and-set: UPDATE ... WHERE id=? AND state IN (from_states)
+        并发的多个调用者中只有一个能成功, 成功后直接修改内存中的实例, 不重新查询
+        :param from_states: 允许的当前状态
+        :param _where: 附加的条件, 例如{'identifier': ...}
+        :param kwargs: 要修改的字段, 不支持表达式
+        :return: bool, 是否成功
+        """
+        for f in self._meta.concrete_fields:
+            if getattr(f, 'auto_now', False):
+                kwargs.setdefault(f.name, timezone.now())
+            elif isinstance(f, payload.PayloadField) and f.name in kwargs:
+                # 先卸载, 内存中保存与行内相同的引用, 访问时再解析
+                kwargs[f.name] = payload.offload(kwargs[f.name])
+        if not self.__class__.objects.filter(pk=self.pk, state__in=from_states, **(_where or {})).update(**kwargs):
+            return False
+        for k, v in kwargs.items():
+            setattr(self, k, self._meta.get_field(k).to_python(v))
+        return True
+
     class Meta:
         abstract = True
 
@@ -29,6 +56,10 @@ class Action(BaseModel):
     func = models.CharField(max_length=128, unique=True, null=True)
     input_def = models.JSONField(default=dict)
     output_def = models.JSONField(default=dict)
+    # 结果缓存策略, None表示不缓存, 见cache
+    cache = models.JSONField(null=True, default=None)
+    # 并发与速率限制, None表示不限制, 见limits
+    limit = models.JSONField(null=True, default=None)
 
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
@@ -195,9 +226,10 @@ class Task(BaseModel):
     # 循环
     loop_index = models.IntegerField('循环序号', db_index=True, default=0)
 
-    input = models.JSONField('输入')
+    input = payload.PayloadField('输入')
     context = models.JSONField('上下文', default=dict)
-    output = models.JSONField('输出', default=dict)
+    context_version = models.IntegerField('上下文版本', default=0)
+    output = payload.PayloadField('输出', default=dict)
 
     extra = models.JSONField(default=dict)
 
@@ -209,6 +241,9 @@ class Task(BaseModel):
     start_time = models.DateTimeField(null=True)
     end_time = models.DateTimeField(null=True)
     duration = models.FloatField(null=True)
+    deadline = models.DateTimeField('超时时间', null=True, db_index=True)
+    retry_at = models.DateTimeField('重试时间', null=True, db_index=True)
+    admit_time = models.DateTimeField('准入时间', null=True, db_index=True)
 
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
@@ -286,6 +321,10 @@ class Task(BaseModel):
 
     def to_json(self, *args, **kwargs):
         d = self.to_dict(*args, **kwargs)
+        # 已卸载的payload只传递引用
+        for name in ('input', 'output'):
+            if name in d:
+                d[name] = payload.raw(self, name)
         d.pop('start_time', None)
         d.pop('end_time', None)
         d.pop('create_time', None)
@@ -333,8 +372,8 @@ class Step(BaseModel):
     # 循环
     loop_index = models.IntegerField('循环序号', db_index=True, default=0)
 
-    input = models.JSONField('输入')
-    output = models.JSONField('输出', default=dict)
+    input = payload.PayloadField('输入')
+    output = payload.PayloadField('输出', default=dict)
 
     extra = models.JSONField(default=dict)
 
@@ -346,6 +385,8 @@ class Step(BaseModel):
     start_time = models.DateTimeField(null=True)
     end_time = models.DateTimeField(null=True)
     duration = models.FloatField(null=True)
+    deadline = models.DateTimeField('超时时间', null=True, db_index=True)
+    retry_at = models.DateTimeField('重试时间', null=True, db_index=True)
 
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
@@ -420,6 +461,10 @@ class Step(BaseModel):
 
     def to_json(self, *args, **kwargs):
         d = self.to_dict(*args, **kwargs)
+        # 已卸载的payload只传递引用
+        for name in ('input', 'output'):
+            if name in d:
+                d[name] = payload.raw(self, name)
         d.pop('start_time', None)
         d.pop('end_time', None)
         d.pop('create_time', None)
@@ -432,6 +477,7 @@ class Step(BaseModel):
         verbose_name = '任务步骤'
         verbose_name_plural = verbose_name
         unique_together = ['task', 'node', 'fission_index', 'iter_index']
+        indexes = [models.Index(fields=['state', 'update_time'])]
 
 
 class Log(BaseModel):
@@ -450,3 +496,178 @@ class Log(BaseModel):
         db_table = 'seaflow_log'
         verbose_name = '日志'
         verbose_name_plural = verbose_name
+
+
+class Heartbeat(BaseModel):
+    """
+    step心跳
+    """
+
+    id = models.AutoField(primary_key=True)
+    step = models.OneToOneField('Step', db_constraint=False, related_name='heartbeat', on_delete=models.CASCADE)
+    beat_time = models.DateTimeField('最近心跳时间', db_index=True)
+    expire_time = models.DateTimeField('心跳超时时间', null=True, db_index=True)
+    progress = models.JSONField('进度', null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_heartbeat'
+        verbose_name = 'step心跳'
+        verbose_name_plural = verbose_name
+
+
+class IterContext(BaseModel):
+    """
+    迭代上下文
+    同一个(task, node/dag, fission_index)的所有迭代共享一份迭代序列, step/task的extra中只保存引用
+    """
+
+    id = models.AutoField(primary_key=True)
+    task = models.ForeignKey('Task', db_constraint=False, related_name='iter_contexts', on_delete=models.CASCADE)
+    ref_type = models.CharField(max_length=16, choices=[('NODE', 'Node'), ('DAG', 'Dag')])
+    ref_id = models.IntegerField()
+    fission_index = models.IntegerField('分裂序号', default=0)
+
+    key = models.CharField(max_length=128)
+    sequence = models.JSONField('迭代序列', default=list)
+    length = models.IntegerField('序列长度', default=0)
+
+    # 并行迭代窗口
+    parallelism = models.IntegerField('并行度', default=1)
+    inputs = models.JSONField('迭代输入', default=dict)  # 并行迭代时各个迭代共用的输入
+    next_index = models.IntegerField('下一个派发的迭代序号', default=1)
+    handoff_index = models.IntegerField('已按序完成的迭代数', default=0)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_iter_context'
+        verbose_name = '迭代上下文'
+        verbose_name_plural = verbose_name
+        unique_together = ['task', 'ref_type', 'ref_id', 'fission_index']
+
+
+class Advance(BaseModel):
+    """
+    已调度后继的node/dag
+    同一个task内每个node/dag的后继只调度一次, advance消息重复投递或fission兄弟并发完成时不会重复调度
+    """
+
+    id = models.AutoField(primary_key=True)
+    task = models.ForeignKey('Task', db_constraint=False, related_name='advances', on_delete=models.CASCADE)
+    ref_type = models.CharField(max_length=16, choices=[('NODE', 'Node'), ('DAG', 'Dag')])
+    ref_id = models.IntegerField()
+
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_advance'
+        verbose_name = '后继调度记录'
+        verbose_name_plural = verbose_name
+        unique_together = ['task', 'ref_type', 'ref_id']
+
+
+class ResultCache(BaseModel):
+    """
+    action结果缓存, 见cache
+    """
+
+    id = models.AutoField(primary_key=True)
+    key = models.CharField(max_length=64, unique=True)
+    action = models.ForeignKey('Action', db_constraint=False, related_name='results', on_delete=models.CASCADE)
+    output = payload.PayloadField('输出', default=dict)
+    hits = models.IntegerField('命中次数', default=0)
+    expire_time = models.DateTimeField('过期时间', null=True, db_index=True)
+    access_time = models.DateTimeField('最近访问时间', db_index=True)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_result_cache'
+        verbose_name = '结果缓存'
+        verbose_name_plural = verbose_name
+
+
+class Limiter(BaseModel):
+    """
+    并发与速率限制的状态, 见limits
+    """
+
+    id = models.AutoField(primary_key=True)
+    key = models.CharField(max_length=128, unique=True)
+    concurrency = models.IntegerField('并发上限', null=True)
+    rate = models.FloatField('每秒派发数', null=True)
+    burst = models.FloatField('令牌桶容量', null=True)
+    tokens = models.FloatField('剩余令牌', default=0)
+    refill_time = models.DateTimeField('最近补充令牌时间', null=True)
+
+    update_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_limiter'
+        verbose_name = '并发与速率限制'
+        verbose_name_plural = verbose_name
+
+
+class StepSlot(BaseModel):
+    """
+    step占用的并发槽位
+    """
+
+    id = models.AutoField(primary_key=True)
+    key = models.CharField(max_length=128, db_index=True)
+    step = models.OneToOneField('Step', db_constraint=False, related_name='slot', on_delete=models.CASCADE)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_step_slot'
+        verbose_name = '并发槽位'
+        verbose_name_plural = verbose_name
+
+
+class PendingDispatch(BaseModel):
+    """
+    受限制而等待派发的step, 同一个key下按id先进先出
+    """
+
+    id = models.AutoField(primary_key=True)
+    key = models.CharField(max_length=128, db_index=True)
+    step = models.OneToOneField('Step', db_constraint=False, related_name='pending_dispatch',
+                                on_delete=models.CASCADE)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_pending_dispatch'
+        verbose_name = '待派发step'
+        verbose_name_plural = verbose_name
+
+
+class Dispatch(BaseModel):
+    """
+    调度器中的step: 等待派发(dispatch_time为空)或已派发未结束, 见scheduling
+    """
+
+    id = models.AutoField(primary_key=True)
+    step = models.OneToOneField('Step', db_constraint=False, related_name='dispatch', on_delete=models.CASCADE)
+    root_id = models.IntegerField(db_index=True)
+    group = models.CharField('公平调度分组', max_length=128, db_index=True)
+    priority = models.IntegerField('优先级', db_index=True)
+    weight = models.FloatField('权重', default=1)
+    eligible_at = models.DateTimeField('可派发时间', db_index=True)
+    dispatch_time = models.DateTimeField('派发时间', null=True, db_index=True)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        managed = True
+        db_table = 'seaflow_dispatch'
+        verbose_name = '调度'
+        verbose_name_plural = verbose_name
@@ -1,9 +1,12 @@
 import importlib
 import json
+import threading
+from collections import OrderedDict
 from copy import deepcopy
 
 import jsonpath_rw as jsonpath
 
+from . import conf
 from .utils import ParamAdaptException
 
 
@@ -269,6 +272,37 @@ class ParamAdapter(object):
         return d
 
 
+class OutputParserCache(object):
+    """
+    node输出定义和输出适配器的缓存, 按node缓存, node/action更新后自动失效
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, node):
+        """
+        :param node: models.Node, 需要已加载action
+        :return: (ParamDefinition, ParamAdapter)
+        """
+        key = (node.id, node.update_time, node.action.id, node.action.update_time)
+        with self._lock:
+            p = self._items.get(key)
+            if p is not None:
+                self._items.move_to_end(key)
+                return p
+        p = (ParamDefinition.from_json(node.action.output_def), ParamAdapter.from_json(node.output_adapter))
+        with self._lock:
+            self._items[key] = p
+            while len(self._items) > conf.get('OUTPUT_PARSER_CACHE_SIZE'):
+                self._items.popitem(last=False)
+        return p
+
+
+output_parsers = OutputParserCache()
+
+
 if __name__ == '__main__':
     pd = ParamDefinition.from_json({'a': 'Array', 'b': 'Object', 'c': 'Number'})
     _adapter = ParamAdapter.from_json({'a': '$.aa', 'b': '$.bb', 'c': '$.cc'})
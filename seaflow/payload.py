@@ -0,0 +1,221 @@
+"""
+大payload卸载(claim-check)
+    - step/task的input/output中超过PAYLOAD_OFFLOAD_THRESHOLD(字节)的顶层值写入按内容寻址的blob存储, 行内只保存引用:
+        {"$seaflow_blob": <sha256>, "size": <字节数>}
+    - 按内容寻址, 相同的payload只存储一次, 例如fission的各个分支共用的大输入
+    - 读取时延迟解析: 首次访问字段时才从blob存储加载, 已加载的blob在进程内按LRU缓存
+    - context需要按key局部读写(见context), 不卸载
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from . import conf
+from .utils import SeaflowException, get_func
+
+REF_KEY = '$seaflow_blob'
+
+
+class FileSystemBlobStore(object):
+    """
+    本地文件系统的blob存储, 多台机器部署时root需要是共享存储
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, data):
+        """
+        :param key: 内容的sha256
+        :param data: bytes
+        :return:
+        """
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+
+class PayloadStore(object):
+    """
+    blob存储及进程内的LRU缓存
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._backend = None
+
+    def backend(self):
+        if self._backend is None:
+            root = conf.get('PAYLOAD_STORE_ROOT')
+            if not root:
+                raise SeaflowException('PAYLOAD_STORE_ROOT is not configured')
+            self._backend = get_func(conf.get('PAYLOAD_STORE_BACKEND'))(root)
+        return self._backend
+
+    def enabled(self):
+        return bool(conf.get('PAYLOAD_STORE_ROOT'))
+
+    def put(self, data):
+        """
+        :param data: bytes
+        :return: key
+        """
+        key = hashlib.sha256(data).hexdigest()
+        self.backend().put(key, data)
+        self._remember(key, data)
+        return key
+
+    def get(self, key):
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                return data
+        data = self.backend().get(key)
+        self._remember(key, data)
+        return data
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._cache[key] = data
+            self._cache.move_to_end(key)
+            while len(self._cache) > conf.get('PAYLOAD_CACHE_SIZE'):
+                self._cache.popitem(last=False)
+
+
+store = PayloadStore()
+
+
+def is_ref(value):
+    return isinstance(value, dict) and REF_KEY in value
+
+
+def has_refs(value):
+    return is_ref(value) or (isinstance(value, dict) and any(is_ref(v) for v in value.values()))
+
+
+def _dump(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode()
+
+
+def _offload_one(value, threshold):
+    if is_ref(value):
+        return value
+    data = _dump(value)
+    if len(data) <= threshold:
+        return value
+    return {REF_KEY: store.put(data), 'size': len(data)}
+
+
+def offload(value):
+    """
+    卸载超过阈值的payload: dict按顶层值分别卸载, 使不同payload中相同的部分共用一个blob
+    :param value:
+    :return: 卸载后的值
+    """
+    if value is None or not store.enabled():
+        return value
+    threshold = conf.get('PAYLOAD_OFFLOAD_THRESHOLD')
+    if isinstance(value, dict) and not is_ref(value):
+        value = {k: _offload_one(v, threshold) for k, v in value.items()}
+    return _offload_one(value, threshold)
+
+
+def resolve(value):
+    """
+    解析引用
+    :param value: 行内保存的值
+    :return:
+    """
+    if is_ref(value):
+        return resolve(json.loads(store.get(value[REF_KEY])))
+    if isinstance(value, dict) and any(is_ref(v) for v in value.values()):
+        return {k: resolve(v) if is_ref(v) else v for k, v in value.items()}
+    return value
+
+
+def raw(instance, name):
+    """
+    字段在行内保存的值, 已卸载的payload返回引用, 例如回调中只传递引用
+    读取或保存时记录引用, 未解析的字段直接返回行内的值, 都不需要重新计算引用;
+    重新赋值后不再是行内保存的值, 返回新的值; 原地修改在保存(save)时重新卸载
+    :param instance: model instance
+    :param name: 字段名
+    :return:
+    """
+    if name not in instance.__dict__:
+        # 延迟加载的字段
+        getattr(instance, name)
+    refs = instance.__dict__.get('_payload_refs', {})
+    return refs[name] if name in refs else instance.__dict__[name]
+
+
+class PayloadDescriptor(DeferredAttribute):
+    """
+    首次访问时解析引用
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if has_refs(value):
+            resolved = resolve(value)
+            instance.__dict__[self.field.attname] = resolved
+            instance.__dict__.setdefault('_payload_refs', {})[self.field.attname] = value
+            return resolved
+        return value
+
+    def __set__(self, instance, value):
+        # 数据描述符, 否则实例__dict__中的值会绕过__get__
+        instance.__dict__[self.field.attname] = value
+        instance.__dict__.get('_payload_refs', {}).pop(self.field.attname, None)
+
+
+class PayloadField(models.JSONField):
+    """
+    写入时卸载超过阈值的payload, 读取时延迟解析
+    """
+
+    descriptor_class = PayloadDescriptor
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if has_refs(value):
+            # 未解析, 原样写回
+            return value
+        value = super().pre_save(model_instance, add)
+        if hasattr(value, 'resolve_expression'):
+            return value
+        value = offload(value)
+        if has_refs(value):
+            model_instance.__dict__.setdefault('_payload_refs', {})[self.attname] = value
+        return value
+
+    def get_prep_value(self, value):
+        if hasattr(value, 'resolve_expression'):
+            # Value/F/Func等表达式由数据库求值, 不卸载
+            return super().get_prep_value(value)
+        return super().get_prep_value(offload(value))
@@ -0,0 +1,120 @@
+"""
+崩溃恢复
+worker在执行step的过程中退出时, step会一直停留在PROCESSING状态
+celery beat周期性地执行sweep_orphans:
+    - 扫描超过RECOVERY_THRESHOLD未更新的PENDING/PROCESSING/RETRY step, 依赖(state, update_time)索引
+    - 尚未被worker领取过(identifier为空)的PENDING step不扫描: 消息可能仍在broker中排队
+    - 重新投递时记录新的celery id, 之前投递的消息不能再进入执行, 避免重复执行
+    - 通过一次inspect批量获取worker上正在执行/已预取/已计划的celery id
+    - 不在其中且近期没有心跳的step视为丢失, 按策略重新投递或失败
+策略: step config中的recovery, 默认为RECOVERY_POLICY
+    - redispatch: 重新投递
+    - fail: 以WorkerLostException失败, 仍然遵循重试配置
+"""
+
+import datetime
+
+from django.utils import timezone
+
+from . import conf
+from .consts import ActionTypes, StepStates
+from .models import Heartbeat, Step
+from .utils import WorkerLostException
+
+
+def _alive_ids(celery_app):
+    """
+    :return: worker上正在执行/已预取/已计划的celery id, 没有worker响应时返回None
+    """
+    inspect = celery_app.control.inspect()
+    ids = set()
+    replied = False
+    for method in (inspect.active, inspect.reserved, inspect.scheduled):
+        r = method()
+        if r is None:
+            continue
+        replied = True
+        for requests in r.values():
+            for req in requests:
+                # scheduled返回的是{'eta': ..., 'request': {...}}
+                ids.add(req.get('id') or req.get('request', {}).get('id'))
+    return ids if replied else None
+
+
+def _countdown(state, config, loop_config):
+    """
+    step正常情况下可能在broker中等待的时间
+    """
+    if state == StepStates.PENDING:
+        return config.get('countdown', 0) or 0
+    if state == StepStates.PROCESSING:
+        return loop_config.get('countdown', 0) or 0
+    return 0
+
+
+def sweep(now=None):
+    """
+    恢复丢失的step
+    :param now:
+    :return: 恢复的step数
+    """
+    from . import celery_app
+    from .base import SeaflowStep
+
+    now = now or timezone.now()
+    threshold = conf.get('RECOVERY_THRESHOLD')
+    qs = Step.objects.filter(
+        state__in=[StepStates.PENDING, StepStates.PROCESSING, StepStates.RETRY],
+        update_time__lt=now - datetime.timedelta(seconds=threshold)
+    ).exclude(
+        # 等待重试的step由retry sweeper投递
+        state=StepStates.RETRY, retry_at__isnull=False
+    ).exclude(
+        # 尚未被worker领取的step可能仍在broker中排队, 无法与丢失区分
+        state=StepStates.PENDING, identifier__isnull=True
+    ).exclude(
+        # 受并发/速率限制而等待派发的step由limits派发, 见limits
+        pending_dispatch__isnull=False
+    ).exclude(
+        # 在调度器中等待派发的step由调度器派发, 见scheduling
+        dispatch__isnull=False, dispatch__dispatch_time__isnull=True
+    ).exclude(
+        # 外部step由外部系统执行
+        state=StepStates.PROCESSING, node__action_type=ActionTypes.External
+    )
+    candidates = list(qs.order_by('update_time').values_list(
+        'id', 'state', 'identifier', 'update_time', 'config', 'node__loop_config')[:conf.get('RECOVERY_SWEEP_BATCH')])
+    if not candidates:
+        return 0
+
+    alive = _alive_ids(celery_app)
+    if alive is None:
+        # 没有worker响应, 无法判断
+        return 0
+
+    # 近期有心跳的step仍然存活
+    beating = set(Heartbeat.objects.filter(
+        step_id__in=[c[0] for c in candidates],
+        beat_time__gte=now - datetime.timedelta(seconds=threshold)
+    ).values_list('step_id', flat=True))
+
+    count = 0
+    for _id, state, identifier, update_time, config, loop_config in candidates:
+        if identifier in alive or _id in beating:
+            continue
+        if update_time + datetime.timedelta(seconds=threshold + _countdown(state, config, loop_config)) > now:
+            continue
+        # 抢占
+        if not Step.objects.filter(pk=_id, state=state, update_time=update_time).update(update_time=now):
+            continue
+
+        s = SeaflowStep.get(_id, profile='control')
+        policy = s.model.config.get('recovery') or conf.get('RECOVERY_POLICY')
+        s.seagull.warn('step lost since %s, recovery: %s' % (update_time, policy))
+        if policy == 'fail':
+            s._break_off(WorkerLostException('step lost since %s' % update_time))
+        else:
+            s.seagull.flush(True)
+            s._send()
+        count += 1
+    return count
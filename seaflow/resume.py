@@ -0,0 +1,135 @@
+"""
+恢复执行
+失败/中断的root task可以从最后成功的前沿恢复执行, 复用已成功的子task和step(输出及前后关系), 只重新执行:
+    - 失败/中断的子task和step, 与重试相同, 重新投递原来的step
+    - 前驱都已完成但尚未开始的node/dag, 例如调度后继时失败
+两种模式:
+    - in_place: 在原task树上恢复
+    - 新task: 克隆整棵task树(task、step、前后关系、迭代上下文、后继调度记录), 在新task上恢复, 原task保持不变
+恢复只针对已结束的task树, 仍有未结束的step时需要先终止
+开启准入控制时, 恢复执行的root task与新的root task一样需要准入, 见admission
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import conf
+from .consts import StepStates, TaskStates
+from .models import Advance, IterContext, Step, Task
+from .utils import StateException
+
+
+def resumable_states():
+    return TaskStates.fail_states() + TaskStates.interrupt_states()
+
+
+def check(task):
+    """
+    :param task: models.Task
+    :return:
+    """
+    if task.root_id:
+        raise StateException('only root task can be resumed')
+    if task.state not in resumable_states():
+        raise StateException('task 【%s】 is %s, expect %s'
+                             % (task.name, task.state, '/'.join(str(s) for s in resumable_states())))
+    if Task.objects.filter(root_id=task.id, state__in=TaskStates.terminable_states()).exists() \
+            or Step.objects.filter(root_id=task.id, state__in=StepStates.terminable_states()).exists():
+        raise StateException('task 【%s】 has unfinished tasks/steps, terminate it first' % task.name)
+
+
+def _remap_extra(extra, iter_contexts):
+    c = (extra or {}).get('iter_cursor')
+    if c and c.get('id') in iter_contexts:
+        extra = dict(extra, iter_cursor=dict(c, id=iter_contexts[c['id']]))
+    return extra
+
+
+def _insert(model, rows, **scope):
+    """
+    bulk_create写入
+    :param rows: 字段dict
+    :param scope: 新记录的查询条件, 不支持返回自增主键的数据库(MySQL)按条件查回
+    :return: 新记录的id, 与rows的顺序一致
+    """
+    if not rows:
+        return []
+    last_id = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    objs = model.objects.bulk_create([model(**r) for r in rows], batch_size=conf.get('BULK_CREATE_BATCH'))
+    if objs[0].pk is not None:
+        return [o.pk for o in objs]
+    # 同一条INSERT内的自增主键递增, 见SeaflowTask.create_many
+    return list(model.objects.filter(id__gt=last_id, **scope).order_by('id').values_list('id', flat=True))
+
+
+def clone(task):
+    """
+    克隆task树, 按层级批量写入
+    input/output按行内保存的值复制, 已卸载的payload只复制引用
+    :param task: models.Task, root task
+    :return: models.Task, 新的root task
+    """
+    with transaction.atomic():
+        rows = list(Task.objects.filter(Q(pk=task.id) | Q(root_id=task.id)).order_by('id').values())
+        contexts = defaultdict(list)
+        for r in IterContext.objects.filter(task_id__in=[r['id'] for r in rows]).order_by('id').values():
+            contexts[r['task_id']].append(r)
+
+        # parent的id总是小于child, 按id顺序即可得到每个task的层级
+        depth = {}
+        levels = defaultdict(list)
+        for r in rows:
+            depth[r['id']] = depth[r['parent_id']] + 1 if r['id'] != task.id else 0
+            levels[depth[r['id']]].append(r)
+
+        tasks = {}
+        iter_contexts = {}
+        root_id = None
+        for d in sorted(levels):
+            level = levels[d]
+            old_ids = [r.pop('id') for r in level]
+            for r in level:
+                if root_id is None:
+                    r['extra'] = dict(r['extra'], resumed_from=task.id)
+                else:
+                    r['root_id'] = root_id
+                    r['parent_id'] = tasks[r['parent_id']]
+                    # 迭代的task引用的是parent的迭代上下文, 已在上一层复制
+                    r['extra'] = _remap_extra(r['extra'], iter_contexts)
+            new_ids = _insert(Task, level, root_id=root_id) if root_id else [Task.objects.create(**level[0]).id]
+            tasks.update(zip(old_ids, new_ids))
+            root_id = tasks[task.id]
+
+            ctx_rows = [r for _id in old_ids for r in contexts[_id]]
+            old_ctx_ids = [r.pop('id') for r in ctx_rows]
+            for r in ctx_rows:
+                r['task_id'] = tasks[r['task_id']]
+            iter_contexts.update(zip(old_ctx_ids, _insert(IterContext, ctx_rows, task_id__in=new_ids)))
+
+        step_rows = list(Step.objects.filter(root_id=task.id).order_by('id').values())
+        old_step_ids = [r.pop('id') for r in step_rows]
+        for r in step_rows:
+            r['root_id'] = root_id
+            r['task_id'] = tasks[r['task_id']]
+            r['extra'] = _remap_extra(r['extra'], iter_contexts)
+        steps = dict(zip(old_step_ids, _insert(Step, step_rows, root_id=root_id)))
+
+        Advance.objects.bulk_create([
+            Advance(task_id=tasks[task_id], ref_type=ref_type, ref_id=ref_id)
+            for task_id, ref_type, ref_id in Advance.objects.filter(task_id__in=list(tasks))
+            .values_list('task_id', 'ref_type', 'ref_id')])
+
+        # 前后关系
+        ids = {Task: tasks, Step: steps}
+        for model, name in ((Task, 'previous_tasks'), (Task, 'previous_steps'),
+                            (Step, 'previous_tasks'), (Step, 'previous_steps')):
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            src, dst = field.m2m_column_name(), field.m2m_reverse_name()
+            src_ids, dst_ids = ids[model], ids[field.related_model]
+            links = through.objects.filter(**{'%s__in' % src: list(src_ids)}).values_list(src, dst)
+            through.objects.bulk_create([through(**{src: src_ids[s], dst: dst_ids[d]})
+                                         for s, d in links if d in dst_ids])
+        return Task.objects.get(pk=tasks[task.id])
@@ -0,0 +1,96 @@
+"""
+重试调度
+等待重试的task/step记录在带索引的retry_at字段中, 由celery beat周期性地执行sweep_retries批量抢占(见sweeper)并重新投递
+
+重试策略在TaskConfig/StepConfig的retry_policy中配置, 例如:
+    {
+        'type': 'exponential',  # fixed/exponential, 默认fixed
+        'countdown': 5,  # 基础间隔(秒), 默认为retry_countdown
+        'factor': 2,  # exponential的倍数
+        'max_countdown': 300,  # 间隔上限(秒)
+        'jitter': 0.5,  # 随机抖动比例, 0~1, True等同于1, 间隔在[countdown * (1 - jitter), countdown]内随机
+    }
+"""
+
+import random
+
+from django.utils import timezone
+
+from . import conf, sweeper
+from .consts import StepStates, TaskStates
+from .models import Step, Task
+
+
+def backoff(config, retries):
+    """
+    计算重试间隔
+    :param config: TaskConfig/StepConfig
+    :param retries: 已重试次数
+    :return: 秒
+    """
+    policy = config.get('retry_policy') or {}
+    countdown = policy.get('countdown', config.get('retry_countdown', 0)) or 0
+    if policy.get('type') == 'exponential':
+        countdown = countdown * policy.get('factor', 2) ** retries
+    if policy.get('max_countdown') is not None:
+        countdown = min(countdown, policy['max_countdown'])
+    jitter = policy.get('jitter')
+    if jitter:
+        jitter = 1 if jitter is True else min(float(jitter), 1)
+        countdown = countdown * (1 - jitter * random.random())
+    return round(countdown, 3)
+
+
+def sweep(now=None):
+    """
+    :param now:
+    :return: (重试的task数, 重试的step数)
+    """
+    now = now or timezone.now()
+    return sweep_tasks(now), sweep_steps(now)
+
+
+def sweep_tasks(now=None):
+    """
+    重试到期的task
+    :param now:
+    :return: 重试的task数
+    """
+    from .base import SeaflowTask
+
+    now = now or timezone.now()
+    batch = conf.get('RETRY_SWEEP_BATCH')
+    count = 0
+    while True:
+        ids = sweeper.claim(Task, now, batch, field='retry_at')
+        for task in SeaflowTask.get_many(ids, profile='control'):
+            if task.model.state != TaskStates.RETRY:
+                continue
+            task._retry()
+            count += 1
+        if len(ids) < batch:
+            return count
+
+
+def sweep_steps(now=None):
+    """
+    重新投递到期的step, 同一批在同一个broker连接上发布
+    :param now:
+    :return: 重试的step数
+    """
+    from . import celery_app
+    from .base import SeaflowStep
+
+    now = now or timezone.now()
+    batch = conf.get('RETRY_SWEEP_BATCH')
+    count = 0
+    while True:
+        ids = sweeper.claim(Step, now, batch, field='retry_at')
+        steps = [s for s in SeaflowStep.get_many(ids, profile='control') if s.model.state == StepStates.RETRY]
+        if steps:
+            with celery_app.producer_or_acquire() as producer:
+                for s in steps:
+                    s._send(producer=producer)
+        count += len(steps)
+        if len(ids) < batch:
+            return count
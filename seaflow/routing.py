@@ -0,0 +1,60 @@
+"""
+队列路由
+    - 引擎任务按职责路由到独立的队列: control(root task的控制)、advance(后继调度)、callback、timeout(各类sweeper)
+    - action任务按action类型路由到Default/Carrier/External队列, 可在step config的queue中按node覆盖
+    - 队列名在SEAFLOW['QUEUES']中配置, 值为None时使用celery默认队列; 默认全部为None, 独立的队列需要显式开启
+    - 每个队列由独立的worker池消费, 见management命令seaflow_workers
+"""
+
+from . import conf
+
+ENGINE_TASKS = {
+    'seaflow.tasks.apply_root_task': 'control',
+    'seaflow.tasks.sleep_root_task': 'control',
+    'seaflow.tasks.awake_root_task': 'control',
+    'seaflow.tasks.revoke_root_task': 'control',
+    'seaflow.tasks.terminate_root_task': 'control',
+    'seaflow.tasks.resume_root_task': 'control',
+    'seaflow.tasks.advance_step': 'advance',
+    'seaflow.tasks.advance_task': 'advance',
+    'seaflow.tasks.forward_external_steps': 'advance',
+    'seaflow.tasks.do_callback': 'callback',
+    'seaflow.tasks.trigger_step_timeout': 'timeout',
+    'seaflow.tasks.sweep_timeouts': 'timeout',
+    'seaflow.tasks.sweep_retries': 'timeout',
+    'seaflow.tasks.sweep_orphans': 'timeout',
+    'seaflow.tasks.sweep_limits': 'timeout',
+    'seaflow.tasks.dispatch_steps': 'timeout',
+    'seaflow.tasks.admit_tasks': 'timeout',
+    'seaflow.tasks.sweep_result_cache': 'timeout',
+    'seaflow.tasks.publish_external_step': 'External',
+    'seaflow.tasks.start_carrier_step': 'Carrier',
+}
+
+
+def queue(role):
+    """
+    :param role: control/advance/callback/timeout, 或action类型
+    :return: 队列名, None表示celery默认队列
+    """
+    return conf.get('QUEUES').get(role)
+
+
+def step_queue(config, action_type):
+    """
+    执行step的队列, step config中的queue优先
+    :param config: step config
+    :param action_type: ActionTypes name
+    :return:
+    """
+    return (config or {}).get('queue') or queue(action_type)
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    celery router, 见celery的task_routes配置
+    action任务在投递时显式指定队列, 不经过这里
+    """
+    role = ENGINE_TASKS.get(name)
+    if role and queue(role):
+        return {'queue': queue(role)}
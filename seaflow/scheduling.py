@@ -0,0 +1,201 @@
+"""
+优先级与公平调度
+SCHEDULER_CAPACITY不为None时开启: 新派发的step不直接投递到broker, 而是提交到调度器, 由调度器按优先级和权重派发,
+已派发未结束的step数不超过SCHEDULER_CAPACITY
+
+root task的TaskConfig中配置, 子task和step继承root task的配置, 例如:
+    {
+        'priority': 'interactive',  # 优先级, 见PRIORITIES, 也可以是整数, 越小越优先, 默认normal
+        'weight': 2,  # 公平调度的权重, 默认1
+    }
+
+    - 严格优先级: 高优先级还有可派发的step时, 不派发低优先级的step
+    - 同一优先级内按分组加权公平: 每次派发给(已派发未结束数 / 权重)最小的分组, 分组按root task或dag名称,
+      见SCHEDULER_FAIR_SHARE
+    - countdown: 提交时记录可派发时间, 到期后才参与调度
+    - step结束时释放; 等待重试的step仍占用容量, 重试时不再提交;
+      task重试/恢复时重新执行的失败step已释放容量, 与新的step一样重新提交
+    - 提交和释放时只在有空闲容量且调度锁空闲时触发一次调度, 不等待调度锁, 其余由sweeper完成
+    - celery beat周期性地执行dispatch_steps: 派发countdown到期的step, 回收已结束(例如被批量终止)的step
+"""
+
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import conf
+from .consts import StepStates
+from .models import Dispatch, Limiter, Step
+from .utils import ParamException
+
+PRIORITIES = {
+    'interactive': 0,
+    'high': 10,
+    'normal': 20,
+    'batch': 30,
+    'low': 40,
+}
+
+# 调度器的互斥锁, 使用Limiter表中的一行
+LOCK_KEY = '$scheduler'
+
+
+def enabled():
+    return conf.get('SCHEDULER_CAPACITY') is not None
+
+
+def priority_of(config):
+    """
+    :param config: root task的TaskConfig
+    :return: int
+    """
+    p = (config or {}).get('priority', 'normal')
+    if isinstance(p, int) and not isinstance(p, bool):
+        return p
+    if p not in PRIORITIES:
+        raise ParamException('unknown priority: %r, expect an int or one of %s' % (p, '/'.join(PRIORITIES)))
+    return PRIORITIES[p]
+
+
+def weight_of(config):
+    """
+    :param config: root task的TaskConfig
+    :return: float
+    """
+    w = (config or {}).get('weight')
+    if w is None:
+        return 1.0
+    if isinstance(w, bool) or not isinstance(w, (int, float)) or w <= 0:
+        raise ParamException('invalid weight: %r, expect a positive number' % (w,))
+    return float(w)
+
+
+def check(config):
+    """
+    创建root task时校验TaskConfig中的priority/weight, 避免在派发时才失败
+    :param config: root task的TaskConfig
+    :return:
+    """
+    priority_of(config)
+    weight_of(config)
+
+
+def submit(step, countdown=0):
+    """
+    提交step
+    :param step: models.Step, 需要已加载root
+    :param countdown: 秒
+    :return:
+    """
+    root = step.root
+    if conf.get('SCHEDULER_FAIR_SHARE') == 'dag':
+        group = 'dag:%s' % root.dag.name
+    else:
+        group = 'root:%s' % root.id
+    now = timezone.now()
+    Dispatch.objects.get_or_create(step_id=step.id, defaults=dict(
+        root_id=root.id,
+        group=group,
+        priority=priority_of(root.config),
+        weight=weight_of(root.config),
+        eligible_at=now + datetime.timedelta(seconds=countdown or 0),
+    ))
+    if not countdown:
+        _kick()
+
+
+def _allocate(waiting, running, capacity):
+    """
+    加权公平分配
+    :param waiting: {group: (可派发数, 权重)}
+    :param running: {group: 已派发未结束数}
+    :param capacity: 可派发总数
+    :return: {group: 派发数}
+    """
+    result = {}
+    while capacity > 0:
+        candidates = [g for g, (n, _) in waiting.items() if result.get(g, 0) < n]
+        if not candidates:
+            break
+        g = min(candidates, key=lambda x: ((running.get(x, 0) + result.get(x, 0)) / waiting[x][1], x))
+        result[g] = result.get(g, 0) + 1
+        capacity -= 1
+    return result
+
+
+def _kick():
+    """
+    有空闲容量时尝试调度, 调度锁被占用时跳过, 由sweeper兜底
+    :return:
+    """
+    if Dispatch.objects.filter(dispatch_time__isnull=False).count() < conf.get('SCHEDULER_CAPACITY'):
+        dispatch(wait=False)
+
+
+def dispatch(wait=True):
+    """
+    按优先级和权重派发
+    :param wait: 是否等待调度锁, 为False时锁被占用则直接返回
+    :return: 派发的step数
+    """
+    from .base import SeaflowStep
+
+    if not enabled():
+        return 0
+    now = timezone.now()
+    ids = []
+    with transaction.atomic():
+        Limiter.objects.get_or_create(key=LOCK_KEY)
+        if Limiter.objects.select_for_update(skip_locked=not wait).filter(key=LOCK_KEY).first() is None:
+            return 0
+        inflight = Dispatch.objects.filter(dispatch_time__isnull=False)
+        capacity = conf.get('SCHEDULER_CAPACITY') - inflight.count()
+        if capacity <= 0:
+            return 0
+        capacity = min(capacity, conf.get('SCHEDULER_DISPATCH_BATCH'))
+        running = dict(inflight.values_list('group').annotate(n=Count('id')))
+        ready = Dispatch.objects.filter(dispatch_time__isnull=True, eligible_at__lte=now)
+        for priority in ready.values_list('priority', flat=True).distinct().order_by('priority'):
+            waiting = {r['group']: (r['n'], r['w']) for r in ready.filter(priority=priority).values('group')
+                       .annotate(n=Count('id'), w=Max('weight'))}
+            for g, n in _allocate(waiting, running, capacity).items():
+                ids += list(ready.filter(priority=priority, group=g).order_by('id')
+                            .values_list('step_id', flat=True)[:n])
+                running[g] = running.get(g, 0) + n
+                capacity -= n
+            if capacity <= 0:
+                break
+        if ids:
+            # 排队期间被撤销/终止的step不再派发, 重试/恢复的失败step为RETRY状态
+            pending = list(Step.objects.filter(pk__in=ids, state__in=[StepStates.PENDING, StepStates.RETRY])
+                           .values_list('id', flat=True))
+            Dispatch.objects.filter(step_id__in=set(ids) - set(pending)).delete()
+            Dispatch.objects.filter(step_id__in=pending).update(dispatch_time=now)
+            ids = pending
+    for _id in ids:
+        SeaflowStep.get(_id, profile='dispatch')._send()
+    return len(ids)
+
+
+def release(step_ids):
+    """
+    step结束: 释放容量, 触发调度
+    :param step_ids:
+    :return:
+    """
+    if Dispatch.objects.filter(step_id__in=step_ids).delete()[0]:
+        _kick()
+
+
+def sweep():
+    """
+    回收已结束的step, 派发countdown到期的step
+    :return: 派发的step数
+    """
+    ended = list(Dispatch.objects.filter(step__state__in=StepStates.end_states())
+                 .values_list('id', flat=True)[:conf.get('SCHEDULER_DISPATCH_BATCH')])
+    if ended:
+        Dispatch.objects.filter(pk__in=ended).delete()
+    return dispatch()
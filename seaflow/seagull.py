@@ -6,8 +6,27 @@ import sys
 import time
 import traceback
 
+from . import conf
 from .models import Log, Task
-from .utils import NotPrintException
+from .utils import ComplexJSONEncoder, NotPrintException
+
+
+def preview(value, ref=None, config=None):
+    """
+    日志中的payload: 完整的payload已保存在input/output中, 日志中只记录预览,
+    超过LOG_PAYLOAD_PREVIEW_SIZE(字符)时截断, 并注明完整payload的位置
+    :param value: payload
+    :param ref: 完整payload的位置, 例如step#1.output
+    :param config: TaskConfig/StepConfig, log_payload为full时记录完整的payload
+    :return:
+    """
+    text = json.dumps(value, cls=ComplexJSONEncoder, ensure_ascii=False)
+    if (config or {}).get('log_payload', conf.get('LOG_PAYLOAD')) == 'full':
+        return text
+    limit = conf.get('LOG_PAYLOAD_PREVIEW_SIZE')
+    if len(text) <= limit:
+        return text
+    return '%s... <truncated, %s chars%s>' % (text[:limit], len(text), ', see %s' % ref if ref else '')
 
 
 class Tracker(object):
@@ -79,17 +98,28 @@ class Tracker(object):
             content
         )
 
-    def trace_error(self, e=None):
+    @staticmethod
+    def _error_lines(e=None):
         if e:
             e_type, e_value, traceback_obj = type(e), e, e.__traceback__
         else:
             e_type, e_value, traceback_obj = sys.exc_info()[:3]
-        self.logger.exception(e_value)
-
         lines = ['Type: %s' % e_type, 'Value: %s' % e_value]
         for line in traceback.format_exception(e_type, e_value, traceback_obj)[1:]:
             line = line.rstrip('\n')
             lines.append(line)
+        return e_value, lines
+
+    def format_error(self, e=None):
+        """
+        只格式化异常, 不写日志
+        """
+        return '\n'.join(self._error_lines(e)[1])
+
+    def trace_error(self, e=None):
+        e_value, lines = self._error_lines(e)
+        self.logger.exception(e_value)
+
         if not isinstance(e, NotPrintException):
             self.error('ErrorStack:')
             for line in lines:
@@ -153,7 +183,7 @@ class Seagull(Tracker):
             logs.append({'ts': lg.ts, 'content': lg.content})
             ids.append(lg.id)
         if logs:
-            self.ref.refresh_from_db()
+            self.ref.refresh_from_db(fields=['logs'])
             self.ref.update(_refresh=False, logs=(self.ref.logs + logs))
 
             # NOTE: 避免一次删除太多数据，引发 DB 报警：每次删除 500 条日志
@@ -163,6 +193,53 @@ class Seagull(Tracker):
                 Log.objects.filter(pk__in=ids[cursor:cursor+size]).delete()
                 cursor += size
 
+    @classmethod
+    def persist_many(cls, model, entries, level='INFO'):
+        """
+        批量写入日志, 不经过各自的缓冲区
+        :param model: models.Task/models.Step
+        :param entries: [(id, message)]或[(id, message, level)]
+        :param level: 默认的日志级别
+        :return:
+        """
+        ref_type = 'TASK' if model is Task else 'STEP'
+        tracker = Tracker()
+        Log.objects.bulk_create([Log(
+            ref_type=ref_type,
+            ref_id=entry[0],
+            ts=time.time() * 1000,
+            content=tracker._format(entry[1], entry[2] if len(entry) > 2 else level)
+        ) for entry in entries])
+
+    @classmethod
+    def merge_many(cls, model, ids):
+        """
+        批量合并日志
+        :param model: models.Task/models.Step
+        :param ids:
+        :return:
+        """
+        ref_type = 'TASK' if model is Task else 'STEP'
+        ids = list(ids)
+        size = 500
+        for cursor in range(0, len(ids), size):
+            logs = {}
+            log_ids = []
+            for _id, ref_id, ts, content in Log.objects.filter(
+                    ref_type=ref_type, ref_id__in=ids[cursor:cursor + size]).order_by('id').values_list(
+                    'id', 'ref_id', 'ts', 'content'):
+                logs.setdefault(ref_id, []).append({'ts': ts, 'content': content})
+                log_ids.append(_id)
+            if not logs:
+                continue
+            model.objects.bulk_update(
+                [model(id=_id, logs=current + logs[_id])
+                 for _id, current in model.objects.filter(pk__in=logs.keys()).values_list('id', 'logs')],
+                ['logs']
+            )
+            for i in range(0, len(log_ids), size):
+                Log.objects.filter(pk__in=log_ids[i:i + size]).delete()
+
     @classmethod
     def instance(cls, target, *args, **kwargs):
         identifier = (target.__class__.name, target.id)
@@ -0,0 +1,25 @@
+"""
+到期记录的批量抢占
+超时(deadline)、重试(retry_at)、心跳超时(expire_time)记录在带索引的到期时间字段中,
+celery beat周期性地按到期时间顺序批量抢占, 见timeouts/retry
+"""
+
+from django.db import transaction
+
+
+def claim(model, now, batch, field='deadline'):
+    """
+    按到期时间顺序抢占一批到期的记录: SELECT ... FOR UPDATE SKIP LOCKED加锁后一次UPDATE清空到期时间字段,
+    多个sweeper并发时同一条记录只会被一个sweeper抢占, 被其他sweeper锁定的记录直接跳过
+    :param model: models.Task/models.Step/models.Heartbeat
+    :param now:
+    :param batch: 一批的数量
+    :param field: 到期时间字段
+    :return: 抢占的id, 少于batch时没有更多可抢占的记录
+    """
+    with transaction.atomic():
+        ids = list(model.objects.select_for_update(skip_locked=True).filter(**{'%s__lte' % field: now})
+                   .order_by(field).values_list('id', flat=True)[:batch])
+        if ids:
+            model.objects.filter(pk__in=ids).update(**{field: None})
+    return ids
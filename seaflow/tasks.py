@@ -5,13 +5,13 @@ from .utils import get_func
 @celery_app.task
 def publish_external_step(step_id):
     from .base import SeaflowStep
-    SeaflowStep.get(step_id)._publish()
+    SeaflowStep.get(step_id, profile='dispatch')._publish()
 
 
 @celery_app.task(bind=True)
 def start_carrier_step(self, step_id):
     from .base import SeaflowStep
-    SeaflowStep.get(step_id)._carry(self)
+    SeaflowStep.get(step_id, profile='dispatch')._carry(self)
 
 
 @celery_app.task
@@ -23,31 +23,98 @@ def apply_root_task(task_id):
 @celery_app.task
 def sleep_root_task(task_id):
     from .base import SeaflowTask
-    SeaflowTask.get(task_id).sleep(sync=True)
+    SeaflowTask.get(task_id, profile='control').sleep(sync=True)
 
 
 @celery_app.task
 def awake_root_task(task_id):
     from .base import SeaflowTask
-    SeaflowTask.get(task_id).awake(sync=True)
+    SeaflowTask.get(task_id, profile='control').awake(sync=True)
 
 
 @celery_app.task
 def revoke_root_task(task_id):
     from .base import SeaflowTask
-    SeaflowTask.get(task_id).revoke(sync=True)
+    SeaflowTask.get(task_id, profile='control').revoke(sync=True)
 
 
 @celery_app.task
 def terminate_root_task(task_id):
     from .base import SeaflowTask
-    SeaflowTask.get(task_id).terminate(sync=True)
+    SeaflowTask.get(task_id, profile='control').terminate(sync=True)
+
+
+@celery_app.task
+def resume_root_task(task_id):
+    from .base import SeaflowTask
+    SeaflowTask.get(task_id, profile='control')._resume()
+
+
+@celery_app.task
+def advance_step(step_id):
+    from .base import SeaflowStep
+    SeaflowStep.get(step_id, profile='finish')._forward()
+
+
+@celery_app.task
+def advance_task(task_id):
+    from .base import SeaflowTask
+    SeaflowTask.get(task_id, profile='finish')._forward()
+
+
+@celery_app.task
+def forward_external_steps(task_id, step_ids, errors):
+    from .base import SeaflowTask
+    SeaflowTask.get(task_id, profile='finish')._forward_steps(step_ids, errors)
 
 
 @celery_app.task
 def trigger_step_timeout(step_id):
+    # 兼容已投递的countdown消息, 新的超时由sweep_timeouts触发
     from .base import SeaflowStep
-    SeaflowStep.get(step_id)._trigger_timeout()
+    SeaflowStep.get(step_id, profile='control')._trigger_timeout()
+
+
+@celery_app.task
+def sweep_timeouts():
+    from . import timeouts
+    timeouts.sweep()
+
+
+@celery_app.task
+def sweep_retries():
+    from . import retry
+    retry.sweep()
+
+
+@celery_app.task
+def sweep_orphans():
+    from . import recovery
+    recovery.sweep()
+
+
+@celery_app.task
+def sweep_limits():
+    from . import limits
+    limits.sweep()
+
+
+@celery_app.task
+def dispatch_steps():
+    from . import scheduling
+    scheduling.sweep()
+
+
+@celery_app.task
+def admit_tasks():
+    from . import admission
+    admission.drain()
+
+
+@celery_app.task
+def sweep_result_cache():
+    from . import cache
+    cache.sweep()
 
 
 @celery_app.task()
@@ -1,3 +1,367 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from json_logic import jsonLogic
+
+from . import admission, limits, scheduling
+from .base import SeaflowStep, SeaflowTask
+from .consts import ActionTypes, StepStates, TaskStates
+from .logic import Condition, ConditionData
+from .models import Action, Dag, Dispatch, Limiter, Node, PendingDispatch, Step, StepSlot, Task
+from .utils import AdmissionException, ParamException
+
+
+class ConditionTest(SimpleTestCase):
+    """
+    编译后的条件与json_logic.jsonLogic的结果一致
+    """
+
+    DATA = {
+        'index': 3,
+        'input': {'a': 1, 'b': '2', 'f': 1.0, 's': 'abc', 'n': None, 'e': '', 'xs': [1, 2, 3], 'd': {'k': [{'v': 5}]}},
+        'output': {'c': 2.5, 'ok': True},
+        'context': {'x': 10, 'y': 'yes', 'z': None},
+    }
+
+    RULES = [
+        {'===': [1, 1.0]},
+        {'!==': [1, 1.0]},
+        {'==': [1, '1']},
+        {'==': [0, False]},
+        {'!=': [{'var': 'input.a'}, {'var': 'input.b'}]},
+        {'<': [{'var': 'index'}, 5]},
+        {'<': [1, {'var': 'index'}, 5]},
+        {'<=': [{'var': 'input.n'}, 1]},
+        {'>': ['11', 2]},
+        {'>=': [{'var': 'output.c'}, 2.5]},
+        {'+': [1, '2', 3.0]},
+        {'+': []},
+        {'-': [{'var': 'index'}]},
+        {'-': [5, 2.0]},
+        {'*': ['2', 1.5]},
+        {'/': [4, 2]},
+        {'%': [7, 2]},
+        {'max': []},
+        {'min': [3, '1', 2.0]},
+        {'max': [{'var': 'input.xs.0'}, {'var': 'input.f'}]},
+        {'cat': ['a', 1, {'var': 'context.y'}]},
+        {'substr': [{'var': 'input.s'}, 1]},
+        {'in': ['b', {'var': 'input.s'}]},
+        {'in': [2, {'var': 'input.xs'}]},
+        {'merge': [[1], 2, [{'var': 'index'}]]},
+        {'!': [{'var': 'input.e'}]},
+        {'!!': [{'var': 'input.xs'}]},
+        {'and': []},
+        {'or': []},
+        {'and': [True, {'var': 'input.a'}, {'var': 'input.s'}]},
+        {'or': [0, {'var': 'input.n'}, {'var': 'context.x'}]},
+        {'if': [{'var': 'output.ok'}, 'yes', 'no']},
+        {'if': [False, 1, {'var': 'input.n'}, 2, 3]},
+        {'?:': [{'var': 'context.z'}, 1, 2]},
+        {'var': ''},
+        {'var': ['', 'default']},
+        {'var': []},
+        {'var': 'input'},
+        {'var': 'input.s.1'},
+        {'var': 'input.xs.-1'},
+        {'var': 'input.d.k.0.v'},
+        {'var': ['input.missing', 'default']},
+        {'var': ['context.z', 'default']},
+        {'var': [{'cat': ['input.', 'a']}]},
+        {'missing': ['input.a', 'input.n', 'input.e', 'input.nope', 'context.x']},
+        {'missing': [['input.a', 'input.nope']]},
+        {'missing_some': [1, ['input.nope', 'input.a']]},
+        {'missing_some': [2, ['input.nope', 'input.a']]},
+        {'missing': {'merge': ['input.a', 'input.nope']}},
+        {'map': [{'var': 'input.xs'}, {'*': [{'var': ''}, 2]}]},
+        {'filter': [{'var': 'input.xs'}, {'%': [{'var': ''}, 2]}]},
+        {'reduce': [{'var': 'input.xs'}, {'+': [{'var': 'current'}, {'var': 'accumulator'}]}, 0]},
+        {'all': [{'var': 'input.xs'}, {'>': [{'var': ''}, 0]}]},
+        {'some': [{'var': 'input.xs'}, {'>': [{'var': ''}, 2]}]},
+        {'none': [{'var': 'input.xs'}, {'>': [{'var': ''}, 2]}]},
+        [{'var': 'index'}, {'+': [1, 1]}],
+        {'a': 1, 'b': 2},
+        'plain',
+    ]
+
+    def _data(self):
+        sources = {k: v for k, v in self.DATA.items() if k != 'context'}
+        return ConditionData(context_loader=lambda keys: self.DATA['context'] if keys is None else
+                             {k: self.DATA['context'][k] for k in keys if k in self.DATA['context']}, **sources)
+
+    def test_same_as_json_logic(self):
+        for rule in self.RULES:
+            with self.subTest(rule=rule):
+                c = Condition(rule)
+                data = self._data()
+                data.context_keys = c.context_keys
+                self.assertEqual(jsonLogic(rule, self.DATA), c(data))
+
+    def test_unknown_operation(self):
+        with self.assertRaises(ValueError):
+            Condition({'nope': [1]})(self._data())
+
+    def test_context_keys(self):
+        self.assertEqual(['x'], Condition({'<': [{'var': 'context.x'}, {'var': 'index'}]}).context_keys)
+        self.assertIsNone(Condition({'var': 'context'}).context_keys)
+        self.assertIsNone(Condition({'var': [{'cat': ['context.', 'x']}]}).context_keys)
+        self.assertIsNone(Condition({'map': [{'var': 'input.xs'}, {'var': ''}]}).context_keys)
+
+
+def create_dag(name='dag'):
+    return Dag.objects.create(name=name, title=name, version=1, latest=True)
+
+
+def create_task(config=None, dag=None, state=TaskStates.PROCESSING):
+    """
+    创建root task, 默认执行中
+    :return: models.Task
+    """
+    dag = dag or create_dag()
+    return Task.objects.create(name=dag.name, title=dag.title, dag=dag, state=state.name, input={},
+                               config=config or {})
+
+
+def create_steps(count, action='ext', limit=None, step_config=None, task=None):
+    """
+    创建外部action的step, 不投递
+    :return: [models.Step]
+    """
+    action, _ = Action.objects.get_or_create(name=action, defaults=dict(
+        title=action, type=ActionTypes.External.name, limit=limit))
+    task = task or create_task()
+    node = Node.objects.create(name=action.name, title=action.name, action=action, dag=task.dag, root_dag=task.dag,
+                               action_type=action.type)
+    return [Step.objects.create(name=node.name, title=node.title, node=node, root=task, task=task,
+                                state=StepStates.PENDING.name, fission_count=count, fission_index=i,
+                                config=step_config or {}, input={}) for i in range(count)]
+
+
+class LimitTest(TestCase):
+    """
+    action并发与速率限制
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(SeaflowStep, '_submit', autospec=True)
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submitted(self):
+        return [c.args[0].id for c in self.submit.call_args_list]
+
+    def test_policy(self):
+        step = create_steps(1, limit={'concurrency': 2})[0]
+        action = step.node.action
+        self.assertEqual({'concurrency': 2}, limits.policy(action, {}))
+        self.assertEqual({'concurrency': 2, 'rate': 1}, limits.policy(action, {'limit': {'rate': 1}}))
+        self.assertIsNone(limits.policy(action, {'limit': False}))
+        self.assertEqual({'concurrency': 2}, limits.policy(action, {'limit': True}))
+        self.assertEqual('action:ext', limits.scope(action, limits.policy(action, {})))
+
+    def test_concurrency_cap(self):
+        steps = create_steps(3, limit={'concurrency': 2})
+        self.assertEqual([True, True, False], [limits.acquire(s) for s in steps])
+        self.assertEqual({steps[0].id, steps[1].id}, set(StepSlot.objects.values_list('step_id', flat=True)))
+        self.assertEqual([steps[2].id], list(PendingDispatch.objects.values_list('step_id', flat=True)))
+        # 已持有槽位时不重复获取
+        self.assertTrue(limits.acquire(steps[0]))
+        self.assertEqual(2, StepSlot.objects.count())
+
+    def test_parking_is_fifo(self):
+        steps = create_steps(4, limit={'concurrency': 1})
+        [limits.acquire(s) for s in steps]
+        self.assertEqual([s.id for s in steps[1:]],
+                         list(PendingDispatch.objects.order_by('id').values_list('step_id', flat=True)))
+        # 释放槽位后, 有待派发的step时新的step仍然排队
+        StepSlot.objects.all().delete()
+        new = create_steps(1, limit={'concurrency': 1}, task=steps[0].task)[0]
+        self.assertFalse(limits.acquire(new))
+        self.assertEqual(1, limits.drain('action:ext'))
+        self.assertEqual([steps[1].id], self.submitted())
+
+    def test_release_drains(self):
+        steps = create_steps(3, limit={'concurrency': 1})
+        [limits.acquire(s) for s in steps]
+        self.assertEqual(1, limits.release([steps[0].id]))
+        self.assertEqual([steps[1].id], self.submitted())
+        self.assertEqual([steps[1].id], list(StepSlot.objects.values_list('step_id', flat=True)))
+        self.assertEqual([steps[2].id], list(PendingDispatch.objects.values_list('step_id', flat=True)))
+        # 没有持有槽位的step
+        self.assertEqual(0, limits.release([steps[2].id]))
+
+    def test_release_skips_ended(self):
+        steps = create_steps(3, limit={'concurrency': 1})
+        [limits.acquire(s) for s in steps]
+        Step.objects.filter(pk=steps[1].id).update(state=StepStates.TERMINATE.name)
+        self.assertEqual(1, limits.release([steps[0].id]))
+        self.assertEqual([steps[2].id], self.submitted())
+        self.assertFalse(PendingDispatch.objects.exists())
+
+    def test_rate_refill(self):
+        steps = create_steps(4, limit={'rate': 2, 'burst': 2})
+        self.assertEqual([True, True, False, False], [limits.acquire(s) for s in steps])
+        self.assertEqual(0, limits.drain('action:ext'))
+        # 经过1秒补充2个令牌
+        Limiter.objects.filter(key='action:ext').update(refill_time=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(2, limits.drain('action:ext'))
+        self.assertEqual([steps[2].id, steps[3].id], self.submitted())
+        self.assertLess(Limiter.objects.get(key='action:ext').tokens, 1)
+
+    def test_sweep_leaked_slots(self):
+        steps = create_steps(2, limit={'concurrency': 1})
+        [limits.acquire(s) for s in steps]
+        # 例如被批量终止, 没有经过_release
+        Step.objects.filter(pk=steps[0].id).update(state=StepStates.TERMINATE.name)
+        self.assertEqual(1, limits.sweep())
+        self.assertEqual([steps[1].id], self.submitted())
+        self.assertEqual([steps[1].id], list(StepSlot.objects.values_list('step_id', flat=True)))
+
+    def test_sweep_drops_ended_pending(self):
+        steps = create_steps(2, limit={'concurrency': 1})
+        [limits.acquire(s) for s in steps]
+        Step.objects.filter(pk=steps[1].id).update(state=StepStates.REVOKE.name)
+        self.assertEqual(0, limits.sweep())
+        self.assertFalse(PendingDispatch.objects.exists())
+
+
+@override_settings(SEAFLOW={'SCHEDULER_CAPACITY': 3})
+class SchedulingTest(TestCase):
+    """
+    优先级与加权公平调度
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(SeaflowStep, '_send', autospec=True)
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent(self):
+        return [c.args[0].id for c in self.send.call_args_list]
+
+    def submit(self, steps):
+        # 只提交不触发调度, 由测试显式调用dispatch
+        with mock.patch.object(scheduling, '_kick'):
+            for s in steps:
+                scheduling.submit(s)
+
+    def test_priority_of(self):
+        self.assertEqual(20, scheduling.priority_of({}))
+        self.assertEqual(10, scheduling.priority_of({'priority': 'high'}))
+        self.assertEqual(5, scheduling.priority_of({'priority': 5}))
+        self.assertEqual(2.0, scheduling.weight_of({'weight': 2}))
+        for config in ({'priority': 'urgent'}, {'priority': True}, {'weight': 0}, {'weight': '2'}):
+            with self.assertRaises(ParamException):
+                scheduling.check(config)
+
+    def test_create_rejects_unknown_priority(self):
+        with self.assertRaisesRegex(ParamException, 'unknown priority'):
+            SeaflowTask.create(dag_id=create_dag().id, config={'priority': 'urgent'})
+        self.assertFalse(Task.objects.exists())
+
+    def test_allocate(self):
+        # 平分
+        self.assertEqual({'a': 2, 'b': 2}, scheduling._allocate({'a': (3, 1), 'b': (3, 1)}, {}, 4))
+        # 按权重
+        self.assertEqual({'a': 4, 'b': 2}, scheduling._allocate({'a': (5, 2), 'b': (5, 1)}, {}, 6))
+        # 已派发未结束的计入份额
+        self.assertEqual({'b': 2}, scheduling._allocate({'a': (3, 1), 'b': (3, 1)}, {'a': 2}, 2))
+        # 不超过可派发数, 剩余容量分给其他分组
+        self.assertEqual({'a': 1, 'b': 3}, scheduling._allocate({'a': (1, 1), 'b': (5, 1)}, {}, 4))
+        self.assertEqual({'a': 1}, scheduling._allocate({'a': (1, 1)}, {}, 3))
+
+    def test_dispatch_order(self):
+        low = create_steps(2, task=create_task({'priority': 'batch'}))
+        heavy = create_steps(3, task=create_task({'priority': 'high', 'weight': 2}))
+        light = create_steps(3, task=create_task({'priority': 'high'}))
+        self.submit(low + heavy + light)
+
+        # 严格优先级, 同一优先级内按权重分配, 分组内按提交顺序
+        self.assertEqual(3, scheduling.dispatch())
+        self.assertEqual({heavy[0].id, heavy[1].id, light[0].id}, set(self.sent()))
+        self.assertEqual(0, scheduling.dispatch())
+
+        # 释放后按(已派发未结束数 / 权重)派发: heavy 1/2 < light 1/1
+        scheduling.release([heavy[0].id])
+        self.assertEqual(heavy[2].id, self.sent()[-1])
+
+        # 高优先级派发完后才派发低优先级
+        scheduling.release([heavy[1].id, heavy[2].id, light[0].id])
+        self.assertEqual({light[1].id, light[2].id, low[0].id}, set(self.sent()[-3:]))
+        self.assertEqual(1, Dispatch.objects.filter(dispatch_time__isnull=True).count())
+
+    def test_dispatch_skips_ended(self):
+        steps = create_steps(2)
+        self.submit(steps)
+        Step.objects.filter(pk=steps[0].id).update(state=StepStates.REVOKE.name)
+        self.assertEqual(1, scheduling.dispatch())
+        self.assertEqual([steps[1].id], self.sent())
+        self.assertEqual([steps[1].id], list(Dispatch.objects.values_list('step_id', flat=True)))
+
+
+class AdmissionTest(TestCase):
+    """
+    root task准入控制
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(SeaflowTask, 'apply', autospec=True)
+        self.apply = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def applied(self):
+        return [c.args[0].id for c in self.apply.call_args_list]
+
+    def queue(self, count, dag=None):
+        dag = dag or create_dag()
+        return [create_task(dag=dag, state=TaskStates.QUEUED).id for _ in range(count)]
+
+    @override_settings(SEAFLOW={'ADMISSION_MAX_RUNNING': 2})
+    def test_fifo(self):
+        create_task()
+        ids = self.queue(3)
+        self.assertEqual(ids[:1], admission.drain())
+        self.assertEqual(ids[:1], self.applied())
+        task = Task.objects.get(pk=ids[0])
+        self.assertEqual(TaskStates.PENDING.name, task.state)
+        self.assertTrue(admission.admitted(task))
+        # 已准入尚未开始执行的task计入执行中
+        self.assertEqual([], admission.drain())
+        Task.objects.filter(pk=ids[0]).update(state=TaskStates.SUCCESS.name)
+        self.assertEqual(ids[1:2], admission.drain())
+        self.assertEqual(ids[:2], self.applied())
+
+    @override_settings(SEAFLOW={'ADMISSION_DAG_LIMITS': {'etl': 1}})
+    def test_dag_limits(self):
+        etl = self.queue(2, create_dag('etl'))
+        other = self.queue(2)
+        # 受dag上限限制的task不阻塞其他dag的task
+        self.assertEqual(etl[:1] + other, admission.drain())
+        self.assertEqual(TaskStates.QUEUED.name, Task.objects.get(pk=etl[1]).state)
+        Task.objects.filter(pk=etl[0]).update(state=TaskStates.ERROR.name)
+        self.assertEqual(etl[1:], admission.drain())
+
+    @override_settings(SEAFLOW={'ADMISSION_MAX_RUNNING': 0, 'ADMISSION_MAX_QUEUED': 2})
+    def test_max_queued(self):
+        dag = create_dag()
+        self.queue(1, dag)
+        admission.check()
+        self.queue(1, dag)
+        with self.assertRaises(AdmissionException):
+            admission.check()
+        with self.assertRaises(AdmissionException):
+            SeaflowTask.create(dag_id=dag.id)
+        self.assertEqual(2, Task.objects.count())
+
+    @override_settings(SEAFLOW={'ADMISSION_MAX_RUNNING': 1})
+    def test_enqueue_and_position(self):
+        create_task()
+        ids = self.queue(2)
+        task = create_task(state=TaskStates.PENDING)
+        self.assertFalse(admission.enqueue(task))
+        self.assertEqual(TaskStates.QUEUED.name, Task.objects.get(pk=task.id).state)
+        self.assertEqual([1, 2, 3], [admission.position(Task.objects.get(pk=_id)) for _id in ids + [task.id]])
+        self.assertIsNone(admission.position(create_task()))
+        self.assertEqual([], self.applied())
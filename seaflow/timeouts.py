@@ -0,0 +1,95 @@
+"""
+超时调度
+task/step的超时时间记录在带索引的deadline字段中, 结束时清空
+配置了heartbeat_timeout的step, 心跳超时时间记录在seaflow_heartbeat.expire_time中
+celery beat周期性地执行sweep_timeouts, 按deadline顺序批量抢占并触发到期的超时(见sweeper), 不再为每个step投递countdown消息
+"""
+
+from django.utils import timezone
+
+from . import conf, sweeper
+from .consts import ActionTypes
+from .models import Heartbeat, Step, Task
+
+
+def sweep(now=None):
+    """
+    :param now:
+    :return: (触发的task数, 触发的step数)
+    """
+    now = now or timezone.now()
+    return sweep_tasks(now), sweep_steps(now) + sweep_heartbeats(now)
+
+
+def sweep_tasks(now=None):
+    """
+    触发到期的task超时: task状态修改为TIMEOUT, 并终止其下未结束的子task和step
+    :param now:
+    :return: 触发的task数
+    """
+    from .base import SeaflowTask
+
+    now = now or timezone.now()
+    batch = conf.get('TIMEOUT_SWEEP_BATCH')
+    count = 0
+    while True:
+        ids = sweeper.claim(Task, now, batch)
+        for task in SeaflowTask.get_many(ids, profile='control'):
+            if task.ended():
+                continue
+            task._trigger_timeout()
+            count += 1
+        if len(ids) < batch:
+            return count
+
+
+def _fire_steps(step_ids, heartbeat=False):
+    """
+    触发step超时, 同一批的celery任务通过一次广播撤销
+    :return: 触发的step数
+    """
+    from . import celery_app
+    from .base import SeaflowStep
+
+    steps = [s for s in SeaflowStep.get_many(step_ids, profile='control') if not s.ended()]
+    identifiers = [s.model.identifier for s in steps
+                   if s.model.identifier and s.model.node.action_type in [ActionTypes.Default,
+                                                                           ActionTypes.Carrier]]
+    if identifiers:
+        celery_app.control.revoke(identifiers, terminate=True)
+    for s in steps:
+        s._trigger_timeout(revoke=False, heartbeat=heartbeat)
+    return len(steps)
+
+
+def sweep_steps(now=None):
+    """
+    触发到期的step超时
+    :param now:
+    :return: 触发的step数
+    """
+    now = now or timezone.now()
+    batch = conf.get('TIMEOUT_SWEEP_BATCH')
+    count = 0
+    while True:
+        ids = sweeper.claim(Step, now, batch)
+        count += _fire_steps(ids)
+        if len(ids) < batch:
+            return count
+
+
+def sweep_heartbeats(now=None):
+    """
+    触发心跳超时的step
+    :param now:
+    :return: 触发的step数
+    """
+    now = now or timezone.now()
+    batch = conf.get('TIMEOUT_SWEEP_BATCH')
+    count = 0
+    while True:
+        ids = sweeper.claim(Heartbeat, now, batch, field='expire_time')
+        count += _fire_steps(Heartbeat.objects.filter(pk__in=ids).values_list('step_id', flat=True),
+                             heartbeat=True)
+        if len(ids) < batch:
+            return count
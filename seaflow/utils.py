@@ -109,12 +109,30 @@ class ExternalActionFailed(ExternalActionException):
     外部action执行失败
     """
 
+class WorkerLostException(SeaflowException):
+    """
+    执行step的worker丢失
+    """
+
+
 class StateException(SeaflowException):
     """
     状态错误
     """
 
 
+class AdmissionException(SeaflowException):
+    """
+    排队的root task数达到上限, 拒绝准入
+    """
+
+
+class ContextConflictException(SeaflowException):
+    """
+    context并发写入冲突
+    """
+
+
 class ParamException(SeaflowException):
     """
     输入/输出参数错误
@@ -149,46 +167,6 @@ class ParamAdaptException(ParamException):
         super().__init__('failed to adapt fields: %s' % ', '.join(fields))
 
 
-class SeaflowContext(object):
-    """
-    """
-
-    def __init__(self, task_id=None, task=None):
-        from .models import Task
-        self.Task = Task
-        self.task = task or self.Task.objects.get(pk=task_id)
-        self.context = self.task.context
-
-    def set(self, c):
-        """
-        局部更新
-        :param c: dict
-        :return:
-        """
-
-        from django_mysql.models.functions import JSONSet
-        self.task.update(context=JSONSet('context', {'$.%s' % k: v for k, v in c.items()}), _refresh=False)
-        self.reload()
-
-    def get(self):
-        """
-        :return:
-        """
-        self.reload()
-        return self.context
-
-    def __setitem__(self, key, value):
-        self.set({key: value})
-
-    def __getitem__(self, item):
-        self.reload()
-        return self.context[item]
-
-    def reload(self):
-        self.task.refresh_from_db()
-        self.context = self.task.context
-
-
 def tracker_flush(instance, logs):
     instance.update(logs=('%s\n%s' % (instance.logs, logs)).strip())
 
@@ -282,11 +260,13 @@ class CallbackConfig(Config):
 
 
 class TaskConfig(Config):
-    _keys = ('countdown', 'max_retries', 'retry_countdown', 'timeout', 'callback')
+    _keys = ('countdown', 'max_retries', 'retry_countdown', 'retry_policy', 'timeout', 'log_payload',
+             'priority', 'weight', 'callback')
 
 
 class StepConfig(Config):
-    _keys = ('countdown', 'max_retries', 'retry_countdown', 'timeout', 'callback')
+    _keys = ('countdown', 'max_retries', 'retry_countdown', 'retry_policy', 'timeout', 'heartbeat_timeout',
+             'recovery', 'queue', 'log_payload', 'cache', 'limit', 'callback')
 
 
 def fission_inputs(inputs, fission_key):